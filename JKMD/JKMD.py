@@ -8,6 +8,10 @@ from os import system
 
 import os
 import psutil
+#shared JKQC helpers (RowBuilder)
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../JKQC/src")
+from row_builder import RowBuilder
 #os.system("if ! command -v module &> /dev/null; then source /com/bin/modules.sh; fi; module load intel; module load openmpi;")
 #os.system("if ! command -v module &> /dev/null; then source /com/bin/modules.sh; fi; module load gcc openmpi mkl")
 #os.environ['OMP_STACKSIZE'] = '4G'
@@ -41,16 +45,12 @@ print("""
 def savepickle():
   global cluster_dic
   if "cluster_dic" in globals() or "cluster_dic1" in globals() or "cluster_dic2" in globals():
-    from pandas import DataFrame
     if Qconstraints == 4 and len(species) == 2:
       global cluster_dic1,cluster_dic2
-      for key in cluster_dic1:
-        cluster_dic2[key] = cluster_dic2[key][::-1]
-      cluster_dic = mergeDictionary(cluster_dic1, cluster_dic2)
-    else: 
-      for key in cluster_dic:
-        cluster_dic[key] = cluster_dic[key][::-1]
-    clusters_df = DataFrame(cluster_dic) #, index = range(len(cluster_dic)))
+      cluster_dic = RowBuilder()
+      cluster_dic.extend(cluster_dic1)
+      cluster_dic.extend(cluster_dic2)
+    clusters_df = cluster_dic.finalize()
     global Qfolder
     try:
       clusters_df.to_pickle(Qfolder+"/../sim"+Qfolder.split("/")[-1]+".pkl")
@@ -251,29 +251,14 @@ while not Qfollow_activated == 0:
  
   #DUMPING
   from print_properties import print_properties, init
-  def mergeDictionary(dict_1, dict_2):
-    if len(dict_1) == 0:
-      return dict_2
-    dict_3 = {**dict_1, **dict_2}
-    for key, value in dict_3.items():
-      if key in dict_1 and key in dict_2:
-        dict_3[key] = value + dict_1[key]
-      elif key in dict_1:
-        dict_3[key] = [float("nan")] + value
-      else:
-        ml = max([len(x) for x in dict_1.values()])
-        dict_3[key] = value + ml*[float("nan")]
-    return dict_3
-    #dict1 = dist3
-
   init(current_time,current_step)
   #global cluster_dic
   if Qconstraints == 4 and len(species) == 2:
-    cluster_dic1 = {}
-    cluster_dic2 = {}
+    cluster_dic1 = RowBuilder()
+    cluster_dic2 = RowBuilder()
   else:
     if "cluster_dic" not in globals(): #current_step == 0:
-      cluster_dic = {}
+      cluster_dic = RowBuilder()
   def save(fail = False):
     global current_time,current_step
     if Qconstraints == 4 and len(species) == 2:
@@ -292,10 +277,10 @@ while not Qfollow_activated == 0:
         if Qconstraints == 3:
           toupdate.update({("log","k_bias"):[min(current_step/max(Qslow,0.0000001),1)*Qk_bias],("log","harm_distance"):[Qharm]})
       if Qconstraints == 4 and len(species) == 2:
-        cluster_dic1 = mergeDictionary(cluster_dic1, toupdate1)
-        cluster_dic2 = mergeDictionary(cluster_dic2, toupdate2)
+        cluster_dic1.append(toupdate1)
+        cluster_dic2.append(toupdate2)
       else:
-        cluster_dic = mergeDictionary(cluster_dic, toupdate)
+        cluster_dic.append(toupdate)
   if Qdump == 0:
     save()
   else:
@@ -406,10 +391,7 @@ while not Qfollow_activated == 0:
           Qsavepickle = 1
           save(fail = True)
           print(Qfolder)
-          from pandas import DataFrame
-          for key in cluster_dic:
-            cluster_dic[key] = cluster_dic[key][::-1]
-          clusters_df = DataFrame(cluster_dic)
+          clusters_df = cluster_dic.finalize()
           clusters_df.to_pickle(Qfolder+"/error.pkl")
         exit()
 
@@ -33,6 +33,16 @@ from timeit import default_timer as timer
 
 locals().update(arguments(argv[1:]))
 
+# REPRESENTATIONS (parallel + cache)
+from src.representations import configure_representations
+
+configure_representations(repr_cache, repr_cpu)
+
+# KRR TRAINING (tiled kernel, blocked Cholesky)
+from src.blocked_krr import configure_krr
+
+configure_krr(krr_block, krr_cpu, krr_dir, krr_eigvals)
+
 # LOADING DATABASES
 from src.load_databases import load_databases
 
@@ -180,6 +190,8 @@ for sampleeach_i in sampleeach_all:
                     Qsplit_i,
                     Qsplit_j,
                     hyper_cache,
+                    krr_approx=krr_approx,
+                    seed=seed,
                 )
             )
         #####################################
@@ -316,14 +328,41 @@ for sampleeach_i in sampleeach_all:
     # TODO collect splitting: /home/kubeckaj/ML_SA_B/ML/TRAIN/TEST/SEPARATE/cho_solve.pkl
     if Qtrain == 2:
         import os
+        from src.model_artifact import find_model, load_model
 
-        if not os.path.exists(VARS_PKL):
+        # versioned model artifact (<model>.jkml) or a legacy pickle
+        model_artifact = find_model(VARS_PKL) if Qmethod in ["krr", "knn"] else None
+        if model_artifact is None and not os.path.exists(VARS_PKL):
             print("JKML: Error reading trained model. VARS_PKL = " + VARS_PKL)
             exit()
-        if Qmethod == "krr":
+        if model_artifact is not None:
+            model = load_model(model_artifact)
+            if model.method != Qmethod:
+                print(
+                    f"JKML: The model {model_artifact} was trained with -{model.method}, not -{Qmethod} [EXITING]"
+                )
+                exit()
+            if model.params["Qrepresentation"] != Qrepresentation:
+                print(
+                    f"JKML: WARNING: the model uses the {model.params['Qrepresentation']} representation (not {Qrepresentation})."
+                )
+                Qrepresentation = model.params["Qrepresentation"]
+        if Qmethod == "krr" and model_artifact is not None:
+            X_train = model.get("X_train")
+            X_atoms_train = model.get("X_atoms_train")
+            sigmas = model.params["sigmas"]
+            alpha = [model["alpha"][i] for i in range(len(model["alpha"]))]
+            krr_approx_params = model.params["krr_approx_params"]
+            train_metadata = model.params["train_metadata"]
+            print("JKML: Trained model loaded from " + model_artifact, flush=True)
+            # store the training metadata to locals
+            locals().update(train_metadata)
+        elif Qmethod == "krr":
             f = open(VARS_PKL, "rb")
             import pickle
 
+            X_atoms = None
+
             if Qrepresentation == "fchl":
                 try:
                     X_train, sigmas, alpha, train_metadata = pickle.load(f)
@@ -355,6 +394,19 @@ for sampleeach_i in sampleeach_all:
             print("JKML: Trained model loaded.", flush=True)
             # store the training metadata to locals
             locals().update(train_metadata)
+            krr_approx_params = train_metadata.get("krr_approx_params")
+            X_atoms_train = X_atoms
+        elif Qmethod == "knn" and model_artifact is not None:
+            from src.QKNN import load_knn_model
+
+            X_train = model["X_train"]
+            Y_train = model["Y_train"]
+            X_atoms = model["X_atoms"]
+            knn = load_knn_model(model)
+            train_metadata = model.params["train_metadata"]
+            print("JKML: Trained model loaded from " + model_artifact, flush=True)
+            # store the training metadata to locals
+            locals().update(train_metadata)
         elif Qmethod == "knn":
             import pickle
             from sklearn.neighbors import KNeighborsRegressor
@@ -388,9 +440,9 @@ for sampleeach_i in sampleeach_all:
             if not no_metric and Qrepresentation != "fchl-kernel":
                 knn_params["metric"] = mlkr.get_metric()
             if Qrepresentation == "fchl-kernel":
-                from src.QKNN import load_vp_knn
+                from src.QKNN import load_fchl18_vp_knn
 
-                knn = load_vp_knn(X_train, Y_train, vp_params, **knn_params)
+                knn = load_fchl18_vp_knn(X_train, Y_train, vp_params, **knn_params)
             else:
                 knn = KNeighborsRegressor(**knn_params)
                 knn.fit(X_train, Y_train)
@@ -457,6 +509,9 @@ for sampleeach_i in sampleeach_all:
                     strs,
                     Qkernel,
                     hyper_cache,
+                    krr_approx_params=krr_approx_params,
+                    eval_chunk=eval_chunk,
+                    progress_dir=outfile.split(".pkl")[0] + "_chunks",
                 )
             )
             Qforces = 0
@@ -580,6 +635,11 @@ for sampleeach_i in sampleeach_all:
             d_train,
             d_test,
         )
+        if Qmethod == "krr":
+            # the output is written, the saved prediction chunks are not needed anymore
+            import shutil
+
+            shutil.rmtree(outfile.split(".pkl")[0] + "_chunks", ignore_errors=True)
 
     ####################################################################################################
     ####################################################################################################
@@ -32,23 +32,25 @@ warnings.filterwarnings(
 
 def calculate_representation(Qrepresentation, strs, **repr_kwargs):
     if Qrepresentation == "fchl":
-        return generate_global_fchl19(strs, **repr_kwargs)
+        generator = generate_global_fchl19
     elif Qrepresentation == "mbdf":
-        return generate_global_mbdf(strs, **repr_kwargs)
+        generator = generate_global_mbdf
     elif Qrepresentation == "bob":
-        return generate_bob(strs, **repr_kwargs)
+        generator = generate_bob
     elif Qrepresentation == "coulomb":
-        return generate_coulomb(strs, **repr_kwargs)
+        generator = generate_coulomb
     elif Qrepresentation == "mbtr":
-        return generate_global_mbtr(strs, **repr_kwargs)
+        generator = generate_global_mbtr
     elif Qrepresentation == "fchl-kernel":
-        return generate_fchl18(strs, **repr_kwargs)
+        generator = generate_fchl18
     elif Qrepresentation == "fchl19-kernel":
-        return generate_fchl19(strs, **repr_kwargs)
+        generator = generate_fchl19
     else:
         raise NotImplementedError(
             f"Representation '{Qrepresentation}' not supported with the k-NN model!"
         )
+    # parallel shards + on-disk cache (see src.representations)
+    return cached_representation(generator, strs, **repr_kwargs)
 
 
 class VPTreeKNN19:
@@ -478,11 +480,11 @@ def load_fchl18_vp_knn(X_train, Y_train, vp_params, **knn_params):
     N1 = np.zeros((nm1), dtype=np.int32)
 
     for a in range(nm1):
-        N1[a] = len(np.where(X[a, :, 1, 0] > 0.0001)[0])
+        N1[a] = len(np.where(X_train[a, :, 1, 0] > 0.0001)[0])
 
     neighbors1 = np.zeros((nm1, atoms_max), dtype=np.int32)
 
-    for a, representation in enumerate(X):
+    for a, representation in enumerate(X_train):
         ni = N1[a]
         for i, x in enumerate(representation[:ni]):
             neighbors1[a, i] = len(np.where(x[0] < knn.cut_distance)[0])
@@ -495,10 +497,10 @@ def load_fchl18_vp_knn(X_train, Y_train, vp_params, **knn_params):
     fchl18_vp_tree.load(
         X_train,
         Y_train,
-        vp_params["index"],
-        vp_params["left"],
-        vp_params["right"],
-        vp_params["threshold"],
+        vp_params["vp_index"],
+        vp_params["vp_left"],
+        vp_params["vp_right"],
+        vp_params["vp_threshold"],
         knn.verbose,
         N1,
         neighbors1,
@@ -524,11 +526,11 @@ def load_fchl18_vp_knn(X_train, Y_train, vp_params, **knn_params):
 def load_fchl19_vp_knn(X_train, X_atoms, Y_train, vp_params, **knn_params):
     knn = VPTreeKNN19(**knn_params)
     na = np.array([len(x) for x in X_atoms])
-    Q_tr = np.zeros((max(na), X.shape[0]), dtype=np.int32)
+    Q_tr = np.zeros((max(na), X_train.shape[0]), dtype=np.int32)
     for i, q in enumerate(X_atoms):
         Q_tr[: len(q), i] = q
 
-    nm1 = X.shape[0]
+    nm1 = X_train.shape[0]
 
     atoms_max = X_train.shape[1]
 
@@ -540,10 +542,10 @@ def load_fchl19_vp_knn(X_train, X_atoms, Y_train, vp_params, **knn_params):
         x_in=X_train,
         q_in=Q_tr,
         y_in=Y_train,
-        vp_index_in=vp_params["index"],
-        vp_left_in=vp_params["left"],
-        vp_right_in=vp_params["right"],
-        vp_threshold_in=vp_params["threshold"],
+        vp_index_in=vp_params["vp_index"],
+        vp_left_in=vp_params["vp_left"],
+        vp_right_in=vp_params["vp_right"],
+        vp_threshold_in=vp_params["vp_threshold"],
         verbose_in=knn.verbose,
         n1=na,
         nm1=nm1,
@@ -552,6 +554,85 @@ def load_fchl19_vp_knn(X_train, X_atoms, Y_train, vp_params, **knn_params):
     return knn
 
 
+class ProjectedKNN:
+    """k-NN regressor with the MLKR metric as an Euclidean neighbour index of the
+    projected representations (|L(x - y)| is the MLKR distance), so that the fitted
+    index can be stored and loaded instead of being rebuilt."""
+
+    def __init__(self, components: np.ndarray, knn: KNeighborsRegressor):
+        self.components = components
+        self.knn = knn
+
+    def predict(self, X: np.ndarray):
+        return self.knn.predict(np.asarray(X) @ self.components.T)
+
+
+def save_knn_model(
+    varsoutfile: Union[str, os.PathLike],
+    Qrepresentation: str,
+    X_train: np.ndarray,
+    Y_train: np.ndarray,
+    X_atoms: List[np.ndarray],
+    knn,
+    knn_params: Dict[str, Any],
+    hyperparams: Dict[str, Any],
+    train_metadata: Dict[str, Any],
+    mlkr: Optional[MLKR] = None,
+):
+    """Write the model artifact <varsoutfile>.jkml (see src.model_artifact) with the
+    prebuilt neighbour index (sklearn tree or VP-tree arrays)."""
+    from src.model_artifact import save_model, artifact_name
+
+    arrays = {"X_train": X_train, "Y_train": np.asarray(Y_train)}
+    objects = {}
+    if "-kernel" in Qrepresentation:
+        arrays.update(
+            {key: np.array(value) for key, value in knn.get_tree_params().items()}
+        )
+        objects["knn_params"] = knn_params
+    elif mlkr is not None:
+        components = np.asarray(mlkr.components_)
+        projected = KNeighborsRegressor(
+            n_jobs=-1, algorithm="ball_tree", **hyperparams["knn"]
+        )
+        projected.fit(np.asarray(X_train) @ components.T, Y_train)
+        objects["knn"] = ProjectedKNN(components, projected)
+    else:
+        objects["knn"] = knn
+    save_model(
+        artifact_name(varsoutfile),
+        "knn",
+        {
+            "Qrepresentation": Qrepresentation,
+            "representation": hyperparams["representation"],
+            "train_metadata": train_metadata,
+        },
+        arrays,
+        ragged={"X_atoms": X_atoms},
+        objects=objects,
+        # (the FCHL18 padding does not fit into float32)
+        float32=() if Qrepresentation == "fchl-kernel" else ("X_train",),
+    )
+
+
+def load_knn_model(model) -> Any:
+    """Fitted k-NN regressor of a loaded model artifact."""
+    if "knn" in model:
+        return model["knn"]
+    Qrepresentation = model.params["Qrepresentation"]
+    vp_params = {
+        key: np.asarray(model[key])
+        for key in ["vp_index", "vp_left", "vp_right", "vp_threshold"]
+    }
+    X_train = np.asarray(model["X_train"], dtype=np.float64)
+    Y_train = np.asarray(model["Y_train"])
+    if Qrepresentation == "fchl-kernel":
+        return load_fchl18_vp_knn(X_train, Y_train, vp_params, **model["knn_params"])
+    return load_fchl19_vp_knn(
+        X_train, model["X_atoms"], Y_train, vp_params, **model["knn_params"]
+    )
+
+
 def load_hyperparams(hyper_cache: Optional[Union[str, os.PathLike]]):
     """Load hyperparameters from hyper_cache or use defaults."""
     if hyper_cache is not None:
@@ -673,38 +754,25 @@ def training(
     }
     print("JKML(Q-kNN): Training completed.", flush=True)
     knn_params = knn.get_params()
-    if not no_metric:
-        knn_params["metric"] = "MLKR_placeholder"
-    with open(varsoutfile, "wb") as f:
-        print(f"JKML(Q-kNN): Saving training data to {varsoutfile}")
-        if no_metric:
-            pickle.dump([X_train, Y_train, X_atoms, knn_params, train_metadata], f)
-        elif "-kernel" in Qrepresentation:
-            vp_params = knn.get_tree_params()
-            pickle.dump(
-                [
-                    X_train,
-                    Y_train,
-                    X_atoms,
-                    knn_params,
-                    vp_params,
-                    train_metadata,
-                ],
-                f,
-            )
-        else:
-            pickle.dump(
-                [
-                    X_train,
-                    Y_train,
-                    X_atoms,
-                    A,
-                    mlkr,
-                    knn_params,
-                    train_metadata,
-                ],
-                f,
-            )
+    if Qrepresentation == "fchl-kernel":
+        knn_params["kernel_args"] = {"sigma": [1.0]}
+    elif Qrepresentation == "fchl19-kernel":
+        knn_params["sigma"] = sigmas[0]
+    save_knn_model(
+        varsoutfile,
+        Qrepresentation,
+        X_train,
+        Y_train,
+        X_atoms,
+        knn,
+        knn_params,
+        hyperparams,
+        train_metadata,
+        mlkr=None if no_metric or "-kernel" in Qrepresentation else mlkr,
+    )
+    # the pretrain vars are not needed anymore
+    if os.path.exists(varsoutfile):
+        os.remove(varsoutfile)
     return {
         key: value
         for key, value in locals().items()
@@ -29,6 +29,47 @@ def load_hyperparams(
     return hyperparams
 
 
+def save_krr_model(
+    varsoutfile,
+    Qrepresentation,
+    Qkernel,
+    sigmas,
+    X_train,
+    X_atoms_train,
+    alpha,
+    hyperparams,
+    train_metadata,
+):
+    """Write the model artifact <varsoutfile>.jkml (see src.model_artifact), without
+    the training structures. FCHL18 is kept in double precision (its padding does not
+    fit into float32)."""
+    import numpy as np
+    from src.model_artifact import save_model, artifact_name
+
+    metadata = dict(train_metadata)
+    krr_approx_params = metadata.pop("krr_approx_params", None)
+    arrays = {"alpha": np.stack([np.asarray(a, dtype=np.float64) for a in alpha])}
+    ragged = {}
+    if X_train is not None:
+        arrays["X_train"] = X_train
+        ragged["X_atoms_train"] = X_atoms_train
+    save_model(
+        artifact_name(varsoutfile),
+        "krr",
+        {
+            "Qrepresentation": Qrepresentation,
+            "Qkernel": Qkernel,
+            "sigmas": list(sigmas),
+            "representation": hyperparams["representation"],
+            "krr_approx_params": krr_approx_params,
+            "train_metadata": metadata,
+        },
+        arrays,
+        ragged=ragged,
+        float32=() if Qrepresentation in ["fchl", "fchl18"] else ("X_train",),
+    )
+
+
 def training(
     Qrepresentation,
     Qkernel,
@@ -42,6 +83,8 @@ def training(
     Qsplit_i,
     Qsplit_j,
     hyper_cache: Optional[Union[str, os.PathLike]] = None,
+    krr_approx: Optional[str] = None,
+    seed: int = 42,
 ):
 
     ### IMPORTS ###
@@ -57,7 +100,6 @@ def training(
     else:
         print("JKML(QML): Unknown representation: " + Qrepresentation)
         exit()
-    from qmllib.solvers import cho_solve
 
     if Qkernel == "Gaussian":
         if Qrepresentation == "fchl" or Qrepresentation == "fchl18":
@@ -87,6 +129,7 @@ def training(
     import time
 
     hyperparams = load_hyperparams(hyper_cache, krr_cutoff)
+    krr_approx_params = None
     ### REPRESENTATION CALCULATION ###
     repr_wall_start = time.perf_counter()
     repr_cpu_start = time.process_time()
@@ -95,7 +138,11 @@ def training(
         # by getting the values, we can treat the structures as a list and no worry about
         # pandas indexing
         strs = strs.values
-    X_train = generate_representation(strs, **hyperparams["representation"])
+    from src.representations import cached_representation
+
+    X_train = cached_representation(
+        generate_representation, strs, **hyperparams["representation"]
+    )
     repr_train_wall = time.perf_counter() - repr_wall_start
     repr_train_cpu = time.process_time() - repr_cpu_start
     n_train = X_train.shape[0]
@@ -110,43 +157,9 @@ def training(
     train_cpu_start = time.process_time()
     # ONLY FOR JOINING ALL THE SPLITS AND CHOLESKY DECOMPOSITION
     if Qsplit == -1:
-        splits = Qsplit_i + 1
-        K = []
-        for i in range(0, splits):
-            Kx = []
-            for j in range(0, splits):
-                if i < j:
-                    s1 = j
-                    s2 = i
-                else:
-                    s1 = i
-                    s2 = j
-                f = open(
-                    varsoutfile.split(".pkl")[0]
-                    + "_"
-                    + str(splits)
-                    + "_"
-                    + str(s1)
-                    + "_"
-                    + str(s2)
-                    + ".pkl",
-                    "rb",
-                )
-                Kcell, Y_train = pickle.load(f)
-                if i > j:
-                    Kcell = np.transpose(Kcell[0])
-                else:
-                    Kcell = Kcell[0]
-                if len(Kx) == 0:
-                    Kx = Kcell
-                else:
-                    Kx = np.concatenate((Kx, Kcell))
-                f.close()
-            if len(K) == 0:
-                K = Kx
-            else:
-                K = np.concatenate((K, Kx), axis=1)
-        alpha = [cho_solve(K, Y_train)]
+        from src.blocked_krr import split_krr
+
+        alpha = split_krr(varsoutfile, Qsplit_i + 1, n_train)
         train_wall = time.perf_counter() - train_wall_start
         train_cpu = time.perf_counter() - train_cpu_start
         train_metadata = {
@@ -157,42 +170,48 @@ def training(
             "n_train": n_train,
             "d_train": d_train,
         }
-        f = open(varsoutfile, "wb")
-        pickle.dump([X_train, X_atoms_train, strs, sigmas, alpha, train_metadata], f)
-        f.close()
+        save_krr_model(
+            varsoutfile,
+            Qrepresentation,
+            Qkernel,
+            sigmas,
+            X_train,
+            X_atoms_train,
+            alpha,
+            hyperparams,
+            train_metadata,
+        )
         print("JKML(QML): Training completed.", flush=True)
     elif Qsplit == 1:
-        if (Qrepresentation == "fchl") or (Qrepresentation == "fchl18"):
-            K = JKML_sym_kernel(
-                X_train, kernel_args={"sigma": sigmas}
-            )  # calculates kernel
+        from src.approx_krr import parse_krr_approx
+
+        if krr_approx is None:
+            krr_approx = hyperparams.get("krr_approx")
+        krr_approx = parse_krr_approx(krr_approx)
+        if krr_approx is not None:
+            from src.approx_krr import approx_training
+
+            # Nystrom (landmarks) or random Fourier features, linear in n_train
+            X_train, X_atoms_train, strs, alpha, krr_approx_params = approx_training(
+                X_train,
+                X_atoms_train,
+                strs,
+                Y_train,
+                Qrepresentation,
+                Qkernel,
+                sigmas,
+                lambdas,
+                krr_approx,
+                seed,
+            )
         else:
-            K = [
-                JKML_sym_kernel(X_train, X_atoms_train, sigmas[0])
-            ]  # calculates kernel
-        K = [
-            K[i] + lambdas[i] * np.eye(len(K[i])) for i in range(len(sigmas))
-        ]  # corrects kernel
-        # print(Y_train)
-        # from scipy.linalg import cho_factor, cho_solve
-        # K[0] = (K[0] + K[0].T) / 2
-        # c, lower = cho_factor(K[0]) #, check_finite=True)
-        # alpha = [cho_solve((c,lower), Y_train)]
-        # alpha = np.linalg.pinv(K).dot(Y_train)
-        # TODO
-        alpha = [
-            cho_solve(Ki, Y_train) for Ki in K
-        ]  # calculates regression coeffitients
-        # alpha = [[-6.25259, -3.92158, -15.644, 1.91016, 0.0340678, 5.21936, 3.06516, 7.21155, 6.6132, 5.07749]]
-        # print("alpha=",alpha[0],flush=True)
-        Y_pred = K[0] @ alpha[0]
-        mae = np.mean(np.abs(Y_pred - Y_train))
-        eigvals = np.linalg.eigvalsh(K)
-        # print("Min eigenvalue:", eigvals[0])
-        # print("Condition number:", np.max(eigvals) / np.min(eigvals))
-        # print("Y_train=",Y_train,flush=True)
-        # print("Y_pred=",Y_pred,flush=True)
-        # print("JKML(QML): MAE = " + str(mae), flush=True)
+            from src.blocked_krr import tiled_krr
+
+            # kernel tiles (in parallel, memory-mapped with -krr_dir), blocked Cholesky
+            alpha = tiled_krr(
+                X_train, X_atoms_train, Y_train, Qrepresentation, Qkernel, sigmas, lambdas
+            )  # calculates regression coeffitients
+            krr_approx_params = None
         train_wall = time.perf_counter() - train_wall_start
         train_cpu = time.process_time() - train_cpu_start
 
@@ -203,18 +222,20 @@ def training(
             "train_cpu": train_cpu,
             "n_train": n_train,
             "d_train": d_train,
+            "krr_approx_params": krr_approx_params,
         }
         # I will for now everytime save the trained QML
-        f = open(varsoutfile, "wb")
-        if Qrepresentation == "fchl":
-            pickle.dump(
-                [X_train, X_atoms_train, strs, sigmas, alpha, train_metadata], f
-            )
-        elif Qrepresentation == "mbdf":
-            pickle.dump(
-                [X_train, X_atoms_train, strs, sigmas, alpha, train_metadata], f
-            )
-        f.close()
+        save_krr_model(
+            varsoutfile,
+            Qrepresentation,
+            Qkernel,
+            sigmas,
+            X_train,
+            X_atoms_train,
+            alpha,
+            hyperparams,
+            train_metadata,
+        )
         print("JKML(QML): Training completed.", flush=True)
     else:
         X_train_i = np.array_split(X_train, Qsplit)[Qsplit_i]
@@ -268,6 +289,7 @@ def training(
             "train_cpu",
             "n_train",
             "d_train",
+            "krr_approx_params",
         ]
     }
 
@@ -277,6 +299,100 @@ def training(
 ###############################################################################
 
 
+_predictor = {}
+
+
+def _init_predictor(model: dict, worker: bool = True):
+    """Pool initializer: the trained model (X_train memory-mapped from its .npy file)."""
+    import numpy as np
+
+    _predictor.clear()
+    _predictor.update(model)
+    if isinstance(model["X_train"], str):
+        _predictor["X_train"] = np.load(model["X_train"], mmap_mode="r")
+    if worker:
+        # no nested process pools inside the workers
+        from src.representations import representation_settings
+        from src.blocked_krr import krr_settings
+
+        representation_settings["n_jobs"] = 1
+        krr_settings["n_jobs"] = 1
+
+
+def _predict_chunk(task):
+    """Representation, kernel and predictions of one chunk of test structures."""
+    import time
+    import numpy as np
+    from src.representations import cached_representation, correct_fchl18_kernel_size
+    from src.blocked_krr import kernel_functions
+
+    k, strs = task
+    model = _predictor
+    repr_wall_start = time.perf_counter()
+    repr_cpu_start = time.process_time()
+    X_atoms = [struct.get_atomic_numbers() for struct in strs]
+    X_test = cached_representation(model["generator"], strs, **model["representation"])
+    repr_wall = time.perf_counter() - repr_wall_start
+    repr_cpu = time.process_time() - repr_cpu_start
+    test_wall_start = time.perf_counter()
+    test_cpu_start = time.process_time()
+    krr_approx_params = model["krr_approx_params"]
+    alpha = model["alpha"]
+    if krr_approx_params is not None and krr_approx_params["method"] == "rff":
+        from src.approx_krr import rff_predict
+
+        Y_predicted = np.stack([rff_predict(X_test, X_atoms, krr_approx_params, alpha[0])])
+    else:
+        JKML_kernel = kernel_functions(model["Qrepresentation"], model["Qkernel"])[1]
+        X_train = model["X_train"]
+        if model["Qrepresentation"] == "fchl" or model["Qrepresentation"] == "fchl18":
+            if X_train.shape[1] != X_test.shape[1]:
+                X_test, X_train = correct_fchl18_kernel_size(X_test, np.asarray(X_train))
+            Ks = JKML_kernel(X_test, X_train, kernel_args={"sigma": model["sigmas"]})
+        else:
+            Ks = [
+                JKML_kernel(
+                    X_train,
+                    X_test,
+                    model["X_atoms_train"],
+                    X_atoms,
+                    model["sigmas"][0],
+                )
+            ]
+        Y_predicted = np.stack([np.dot(Ks[i], alpha[i]) for i in range(len(Ks))])
+    times = [
+        repr_wall,
+        repr_cpu,
+        time.perf_counter() - test_wall_start,
+        time.process_time() - test_cpu_start,
+    ]
+    return k, Y_predicted, times, int(np.sum(X_test.shape[1:]))
+
+
+def prediction_fingerprint(model: dict, strs) -> str:
+    """Hash of the model and of the test structures (chunks of another run are not reused)."""
+    from hashlib import blake2b
+    import numpy as np
+    from src.representations import structure_hash
+
+    h = blake2b(digest_size=16)
+    h.update(
+        repr(
+            (
+                model["Qrepresentation"],
+                model["Qkernel"],
+                list(model["sigmas"]),
+                sorted(model["representation"].items()),
+            )
+        ).encode()
+    )
+    for a in model["alpha"]:
+        h.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+    for struct in strs:
+        h.update(structure_hash(struct).encode())
+    return h.hexdigest()
+
+
 def evaluate(
     Qrepresentation,
     krr_cutoff,
@@ -287,10 +403,16 @@ def evaluate(
     strs,
     Qkernel,
     hyper_cache: Optional[Union[str, os.PathLike]] = None,
+    krr_approx_params: Optional[dict] = None,
+    eval_chunk: int = 0,
+    progress_dir: Optional[Union[str, os.PathLike]] = None,
 ):
+    """Predictions for the test structures, chunk by chunk (eval_chunk structures, 0 = all
+    at once). The chunks are computed by -krr_cpu processes and, with a progress_dir,
+    every finished chunk is saved there, so an interrupted evaluation is resumed."""
 
-    from pandas import DataFrame
-    import time
+    import json
+    import numpy as np
 
     if (Qrepresentation == "fchl") or (Qrepresentation == "fchl18"):
         from src.representations import generate_fchl18 as generate_representation
@@ -302,65 +424,141 @@ def evaluate(
     else:
         print("JKML(QML): Unknown representation: " + Qrepresentation)
         exit()
-    from qmllib.solvers import cho_solve
-
-    if Qkernel == "Gaussian":
-        if Qrepresentation == "fchl" or Qrepresentation == "fchl18":
-            from qmllib.representations.fchl import get_local_kernels as JKML_kernel
-        else:
-            from qmllib.kernels import get_local_kernel as JKML_kernel
-    else:
-        if Qrepresentation == "fchl" or Qrepresentation == "fchl18":
-            from qmllib.representations.fchl import laplacian_kernel as JKML_kernel
-        else:
-            raise ValueError(
-                f"Laplace kernel is only supported with the FCHL'18 representation"
-            )
-    import numpy as np
+    if Qkernel != "Gaussian" and not (
+        Qrepresentation == "fchl" or Qrepresentation == "fchl18"
+    ):
+        raise ValueError(
+            f"Laplace kernel is only supported with the FCHL'18 representation"
+        )
+    from src.blocked_krr import krr_settings
+    from src.approx_krr import chunk_bounds
 
     hyperparams = load_hyperparams(hyper_cache, krr_cutoff)
-    repr_wall_start = time.perf_counter()
-    repr_cpu_start = time.process_time()
-    ### REPRESENTATION CALCULATION ###
-    X_atoms = [strs.iloc[i].get_atomic_numbers() for i in range(len(strs))]
-    if not (Qrepresentation == "fchl" or Qrepresentation == "fchl18"):
-        # by getting the values, we can treat the structures as a list and no worry about
-        # pandas indexing
-        strs = strs.values
-    # TODO: allow passing more args
-    X_test = generate_representation(strs, **hyperparams["representation"])
-    repr_test_wall = time.perf_counter() - repr_wall_start
-    repr_test_cpu = time.process_time() - repr_cpu_start
-    # some info about the full representation
-    print(
-        "JKML(QML): Shape of the testing representation: " + str(X_test.shape),
-        flush=True,
-    )
+    strs = list(strs.values) if hasattr(strs, "values") else list(strs)
+
+    # the same padding for all chunks (and the training set for FCHL18)
+    representation = dict(hyperparams["representation"])
+    if representation.get("max_atoms") is None:
+        representation["max_atoms"] = max([len(struct) for struct in strs], default=1)
+        if (Qrepresentation == "fchl" or Qrepresentation == "fchl18") and X_train is not None:
+            representation["max_atoms"] = max(representation["max_atoms"], X_train.shape[1])
+    if (Qrepresentation == "fchl" or Qrepresentation == "fchl18") and X_train is not None:
+        if X_train.shape[1] < representation["max_atoms"]:
+            size = representation["max_atoms"]
+            X_train = correct_fchl18_kernel_size(np.zeros((0, size, 5, size)), X_train)[1]
+
+    if X_train is not None and X_train.dtype != np.float64:
+        # (single precision model artifact)
+        X_train = np.asarray(X_train, dtype=np.float64)
+
+    model = {
+        "Qrepresentation": Qrepresentation,
+        "Qkernel": Qkernel,
+        "sigmas": sigmas,
+        "alpha": alpha,
+        "X_train": X_train,
+        "X_atoms_train": X_atoms_train,
+        "generator": generate_representation,
+        "representation": representation,
+        "krr_approx_params": krr_approx_params,
+    }
+    bounds = chunk_bounds(len(strs), eval_chunk if eval_chunk > 0 else max(1, len(strs)))
+    if len(bounds) <= 1:
+        progress_dir = None
+
+    ### FINISHED CHUNKS OF AN INTERRUPTED RUN
+    Y_chunks = {}
+    state = {}
+    if progress_dir is not None:
+        import shutil
+
+        state = {
+            "version": 1,
+            "fingerprint": prediction_fingerprint(model, strs),
+            "n_test": len(strs),
+            "chunk": bounds[0][1] - bounds[0][0],
+        }
+        state_file = os.path.join(progress_dir, "state.json")
+        if os.path.exists(state_file):
+            with open(state_file, "r") as f:
+                previous = json.load(f)
+            if all(previous.get(key) == value for key, value in state.items()):
+                state = previous
+                for k in range(len(bounds)):
+                    chunk_file = os.path.join(progress_dir, f"chunk_{k}.npy")
+                    if os.path.exists(chunk_file):
+                        Y_chunks[k] = np.load(chunk_file)
+                print(
+                    f"JKML(QML): Resuming the evaluation, {len(Y_chunks)} of {len(bounds)} chunks done.",
+                    flush=True,
+                )
+            else:
+                print(
+                    f"JKML(QML): {progress_dir} belongs to another evaluation, starting again.",
+                    flush=True,
+                )
+                shutil.rmtree(progress_dir, ignore_errors=True)
+        os.makedirs(progress_dir, exist_ok=True)
+        with open(state_file, "w") as f:
+            json.dump(state, f)
+
+    def store(k, Y_predicted):
+        Y_chunks[k] = Y_predicted
+        if progress_dir is not None:
+            chunk_file = os.path.join(progress_dir, f"chunk_{k}")
+            np.save(chunk_file + ".tmp.npy", Y_predicted)
+            os.replace(chunk_file + ".tmp.npy", chunk_file + ".npy")
 
-    ### CORRECTING THE FCHL MATRIX SIZES
-    # IF YOU ARE EXTENDING THIS WILL MAKE THE MATRIXES OF THE SAME SIZE
-    if Qrepresentation == "fchl" or Qrepresentation == "fchl18":
-        X_test, X_train = correct_fchl18_kernel_size(X_test, X_train)
-    test_wall_start = time.perf_counter()
-    test_cpu_start = time.process_time()
     ### THE EVALUATION
-    if Qrepresentation == "fchl" or Qrepresentation == "fchl18":
-        Ks = JKML_kernel(X_test, X_train, kernel_args={"sigma": sigmas})
+    tasks = [(k, strs[a:e]) for k, (a, e) in enumerate(bounds) if k not in Y_chunks]
+    n_jobs = krr_settings["n_jobs"]
+    times = np.zeros(4)
+    d_test = state.get("d_test")
+    if len(tasks) > 0:
+        print(
+            f"JKML(QML): Evaluating {len(strs)} structures in {len(bounds)} chunks ({n_jobs} processes).",
+            flush=True,
+        )
+    if n_jobs > 1 and len(tasks) > 1:
+        import tempfile
+        import shutil
+        from multiprocessing import Pool
+
+        # the workers share the training representation through a memory-mapped file
+        folder = tempfile.mkdtemp(prefix="jkml_eval_", dir=progress_dir)
+        try:
+            if X_train is not None:
+                np.save(os.path.join(folder, "X_train.npy"), X_train)
+                model["X_train"] = os.path.join(folder, "X_train.npy")
+            with Pool(
+                min(n_jobs, len(tasks)), initializer=_init_predictor, initargs=(model,)
+            ) as pool:
+                for k, Y_predicted, chunk_times, d_test in pool.imap_unordered(
+                    _predict_chunk, tasks
+                ):
+                    store(k, Y_predicted)
+                    times += chunk_times
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
     else:
-        Ks = [
-            JKML_kernel(
-                X_train,
-                X_test,
-                X_atoms_train,
-                X_atoms,
-                sigmas[0],
-            )
-        ]
-    Y_predicted = [np.dot(Ks[i], alpha[i]) for i in range(len(sigmas))]
-
-    test_wall = time.perf_counter() - test_wall_start
-    test_cpu = time.process_time() - test_cpu_start
-    d_test = np.sum(X_test.shape[1:])
+        _init_predictor(model, worker=False)
+        try:
+            for task in tasks:
+                k, Y_predicted, chunk_times, d_test = _predict_chunk(task)
+                store(k, Y_predicted)
+                times += chunk_times
+        finally:
+            _predictor.clear()
+    if progress_dir is not None and d_test is not None:
+        state["d_test"] = d_test
+        with open(os.path.join(progress_dir, "state.json"), "w") as f:
+            json.dump(state, f)
+
+    if len(bounds) == 0:
+        return [np.zeros(0) for a in alpha], 0.0, 0.0, 0.0, 0.0, d_test
+    Y_predicted = np.concatenate([Y_chunks[k] for k in range(len(bounds))], axis=1)
+    Y_predicted = [Y_predicted[i] for i in range(len(Y_predicted))]
+    repr_test_wall, repr_test_cpu, test_wall, test_cpu = times
     return Y_predicted, repr_test_wall, repr_test_cpu, test_wall, test_cpu, d_test
 
 
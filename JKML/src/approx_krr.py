@@ -0,0 +1,306 @@
+"""
+Approximate kernel ridge regression (-krr_approx) with training and prediction
+linear in the number of structures:
+    nystrom:M[:random|kmeans|fps]  subset of regressors on M landmark structures
+    rff:D                          random Fourier features of the local Gaussian
+                                   (FCHL19/MBDF) kernel, D features per element
+The kernel rows (or features) are computed chunk by chunk (in parallel with
+-krr_cpu) and only the M x M (or F x F) normal equations are kept in memory.
+"""
+
+from typing import Optional, Sequence
+import numpy as np
+
+from src.blocked_krr import krr_settings, kernel_functions
+
+LANDMARK_SELECTIONS = ["random", "kmeans", "fps"]
+
+
+def parse_krr_approx(krr_approx: Optional[str]) -> Optional[dict]:
+    """'nystrom:2000:kmeans' -> {'method': 'nystrom', 'size': 2000, 'selection': 'kmeans'}"""
+    if krr_approx is None or krr_approx == "exact":
+        return None
+    if isinstance(krr_approx, dict):
+        return krr_approx
+    parts = str(krr_approx).split(":")
+    method = parts[0].lower()
+    if method not in ["nystrom", "rff"] or len(parts) < 2:
+        raise ValueError(
+            f"Unknown KRR approximation {krr_approx} (use nystrom:M[:random|kmeans|fps] or rff:D)"
+        )
+    approx = {"method": method, "size": int(parts[1])}
+    if method == "nystrom":
+        approx["selection"] = parts[2].lower() if len(parts) > 2 else "random"
+        if approx["selection"] not in LANDMARK_SELECTIONS:
+            raise ValueError(
+                f"Unknown landmark selection {approx['selection']} (use {', '.join(LANDMARK_SELECTIONS)})"
+            )
+    return approx
+
+
+def chunk_bounds(n: int, chunk: int):
+    return [(a, min(a + chunk, n)) for a in range(0, n, chunk)]
+
+
+def _map_chunks(function, tasks):
+    """function over tasks in order, in a pool of -krr_cpu processes (results are streamed)."""
+    n_jobs = krr_settings["n_jobs"]
+    if n_jobs > 1 and len(tasks) > 1:
+        from multiprocessing import Pool
+
+        with Pool(min(n_jobs, len(tasks))) as pool:
+            for result in pool.imap(function, tasks):
+                yield result
+    else:
+        for task in tasks:
+            yield function(task)
+
+
+###############################################################################
+# Nystrom
+###############################################################################
+
+
+def structure_descriptors(X: np.ndarray, Q: Sequence) -> np.ndarray:
+    """One standardized vector per structure (sum of its atomic environments) used
+    to spread the landmarks over the training set."""
+    G = np.zeros((len(X), int(np.prod(X.shape[2:]))))
+    for i in range(len(X)):
+        rows = np.asarray(X[i, : len(Q[i])]).reshape(len(Q[i]), -1)
+        # padding of FCHL18 neighbour lists
+        G[i] = np.where(np.abs(rows) < 1e10, rows, 0.0).sum(axis=0)
+    std = G.std(axis=0)
+    return (G - G.mean(axis=0)) / np.where(std > 0, std, 1.0)
+
+
+def select_landmarks(
+    X: np.ndarray, Q: Sequence, size: int, selection: str = "random", seed: int = 42
+) -> np.ndarray:
+    """Indices of the landmark structures (sorted)."""
+    rng = np.random.default_rng(seed)
+    n = len(X)
+    if size >= n:
+        return np.arange(n)
+    if selection == "random":
+        return np.sort(rng.choice(n, size, replace=False))
+    G = structure_descriptors(X, Q)
+    if selection == "fps":
+        # farthest point sampling: O(n) per landmark
+        chosen = [int(rng.integers(n))]
+        distance = ((G - G[chosen[0]]) ** 2).sum(axis=1)
+        for _ in range(size - 1):
+            chosen.append(int(np.argmax(distance)))
+            distance = np.minimum(distance, ((G - G[chosen[-1]]) ** 2).sum(axis=1))
+        return np.sort(np.unique(chosen))
+    # k-means: the structure closest to each centroid
+    from scipy.cluster.vq import kmeans2
+    from scipy.spatial import cKDTree
+
+    centroids, _ = kmeans2(G, size, minit="++", seed=seed)
+    tree = cKDTree(G)
+    chosen = set()
+    for centroid in centroids:
+        for k in tree.query(centroid, k=min(n, 8))[1]:
+            if int(k) not in chosen:
+                chosen.add(int(k))
+                break
+    return np.sort(np.array(list(chosen)))
+
+
+def cross_kernel(task) -> np.ndarray:
+    """Kernels between the structures Xa and Xb, shape (nsigmas, len(Xa), len(Xb))."""
+    Qrepresentation, Qkernel, sigmas, Xa, Qa, Xb, Qb = task
+    JKML_sym_kernel, JKML_kernel, local = kernel_functions(Qrepresentation, Qkernel)
+    if local:
+        # (the local kernel of X1, X2 has the shape (len(X2), len(X1)))
+        return JKML_kernel(Xb, Xa, Qb, Qa, sigmas[0])[None]
+    return np.asarray(JKML_kernel(Xa, Xb, kernel_args={"sigma": sigmas}))
+
+
+def nystrom_training(
+    X_train: np.ndarray,
+    X_atoms_train: Sequence,
+    Y_train,
+    Qrepresentation: str,
+    Qkernel: str,
+    sigmas: Sequence[float],
+    lambdas: Sequence[float],
+    size: int,
+    selection: str = "random",
+    seed: int = 42,
+    chunk: int = 2048,
+):
+    """Subset of regressors: alpha = (K_nm^T K_nm + lambda K_mm)^-1 K_nm^T y.
+    Returns the landmark indices and alpha (one per sigma). The model is an ordinary
+    KRR model on the landmarks, so QML.evaluate predicts with it unchanged."""
+    from scipy.linalg import solve
+
+    landmarks = select_landmarks(X_train, X_atoms_train, size, selection, seed)
+    X_m = np.asarray(X_train[landmarks])
+    Q_m = [X_atoms_train[i] for i in landmarks]
+    print(
+        f"JKML(QML): Nystrom approximation on {len(landmarks)} landmarks ({selection}).",
+        flush=True,
+    )
+    K_mm = cross_kernel((Qrepresentation, Qkernel, sigmas, X_m, Q_m, X_m, Q_m))
+    Y_train = np.asarray(Y_train, dtype=np.float64)
+    A = np.zeros((len(K_mm), len(landmarks), len(landmarks)))
+    b = np.zeros((len(K_mm), len(landmarks)) + Y_train.shape[1:])
+    bounds = chunk_bounds(len(X_train), chunk)
+    tasks = [
+        (
+            Qrepresentation,
+            Qkernel,
+            sigmas,
+            np.asarray(X_train[a:e]),
+            X_atoms_train[a:e],
+            X_m,
+            Q_m,
+        )
+        for a, e in bounds
+    ]
+    for (a, e), K_nm in zip(bounds, _map_chunks(cross_kernel, tasks)):
+        for s in range(len(K_nm)):
+            A[s] += K_nm[s].T @ K_nm[s]
+            b[s] += K_nm[s].T @ Y_train[a:e]
+    alpha = [
+        solve(A[s] + lambdas[s] * K_mm[s], b[s], assume_a="sym") for s in range(len(A))
+    ]
+    return landmarks, alpha
+
+
+###############################################################################
+# Random Fourier features
+###############################################################################
+
+
+def rff_params(
+    X_train: np.ndarray, X_atoms_train: Sequence, size: int, sigma: float, seed: int = 42
+) -> dict:
+    """exp(-|x-y|^2/(2 sigma^2)) ~ z(x).z(y), z(x) = sqrt(2/D) cos(W x + b)"""
+    rng = np.random.default_rng(seed)
+    d = int(np.prod(X_train.shape[2:]))
+    return {
+        "method": "rff",
+        "size": size,
+        "sigma": sigma,
+        "elements": sorted(set(int(z) for Q in X_atoms_train for z in Q)),
+        "W": rng.normal(0.0, 1.0 / sigma, (d, size)),
+        "b": rng.uniform(0.0, 2 * np.pi, size),
+    }
+
+
+def rff_features(X: np.ndarray, Q: Sequence, params: dict) -> np.ndarray:
+    """Sum of the atomic random features, one block of D features per element (atoms
+    of the same element only are compared by the local kernel)."""
+    from scipy.sparse import coo_matrix
+
+    size = params["size"]
+    elements = {z: k for k, z in enumerate(params["elements"])}
+    rows = []
+    keys = []
+    for i in range(len(X)):
+        for j, z in enumerate(Q[i]):
+            if int(z) in elements:
+                rows.append(np.asarray(X[i, j]).ravel())
+                keys.append(i * len(elements) + elements[int(z)])
+    if len(rows) == 0:
+        return np.zeros((len(X), size * len(elements)))
+    Z = np.sqrt(2.0 / size) * np.cos(np.array(rows) @ params["W"] + params["b"])
+    owner = coo_matrix(
+        (np.ones(len(keys)), (np.array(keys), np.arange(len(keys)))),
+        shape=(len(X) * len(elements), len(keys)),
+    )
+    return np.asarray(owner @ Z).reshape(len(X), size * len(elements))
+
+
+def _rff_chunk(task) -> np.ndarray:
+    X, Q, params = task
+    return rff_features(X, Q, params)
+
+
+def rff_training(
+    X_train: np.ndarray,
+    X_atoms_train: Sequence,
+    Y_train,
+    sigma: float,
+    lambd: float,
+    size: int,
+    seed: int = 42,
+    chunk: int = 2048,
+):
+    """Ridge regression in the feature space: w = (Phi^T Phi + lambda I)^-1 Phi^T y."""
+    from scipy.linalg import solve
+
+    params = rff_params(X_train, X_atoms_train, size, sigma, seed)
+    print(
+        f"JKML(QML): Random Fourier features ({size} per element, {len(params['elements'])} elements).",
+        flush=True,
+    )
+    Y_train = np.asarray(Y_train, dtype=np.float64)
+    F = size * len(params["elements"])
+    A = np.zeros((F, F))
+    b = np.zeros((F,) + Y_train.shape[1:])
+    bounds = chunk_bounds(len(X_train), chunk)
+    tasks = [(np.asarray(X_train[a:e]), X_atoms_train[a:e], params) for a, e in bounds]
+    for (a, e), Phi in zip(bounds, _map_chunks(_rff_chunk, tasks)):
+        A += Phi.T @ Phi
+        b += Phi.T @ Y_train[a:e]
+    A[np.diag_indices(F)] += lambd
+    return params, [solve(A, b, assume_a="pos")]
+
+
+def rff_predict(
+    X_test: np.ndarray, X_atoms: Sequence, params: dict, alpha: np.ndarray, chunk: int = 2048
+) -> np.ndarray:
+    bounds = chunk_bounds(len(X_test), chunk)
+    tasks = [(np.asarray(X_test[a:e]), X_atoms[a:e], params) for a, e in bounds]
+    return np.concatenate([Phi @ alpha for Phi in _map_chunks(_rff_chunk, tasks)])
+
+
+###############################################################################
+
+
+def approx_training(
+    X_train: np.ndarray,
+    X_atoms_train: Sequence,
+    strs,
+    Y_train,
+    Qrepresentation: str,
+    Qkernel: str,
+    sigmas: Sequence[float],
+    lambdas: Sequence[float],
+    approx: dict,
+    seed: int = 42,
+):
+    """Approximate KRR model as (X_train, X_atoms_train, strs, alpha, krr_approx_params),
+    in the layout of the exact model."""
+    if approx["method"] == "nystrom":
+        landmarks, alpha = nystrom_training(
+            X_train,
+            X_atoms_train,
+            Y_train,
+            Qrepresentation,
+            Qkernel,
+            sigmas,
+            lambdas,
+            approx["size"],
+            approx["selection"],
+            seed,
+        )
+        strs = strs.iloc[landmarks] if hasattr(strs, "iloc") else np.asarray(strs)[landmarks]
+        return (
+            np.asarray(X_train[landmarks]),
+            [X_atoms_train[i] for i in landmarks],
+            strs,
+            alpha,
+            dict(approx, landmarks=landmarks),
+        )
+    if not kernel_functions(Qrepresentation, Qkernel)[2] or Qkernel != "Gaussian":
+        raise ValueError(
+            "Random Fourier features need the Gaussian FCHL19 or MBDF (local) kernel"
+        )
+    params, alpha = rff_training(
+        X_train, X_atoms_train, Y_train, sigmas[0], lambdas[0], approx["size"], seed
+    )
+    return None, None, None, alpha, params
@@ -60,7 +60,10 @@ def print_help():
     print(
         "    -train <HIGH.pkl> [<LOW.pkl>]    train on given pikled files", flush=True
     )
-    print("    -trained <model.pkl>             take pre-trained ML model", flush=True)
+    print(
+        "    -trained <model.pkl>             take pre-trained ML model (KRR/k-NN: model.jkml or model.pkl)",
+        flush=True,
+    )
     print(
         "    -monomers <HIGH.pkl> [<LOW.pkl>] properties with respect to monomer(s) in pickled file(s)",
         flush=True,
@@ -244,6 +247,46 @@ def help_krr():
     )
     print("    -laplacian          switch to Laplacian kernel (FCHL)")
     print("    -krr_cutoff <float> cutoff function (Angstrom) [def = 10.0]", flush=True)
+    print(
+        "    -repr_cpu <int>     processes used for representations (FCHL/MBDF/BoB/CM/MBTR) [def = 1]",
+        flush=True,
+    )
+    print(
+        "    -repr_cache <dir>   keep representations in <dir> and reuse them in later runs",
+        flush=True,
+    )
+    print(
+        "    -krr_block <int>    tile size of the training kernel [def = 4096]",
+        flush=True,
+    )
+    print(
+        "    -krr_cpu <int>      processes used for the kernel tiles and prediction chunks [def = 1]",
+        flush=True,
+    )
+    print(
+        "    -krr_dir <dir>      keep the training kernel memory-mapped in <dir>",
+        flush=True,
+    )
+    print(
+        "    -krr_eigvals        print min eigenvalue and condition number of the kernel",
+        flush=True,
+    )
+    print(
+        "    -krr_approx <str>   approximate KRR, linear in the training set size:",
+        flush=True,
+    )
+    print(
+        "                          nystrom:M[:random|kmeans|fps] M landmark structures",
+        flush=True,
+    )
+    print(
+        "                          rff:D random Fourier features (FCHL19/MBDF, D per element)",
+        flush=True,
+    )
+    print(
+        "    -eval_chunk <int>   predict in chunks of <int> structures, resumable [def = 10000]",
+        flush=True,
+    )
     print("", flush=True)
 
 
@@ -344,6 +387,14 @@ def arguments(argument_list=[]):
     sigmas = [1.0]
     lambdas = [1e-4] * len(sigmas)
     krr_cutoff = 10.0
+    repr_cpu = 1
+    repr_cache = None
+    krr_block = 4096
+    krr_cpu = 1
+    krr_dir = None
+    krr_eigvals = False
+    krr_approx = None
+    eval_chunk = 10000
 
     # Predefined NN - PaiNN
     nn_rbf = 20
@@ -1119,6 +1170,62 @@ def arguments(argument_list=[]):
             subsample_mlkr = True
             continue
 
+        # Representation service
+        if last == "-repr_cpu":
+            repr_cpu = int(arg)
+            last = ""
+            continue
+        if arg == "-repr_cpu":
+            last = arg
+            continue
+        if last == "-repr_cache":
+            repr_cache = arg
+            last = ""
+            continue
+        if arg == "-repr_cache":
+            last = arg
+            continue
+
+        # Tiled KRR training
+        if last == "-krr_block":
+            krr_block = int(arg)
+            last = ""
+            continue
+        if arg == "-krr_block":
+            last = arg
+            continue
+        if last == "-krr_cpu":
+            krr_cpu = int(arg)
+            last = ""
+            continue
+        if arg == "-krr_cpu":
+            last = arg
+            continue
+        if last == "-krr_dir":
+            krr_dir = arg
+            last = ""
+            continue
+        if arg == "-krr_dir":
+            last = arg
+            continue
+        if arg == "-krr_eigvals":
+            krr_eigvals = True
+            continue
+        if last == "-krr_approx":
+            krr_approx = arg
+            last = ""
+            continue
+        if arg == "-krr_approx":
+            last = arg
+            continue
+        if last == "-eval_chunk":
+            eval_chunk = int(arg)
+            last = ""
+            continue
+        if arg == "-eval_chunk":
+            last = arg
+            continue
+
         # Unknown argument
         raise Exception(f"Sorry cannot understand this argument: {arg} [EXITING]")
 
@@ -0,0 +1,299 @@
+"""
+Tiled kernel ridge regression: the kernel matrix is computed tile by tile (by a
+process pool) into a memory-mapped array, factorized in place by a blocked
+Cholesky decomposition and the regression coefficients are found by blocked
+forward and back substitution. Only the lower triangle is ever computed or read.
+"""
+
+from typing import Optional, List, Sequence, Tuple
+import os
+import numpy as np
+
+krr_settings = {"block": 4096, "n_jobs": 1, "work_dir": None, "eigvals": False}
+
+
+def configure_krr(
+    block: int = 4096,
+    n_jobs: int = 1,
+    work_dir: Optional[str] = None,
+    eigvals: bool = False,
+):
+    """Set the tile size, the number of processes for the kernel tiles, the folder of
+    the memory-mapped kernel (None = in memory, or a temporary folder when running
+    in parallel) and whether the eigenvalue diagnostics are printed."""
+    krr_settings["block"] = max(1, int(block))
+    krr_settings["n_jobs"] = max(1, int(n_jobs))
+    krr_settings["work_dir"] = work_dir
+    krr_settings["eigvals"] = bool(eigvals)
+
+
+def kernel_functions(Qrepresentation: str, Qkernel: str):
+    """(symmetric kernel, kernel, is the kernel local) as used by QML.training"""
+    fchl18 = Qrepresentation == "fchl" or Qrepresentation == "fchl18"
+    if Qkernel == "Gaussian":
+        if fchl18:
+            from qmllib.representations.fchl import (
+                get_local_symmetric_kernels as JKML_sym_kernel,
+            )
+            from qmllib.representations.fchl import get_local_kernels as JKML_kernel
+        else:
+            from qmllib.kernels import get_local_symmetric_kernel as JKML_sym_kernel
+            from qmllib.kernels import get_local_kernel as JKML_kernel
+    else:
+        if not fchl18:
+            raise ValueError(
+                "Laplace kernel is only supported with the FCHL'18 representation"
+            )
+        from qmllib.representations.fchl import (
+            laplacian_kernel_symmetric as JKML_sym_kernel,
+        )
+        from qmllib.representations.fchl import laplacian_kernel as JKML_kernel
+    return JKML_sym_kernel, JKML_kernel, not fchl18
+
+
+def tile_bounds(n: int, block: int) -> List[Tuple[int, int]]:
+    starts = list(range(0, n, block))
+    return [(a, min(a + block, n)) for a in starts]
+
+
+def _tile_values(task) -> np.ndarray:
+    """Kernel tile K[:, a:b, c:d] (a >= c) for all sigmas, lambdas added on the diagonal."""
+    Qrepresentation, Qkernel, sigmas, lambdas, X, Q, (a, b), (c, d) = task
+    if isinstance(X, str):
+        X = np.load(X, mmap_mode="r")
+    JKML_sym_kernel, JKML_kernel, local = kernel_functions(Qrepresentation, Qkernel)
+    Xi = np.asarray(X[a:b])
+    if local:
+        if a == c:
+            K = JKML_sym_kernel(Xi, Q[a:b], sigmas[0])[None]
+        else:
+            # (the local kernel of X1, X2 has the shape (len(X2), len(X1)))
+            K = JKML_kernel(np.asarray(X[c:d]), Xi, Q[c:d], Q[a:b], sigmas[0])[None]
+    else:
+        if a == c:
+            K = np.asarray(JKML_sym_kernel(Xi, kernel_args={"sigma": sigmas}))
+        else:
+            K = np.asarray(
+                JKML_kernel(Xi, np.asarray(X[c:d]), kernel_args={"sigma": sigmas})
+            )
+    if a == c:
+        for s in range(len(K)):
+            K[s][np.diag_indices(b - a)] += lambdas[s]
+    return K
+
+
+def _kernel_tile(task) -> int:
+    """Compute one tile and write it into the memory-mapped kernel."""
+    filename = task[-1]
+    K_tile = _tile_values(task[:-1])
+    a, b = task[6]
+    c, d = task[7]
+    K = np.load(filename, mmap_mode="r+")
+    K[:, a:b, c:d] = K_tile
+    K.flush()
+    return (b - a) * (d - c)
+
+
+def tiled_kernel(
+    X: np.ndarray,
+    Q: Sequence,
+    Qrepresentation: str,
+    Qkernel: str,
+    sigmas: Sequence[float],
+    lambdas: Sequence[float],
+    bounds: List[Tuple[int, int]],
+    work_dir: Optional[str] = None,
+    n_jobs: int = 1,
+) -> np.ndarray:
+    """Lower triangle of the regularized training kernels, shape (nsigmas, n, n).
+    With a work_dir, the kernel is a .npy file there and the tiles are written into
+    it directly by the worker processes."""
+    n = len(X)
+    nsigmas = 1 if kernel_functions(Qrepresentation, Qkernel)[2] else len(sigmas)
+    tiles = [(i, j) for i in bounds for j in bounds if j[0] <= i[0]]
+    # the largest tiles first
+    tiles.sort(key=lambda t: -(t[0][1] - t[0][0]) * (t[1][1] - t[1][0]))
+    if work_dir is None:
+        K = np.empty((nsigmas, n, n))
+        for i, j in tiles:
+            K[:, i[0] : i[1], j[0] : j[1]] = _tile_values(
+                (Qrepresentation, Qkernel, sigmas, lambdas, X, Q, i, j)
+            )
+        return K
+    os.makedirs(work_dir, exist_ok=True)
+    X_file = os.path.join(work_dir, "X_train.npy")
+    np.save(X_file, X)
+    K_file = os.path.join(work_dir, "K_train.npy")
+    K = np.lib.format.open_memmap(K_file, mode="w+", dtype=np.float64, shape=(nsigmas, n, n))
+    del K
+    tasks = [
+        (Qrepresentation, Qkernel, sigmas, lambdas, X_file, Q, i, j, K_file)
+        for i, j in tiles
+    ]
+    if n_jobs > 1 and len(tasks) > 1:
+        from multiprocessing import Pool
+
+        with Pool(min(n_jobs, len(tasks))) as pool:
+            pool.map(_kernel_tile, tasks, chunksize=1)
+    else:
+        for task in tasks:
+            _kernel_tile(task)
+    os.remove(X_file)
+    return np.load(K_file, mmap_mode="r+")
+
+
+def print_eigenvalues(K: np.ndarray):
+    """Diagnostics of the regularized kernel (lower triangle), before the factorization."""
+    eigvals = np.linalg.eigvalsh(K, UPLO="L")
+    print("JKML(QML): Min eigenvalue: " + str(eigvals[0]), flush=True)
+    print(
+        "JKML(QML): Condition number: " + str(np.max(eigvals) / np.min(eigvals)),
+        flush=True,
+    )
+
+
+def blocked_cholesky(A: np.ndarray, bounds: List[Tuple[int, int]]) -> np.ndarray:
+    """In-place right-looking Cholesky factorization A = L L^T of the lower triangle,
+    one tile at a time (only tiles are loaded, A may be memory-mapped)."""
+    from scipy.linalg import cholesky, solve_triangular
+
+    for t, (k, e) in enumerate(bounds):
+        A[k:e, k:e] = cholesky(A[k:e, k:e], lower=True)
+        L_kk = np.asarray(A[k:e, k:e])
+        for i, ie in bounds[t + 1 :]:
+            A[i:ie, k:e] = solve_triangular(L_kk, A[i:ie, k:e].T, lower=True).T
+        for r, (i, ie) in enumerate(bounds[t + 1 :]):
+            L_ik = np.asarray(A[i:ie, k:e])
+            for j, je in bounds[t + 1 : t + 2 + r]:
+                A[i:ie, j:je] -= L_ik @ A[j:je, k:e].T
+    return A
+
+
+def blocked_cho_solve(
+    L: np.ndarray, y: np.ndarray, bounds: List[Tuple[int, int]]
+) -> np.ndarray:
+    """Solve L L^T x = y by blocked forward and back substitution."""
+    from scipy.linalg import solve_triangular
+
+    x = np.array(y, dtype=np.float64)
+    for t, (k, e) in enumerate(bounds):
+        x[k:e] = solve_triangular(L[k:e, k:e], x[k:e], lower=True)
+        for i, ie in bounds[t + 1 :]:
+            x[i:ie] -= L[i:ie, k:e] @ x[k:e]
+    for t in range(len(bounds) - 1, -1, -1):
+        k, e = bounds[t]
+        x[k:e] = solve_triangular(L[k:e, k:e], x[k:e], lower=True, trans="T")
+        for i, ie in bounds[:t]:
+            x[i:ie] -= L[k:e, i:ie].T @ x[k:e]
+    return x
+
+
+def _work_dir(n_jobs: int):
+    """Folder of the memory-mapped kernel and whether it is temporary."""
+    if krr_settings["work_dir"] is not None:
+        return krr_settings["work_dir"], False
+    if n_jobs > 1:
+        import tempfile
+
+        return tempfile.mkdtemp(prefix="jkml_krr_"), True
+    return None, False
+
+
+def solve_kernels(K: np.ndarray, Y_train, bounds) -> List[np.ndarray]:
+    """Regression coefficients for each (regularized, lower-triangle) kernel K[s]."""
+    alpha = []
+    for s in range(len(K)):
+        if krr_settings["eigvals"]:
+            print_eigenvalues(K[s])
+        L = blocked_cholesky(K[s], bounds)
+        alpha.append(blocked_cho_solve(L, Y_train, bounds))
+    return alpha
+
+
+def tiled_krr(
+    X_train: np.ndarray,
+    X_atoms_train: Sequence,
+    Y_train,
+    Qrepresentation: str,
+    Qkernel: str,
+    sigmas: Sequence[float],
+    lambdas: Sequence[float],
+) -> List[np.ndarray]:
+    """Kernel ridge regression coefficients (one array per sigma)."""
+    import shutil
+
+    n_jobs = krr_settings["n_jobs"]
+    bounds = tile_bounds(len(X_train), krr_settings["block"])
+    work_dir, temporary = _work_dir(n_jobs)
+    print(
+        f"JKML(QML): Kernel of {len(X_train)} structures in {len(bounds)*(len(bounds)+1)//2} tiles ({n_jobs} processes"
+        + ("" if work_dir is None else ", memory-mapped in " + work_dir)
+        + ").",
+        flush=True,
+    )
+    try:
+        K = tiled_kernel(
+            X_train,
+            X_atoms_train,
+            Qrepresentation,
+            Qkernel,
+            sigmas,
+            lambdas,
+            bounds,
+            work_dir,
+            n_jobs,
+        )
+        alpha = solve_kernels(K, Y_train, bounds)
+        del K
+    finally:
+        if temporary:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        elif work_dir is not None and os.path.exists(os.path.join(work_dir, "K_train.npy")):
+            os.remove(os.path.join(work_dir, "K_train.npy"))
+    return alpha
+
+
+def split_krr(varsoutfile: str, splits: int, n: int) -> List[np.ndarray]:
+    """Regression coefficients from the kernel cells computed by the -split jobs
+    (<varsoutfile>_<splits>_<i>_<j>.pkl, i >= j). The cells are written directly into
+    their place in the (memory-mapped) kernel, only the lower triangle is used."""
+    import pickle
+    import shutil
+
+    ends = np.cumsum([len(p) for p in np.array_split(np.arange(n), splits)])
+    bounds = [(int(e - len(p)), int(e)) for e, p in zip(ends, np.array_split(np.arange(n), splits))]
+    work_dir, temporary = _work_dir(1)
+    if work_dir is None:
+        K = np.empty((n, n))
+    else:
+        os.makedirs(work_dir, exist_ok=True)
+        K = np.lib.format.open_memmap(
+            os.path.join(work_dir, "K_train.npy"), mode="w+", dtype=np.float64, shape=(n, n)
+        )
+    try:
+        for s1 in range(splits):
+            for s2 in range(s1 + 1):
+                with open(
+                    varsoutfile.split(".pkl")[0]
+                    + "_"
+                    + str(splits)
+                    + "_"
+                    + str(s1)
+                    + "_"
+                    + str(s2)
+                    + ".pkl",
+                    "rb",
+                ) as f:
+                    cell = pickle.load(f)
+                Kcell, Y_train = cell[0], cell[1]
+                (a, b), (c, d) = bounds[s1], bounds[s2]
+                K[a:b, c:d] = Kcell[0]
+                del cell, Kcell
+        alpha = solve_kernels(K[None], Y_train, bounds)
+        del K
+    finally:
+        if temporary:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        elif work_dir is not None:
+            os.remove(os.path.join(work_dir, "K_train.npy"))
+    return alpha
@@ -1,3 +1,22 @@
+def read_database(filename):
+    """Read a JKQC pickle or all shards listed in a JKQC manifest (<name>.manifest.json) as one database"""
+    from pandas import read_pickle
+
+    if not filename.endswith(".manifest.json"):
+        return read_pickle(filename)
+    from json import load
+    from os import path
+    from pandas import concat
+
+    with open(filename, "r") as f:
+        manifest = load(f)
+    folder = path.dirname(filename)
+    return concat(
+        [read_pickle(path.join(folder, shard["file"])) for shard in manifest["shards"]],
+        ignore_index=True,
+    )
+
+
 def load_databases(
     Qtrain,
     Qeval,
@@ -15,7 +34,6 @@ def load_databases(
 ):
 
     import os
-    from pandas import read_pickle
 
     if Qtrain == 1 or Qhyper:
         if not os.path.exists(TRAIN_HIGH):
@@ -26,7 +44,10 @@ def load_databases(
                 print("JKML(load_databases): Error reading file. TRAIN_LOW = " + TRAIN_LOW)
                 exit()
     if Qtrain == 2:
-        if not os.path.exists(VARS_PKL):
+        from src.model_artifact import find_model
+
+        # (a model pickle or a model artifact <name>.jkml)
+        if find_model(VARS_PKL) is None and not os.path.exists(VARS_PKL):
             print("JKML(load_databases): Error reading file. VARS_PKL = " + VARS_PKL)
             exit()
     if Qeval == 1 or Qeval == 2:
@@ -60,7 +81,7 @@ def load_databases(
     monomers_high_database = "none"
     monomers_low_database = "none"
     if Qtrain == 1 or Qhyper:
-        train_high_database = read_pickle(TRAIN_HIGH).sort_values(
+        train_high_database = read_database(TRAIN_HIGH).sort_values(
           [("info", "file_basename")]
         )
         if Qmonomers == 1:
@@ -68,7 +89,7 @@ def load_databases(
             print("JKML(load_databases): train_high_database are missing some info:components.")
             exit()
         if method == "delta":
-            train_low_database = read_pickle(TRAIN_LOW).sort_values(
+            train_low_database = read_database(TRAIN_LOW).sort_values(
                 [("info", "file_basename")]
             )
             if Qmonomers == 1:
@@ -76,7 +97,7 @@ def load_databases(
                 print("JKML(load_databases): train_low_database are missing some info:components.")
                 exit()
     if Qeval == 1 or Qeval == 2 or Qopt > 0:
-        test_high_database = read_pickle(TEST_HIGH).sort_values(
+        test_high_database = read_database(TEST_HIGH).sort_values(
             [("info", "file_basename")]
         )
         if Qmonomers == 1:
@@ -84,7 +105,7 @@ def load_databases(
             print("JKML(load_databases): test_high_database are missing some info:components.")
             exit()
         if method == "delta":
-            test_low_database = read_pickle(TEST_LOW).sort_values(
+            test_low_database = read_database(TEST_LOW).sort_values(
                 [("info", "file_basename")]
             )
             if Qmonomers == 1:
@@ -92,12 +113,12 @@ def load_databases(
                 print("JKML(load_databases): test_low_database are missing some info:components.")
                 exit()
     if Qmonomers == 1:
-        monomers_high_database = read_pickle(MONOMERS_HIGH).sort_values([("info", "file_basename")])
+        monomers_high_database = read_database(MONOMERS_HIGH).sort_values([("info", "file_basename")])
         if not monomers_high_database.loc[:,("info", "components")].notna().all():
           print("JKML(load_databases): Monomers are missing some info:components.")
           exit()
         if method == "delta":
-          monomers_low_database = read_pickle(MONOMERS_LOW).sort_values([("info", "file_basename")])
+          monomers_low_database = read_database(MONOMERS_LOW).sort_values([("info", "file_basename")])
           if not monomers_low_database.loc[:,("info", "components")].notna().all():
             print("JKML(load_databases): Monomers are missing some info:components.")
             exit()
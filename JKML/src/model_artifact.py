@@ -0,0 +1,158 @@
+"""
+Versioned JKML model artifact: a folder <model>.jkml with a manifest.json and one
+.npy file per array, holding only what the prediction needs (representations,
+atomic numbers, regression coefficients, neighbour index, hyperparameters). No
+training structures are stored. Arrays are memory-mapped when first accessed, so
+loading a model only reads the manifest.
+"""
+
+from typing import Optional, Dict, Any
+import os
+import json
+import pickle
+import numpy as np
+
+MODEL_FORMAT = "jkml-model"
+MODEL_VERSION = 1
+
+
+def artifact_name(varsoutfile: str) -> str:
+    return varsoutfile.split(".pkl")[0] + ".jkml"
+
+
+def is_artifact(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "manifest.json"))
+
+
+def find_model(path: str) -> Optional[str]:
+    """The artifact given directly or next to a (legacy) model pickle name, else None."""
+    if is_artifact(path):
+        return path
+    if is_artifact(artifact_name(path)):
+        return artifact_name(path)
+    return None
+
+
+def _to_json(value, arrays: dict, name: str):
+    """JSON-safe copy of value, arrays are moved into arrays (and referenced by name)."""
+    if isinstance(value, np.ndarray):
+        arrays[name] = value
+        return {"__array__": name}
+    if isinstance(value, dict):
+        return {str(k): _to_json(v, arrays, name + "." + str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v, arrays, name + "." + str(i)) for i, v in enumerate(value)]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def save_model(
+    folder: str,
+    method: str,
+    params: Dict[str, Any],
+    arrays: Dict[str, Any],
+    ragged: Optional[Dict[str, Any]] = None,
+    objects: Optional[Dict[str, Any]] = None,
+    float32: tuple = (),
+):
+    """Write the artifact (atomically: into a temporary folder which replaces folder).
+    params  : hyperparameters/metadata (arrays inside are stored as .npy files)
+    arrays  : arrays (names in float32 are stored in single precision)
+    ragged  : lists of 1D arrays (e.g. atomic numbers), stored as data + offsets
+    objects : pickled python objects (e.g. a fitted neighbour index)"""
+    import shutil
+    import uuid
+
+    tmp = folder.rstrip(os.sep) + ".tmp_" + uuid.uuid4().hex
+    os.makedirs(tmp)
+    stored = {}
+    params = _to_json(params, stored, "params")
+    manifest = {
+        "format": MODEL_FORMAT,
+        "version": MODEL_VERSION,
+        "method": method,
+        "params": params,
+        "arrays": {},
+        "ragged": {},
+        "objects": {},
+    }
+    for name, array in list(arrays.items()) + list(stored.items()):
+        array = np.asarray(array)
+        if name in float32:
+            array = array.astype(np.float32)
+        np.save(os.path.join(tmp, name + ".npy"), array)
+        manifest["arrays"][name] = name + ".npy"
+    for name, rows in (ragged or {}).items():
+        rows = [np.asarray(row) for row in rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(row) for row in rows])
+        data = np.concatenate(rows) if len(rows) > 0 else np.zeros(0)
+        np.save(os.path.join(tmp, name + ".data.npy"), data)
+        np.save(os.path.join(tmp, name + ".offsets.npy"), offsets)
+        manifest["ragged"][name] = [name + ".data.npy", name + ".offsets.npy"]
+    for name, obj in (objects or {}).items():
+        with open(os.path.join(tmp, name + ".pkl"), "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        manifest["objects"][name] = name + ".pkl"
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.replace(tmp, folder)
+    print(f"JKML: Model saved to {folder}", flush=True)
+
+
+class JKMLModel:
+    """Lazily loaded artifact: model[name] gives an array (memory-mapped), a ragged
+    list of arrays or an unpickled object; model.params the hyperparameters."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        with open(os.path.join(folder, "manifest.json"), "r") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != MODEL_FORMAT:
+            raise ValueError(f"{folder} is not a JKML model.")
+        if self.manifest["version"] > MODEL_VERSION:
+            raise ValueError(
+                f"The model {folder} was written by a newer JKML version (format {self.manifest['version']})."
+            )
+        self.method = self.manifest["method"]
+        self._loaded = {}
+        self.params = self._from_json(self.manifest["params"])
+
+    def _from_json(self, value):
+        if isinstance(value, dict):
+            if "__array__" in value and len(value) == 1:
+                return self[value["__array__"]]
+            return {k: self._from_json(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._from_json(v) for v in value]
+        return value
+
+    def __contains__(self, name: str) -> bool:
+        return any(name in self.manifest[kind] for kind in ["arrays", "ragged", "objects"])
+
+    def __getitem__(self, name: str):
+        if name not in self._loaded:
+            if name in self.manifest["arrays"]:
+                value = np.load(os.path.join(self.folder, self.manifest["arrays"][name]), mmap_mode="r")
+            elif name in self.manifest["ragged"]:
+                data_file, offsets_file = self.manifest["ragged"][name]
+                data = np.load(os.path.join(self.folder, data_file), mmap_mode="r")
+                offsets = np.load(os.path.join(self.folder, offsets_file))
+                value = [data[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+            elif name in self.manifest["objects"]:
+                with open(os.path.join(self.folder, self.manifest["objects"][name]), "rb") as f:
+                    value = pickle.load(f)
+            else:
+                raise KeyError(f"{name} is not stored in the model {self.folder}")
+            self._loaded[name] = value
+        return self._loaded[name]
+
+    def get(self, name: str, default=None):
+        return self[name] if name in self else default
+
+
+def load_model(folder: str) -> JKMLModel:
+    return JKMLModel(folder)
@@ -1,7 +1,7 @@
 """This module contains methods related to creating and manipulating chemical descriptors."""
 
 from ase import Atoms
-from typing import Iterable, Dict, Union
+from typing import Iterable, Dict, Union, Callable, Optional
 import numpy as np
 from collections import defaultdict
 
@@ -157,15 +157,19 @@ def generate_global_mbtr(
     k2_weight=0.5,
     k3_width=0.1,
     k3_weight=0.5,
+    species=None,
     **kwargs,
 ):
     from dscribe.descriptors import MBTR
 
-    unique_atoms = set()
-    for structure in strs:
-        atom_set = set(structure.get_chemical_symbols())
-        unique_atoms = unique_atoms | atom_set
-    unique_atoms = list(unique_atoms)
+    if species is None:
+        unique_atoms = set()
+        for structure in strs:
+            atom_set = set(structure.get_chemical_symbols())
+            unique_atoms = unique_atoms | atom_set
+        unique_atoms = list(unique_atoms)
+    else:
+        unique_atoms = list(species)
     mbtr = MBTR(
         species=unique_atoms,
         k2={
@@ -225,3 +229,184 @@ def correct_fchl18_kernel_size(X_test: np.ndarray, X_train: np.ndarray):
         else:
             X_train = newmatrix
     return X_test, X_train
+
+
+###############################################################################
+# Representation service: structures are split into shards computed by a
+# process pool, the rows are written into a memory-mapped array and kept on
+# disk, keyed by the structure hash and the representation hyperparameters.
+###############################################################################
+
+REPRESENTATION_CACHE_VERSION = 1
+representation_settings = {"cache_dir": None, "n_jobs": 1}
+
+
+def configure_representations(cache_dir: Optional[str] = None, n_jobs: int = 1):
+    """Set the on-disk cache folder (None = no cache) and the number of processes."""
+    representation_settings["cache_dir"] = cache_dir
+    representation_settings["n_jobs"] = max(1, int(n_jobs))
+
+
+def structure_hash(struct: Atoms) -> str:
+    from hashlib import blake2b
+
+    h = blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(struct.get_atomic_numbers(), dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(struct.get_positions(), dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def resolve_representation_kwargs(generator: Callable, strs, kwargs) -> dict:
+    """Fix the defaults that depend on the whole set of structures (padding, bag
+    sizes, species), so that rows computed in different shards or runs agree."""
+    kwargs = dict(kwargs)
+    if generator is generate_global_mbtr:
+        if kwargs.get("species") is None:
+            species = set()
+            for struct in strs:
+                species |= set(struct.get_chemical_symbols())
+            kwargs["species"] = sorted(species)
+        return kwargs
+    if kwargs.get("max_atoms") is None:
+        kwargs["max_atoms"] = max([len(s) for s in strs])
+    if generator is generate_bob and kwargs.get("asize") is None:
+        asize = defaultdict(int)
+        for struct in strs:
+            elements, counts = np.unique(struct.get_chemical_symbols(), return_counts=True)
+            for e, c in zip(elements, counts):
+                asize[str(e)] = max(asize[str(e)], int(c))
+        kwargs["asize"] = dict(asize)
+    return kwargs
+
+
+def representation_key(generator: Callable, kwargs: dict) -> str:
+    from hashlib import blake2b
+
+    def canonical(value):
+        if isinstance(value, dict):
+            return sorted((str(k), canonical(v)) for k, v in value.items())
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return [canonical(v) for v in value]
+        if isinstance(value, (np.integer, np.floating)):
+            return value.item()
+        return value
+
+    text = repr((REPRESENTATION_CACHE_VERSION, generator.__name__, canonical(kwargs)))
+    return generator.__name__ + "_" + blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+def _representation_shard(task) -> int:
+    """Compute one shard and write it into its rows of the memory-mapped array."""
+    generator, strs, kwargs, filename, start = task
+    X = generator(strs, **kwargs)
+    out = np.load(filename, mmap_mode="r+")
+    out[start : start + len(strs)] = X
+    out.flush()
+    return len(strs)
+
+
+def _compute_into(generator: Callable, strs: list, kwargs: dict, filename: str, n_jobs: int):
+    """Fill a new .npy file with the representations of strs (in shards over n_jobs processes)."""
+    first = generator(strs[:1], **kwargs)
+    out = np.lib.format.open_memmap(
+        filename, mode="w+", dtype=first.dtype, shape=(len(strs),) + first.shape[1:]
+    )
+    out[:1] = first
+    out.flush()
+    del out
+    bounds = np.linspace(1, len(strs), min(4 * n_jobs, len(strs) - 1) + 1).astype(int)
+    tasks = [
+        (generator, strs[a:b], kwargs, filename, a)
+        for a, b in zip(bounds[:-1], bounds[1:])
+        if b > a
+    ]
+    if n_jobs > 1 and len(tasks) > 1:
+        from multiprocessing import Pool
+
+        with Pool(min(n_jobs, len(tasks))) as pool:
+            pool.map(_representation_shard, tasks, chunksize=1)
+    else:
+        for task in tasks:
+            _representation_shard(task)
+
+
+def cached_representation(generator: Callable, strs, **kwargs) -> np.ndarray:
+    """generator(strs, **kwargs) computed in parallel shards, with on-disk caching of
+    the rows (see configure_representations). Representations which do not give one
+    independent row per structure are computed directly."""
+    import os
+    import tempfile
+    import uuid
+    from glob import glob
+
+    strs = list(strs)
+    n_jobs = representation_settings["n_jobs"]
+    cache_dir = representation_settings["cache_dir"]
+    if generator not in SHARDED_REPRESENTATIONS or len(strs) == 0:
+        return generator(strs, **kwargs)
+    if cache_dir is None and (n_jobs == 1 or len(strs) < 2):
+        return generator(strs, **kwargs)
+    kwargs = resolve_representation_kwargs(generator, strs, kwargs)
+
+    # rows available in the cache: hash -> (part file, row)
+    hashes = [structure_hash(s) for s in strs]
+    available = {}
+    if cache_dir is not None:
+        folder = os.path.join(cache_dir, representation_key(generator, kwargs))
+        os.makedirs(folder, exist_ok=True)
+        for keys_file in sorted(glob(os.path.join(folder, "*.keys.npy"))):
+            part = keys_file[: -len(".keys.npy")] + ".npy"
+            for row, h in enumerate(np.load(keys_file)):
+                available[str(h)] = (part, row)
+    else:
+        folder = tempfile.mkdtemp(prefix="jkml_repr_")
+
+    # missing (unique) structures are computed into a new part
+    missing = {}
+    for i, h in enumerate(hashes):
+        if h not in available and h not in missing:
+            missing[h] = i
+    if len(missing) > 0:
+        print(
+            f"JKML(representations): computing {len(missing)} of {len(strs)} {generator.__name__} representations ({n_jobs} processes).",
+            flush=True,
+        )
+        name = os.path.join(folder, "part_" + uuid.uuid4().hex)
+        _compute_into(generator, [strs[i] for i in missing.values()], kwargs, name + ".tmp.npy", n_jobs)
+        os.replace(name + ".tmp.npy", name + ".npy")
+        if cache_dir is not None:
+            np.save(name + ".keys.tmp.npy", np.array(list(missing.keys())))
+            os.replace(name + ".keys.tmp.npy", name + ".keys.npy")
+        for row, h in enumerate(missing):
+            available[h] = (name + ".npy", row)
+
+    # gather the rows part by part
+    by_part = defaultdict(list)
+    for i, h in enumerate(hashes):
+        by_part[available[h][0]].append((i, available[h][1]))
+    X = None
+    for part, pairs in by_part.items():
+        data = np.load(part, mmap_mode="r")
+        if X is None:
+            X = np.empty((len(strs),) + data.shape[1:], dtype=data.dtype)
+        index = np.array(pairs)
+        X[index[:, 0]] = data[index[:, 1]]
+        del data
+    if cache_dir is None:
+        import shutil
+
+        shutil.rmtree(folder, ignore_errors=True)
+    return X
+
+
+# representations giving one independent row per structure (once the
+# dataset-dependent defaults are resolved)
+SHARDED_REPRESENTATIONS = [
+    generate_fchl19,
+    generate_global_fchl19,
+    generate_fchl18,
+    generate_bob,
+    generate_coulomb,
+    generate_global_mbtr,
+    generate_global_mbdf,
+]
@@ -8,15 +8,38 @@ system(cmd)
 
 #READ ARGUMENTS
 from arguments import arguments
-locals().update(arguments(argv[1:]))
+Qarguments = arguments(argv[1:])
+locals().update(Qarguments)
 if Qout == 2:
   from time import time
   start = time()
   print("DONE] Time started: "+str(time() - start));
 
+# Planning which columns are needed
+from plan_columns import plan_columns
+Qcolumns = plan_columns(input_pkl,files,input_pkl_sp,Qcomplement,addcolumn,Qmodify,Qqha,Qsort,Quniq,Qcut,Qreacted,Qarbalign,QMWarbalign,Qglob,Qbavg,Qaimnet_prep,Qid,Pout,Qcolumn)
+if Qout == 2 and Qcolumns is not None:
+  print("DONE] Columns planned: "+str(Qcolumns))
+
+# Streaming block by block (-chunk)
+if Qchunk > 0:
+  from chunked import chunk_supported, run_chunked
+  if chunk_supported(Qarguments):
+    run_chunked(Qarguments, Qcolumns)
+    if Qout == 2:
+      print("DONE] JKQC done: "+str(time() - start));
+    exit()
+  elif Qout >= 1:
+    print("-chunk cannot be used with these arguments, loading everything.")
+
 # Loading input pickles
+#(-lowmem: inputs are filtered one by one if nothing changes them between loading and filtering)
+Qprefilter = None
+if Qlowmem == 1 and len(files) == 0 and len(input_pkl_sp) == 0 and Qcomplement == 0 and len(addcolumn) == 0 and Qmodify == 0 and Qextract == 0 and Qqha == 0:
+  from filter import prefilter
+  Qprefilter = prefilter(Qsort, Qreverse, Qarbalign, QMWarbalign, Quniq, Qsample, Qclustername, Qthreshold, Qcut, Qshuffle, Qselect, Qreacted, bonddistancethreshold, seed)
 from load_pickles import load_pickles
-clusters_df = load_pickles(input_pkl,Qout,Qid)
+clusters_df = load_pickles(input_pkl,Qout,Qid,Qcolumns,Qcpu,Qprefilter)
 if Qout == 2:
   print("DONE] Pickles loading done: "+str(time() - start));
 
@@ -37,7 +60,12 @@ if len(input_pkl_sp) > 0:
 #READ QC FILES
 if len(files) > 0:
   from read_files import read_files
-  clusters_df = read_files(clusters_df, files, orcaextname, orcaext, turbomoleext, Qclustername, Qforces, Qanharm, Qdisp_electronic_energy, Qdisp_forces)
+  nloaded = len(clusters_df)
+  clusters_df = read_files(clusters_df, files, orcaextname, orcaext, turbomoleext, Qclustername, Qforces, Qanharm, Qdisp_electronic_energy, Qdisp_forces, Qcpu, Qcache)
+  if Qid == 2 and ("xyz","structure") in clusters_df.columns:
+    #RDKit SMILES instead of the connectivity fingerprints assigned while reading
+    from read_xyz import identify_batch
+    clusters_df.loc[nloaded:,("xyz","id1")] = identify_batch(clusters_df.loc[nloaded:,("xyz","structure")].values, Qsmiles = 1, Qcpu = Qcpu)
   if Qout == 2:
     print("DONE] Files loaded: "+str(time() - start));
 
@@ -63,6 +91,9 @@ if Qextract > 0:
     print("DONE] Extraction done: "+str(time() - start));
 
 ## IN ORDER TO SAVE OUTPUT.pkl ##
+#(rows are indexed by their position in the concatenated inputs, see load_pickles)
+if Qcolumns is not None and Qoutpkl > 0:
+  source_rows = clusters_df.index.values
 clusters_df = clusters_df.reset_index(drop=True)
 if Qoutpkl > 0:
   original_clusters_df = clusters_df.copy()
@@ -71,8 +102,12 @@ if Qoutpkl > 0:
 
 ## THERMODYNAMICS ##
 if Qqha == 1:
-  from thermodynamics import thermodynamics
-  clusters_df = thermodynamics(clusters_df, Qanh, Qafc, Qfc, Qt, Qdropimg)
+  if len(Qtemps) > 1:
+    from thermodynamics import thermodynamics_sweep
+    clusters_df, sweep = thermodynamics_sweep(clusters_df, Qanh, Qafc, Qfc, Qtemps, Qdropimg)
+  else:
+    from thermodynamics import thermodynamics
+    clusters_df = thermodynamics(clusters_df, Qanh, Qafc, Qfc, Qt, Qdropimg)
   if Qout == 2:
     print("DONE] Data modification done: "+str(time() - start));
 
@@ -83,7 +118,12 @@ clusters_df = filter(clusters_df, Qsort, Qreverse, Qarbalign, QMWarbalign, Quniq
 ## SAVE OUTPUT.pkl ##
 if Qoutpkl > 0:
   from save_pickle import save_pickle
-  save_pickle(original_clusters_df.loc[clusters_df.index],output_pkl,Qsplit,Qout) 
+  if Qcolumns is not None:
+    from plan_columns import complete_columns
+    original_clusters_df = complete_columns(original_clusters_df.loc[clusters_df.index],input_pkl,Qcolumns,source_rows[clusters_df.index])
+    save_pickle(original_clusters_df,output_pkl,Qsplit,Qout,Qcompress,Qcpu)
+  else:
+    save_pickle(original_clusters_df.loc[clusters_df.index],output_pkl,Qsplit,Qout,Qcompress,Qcpu)
 
 ## PREPARE DATA PRINT ##
 from numpy import array
@@ -91,7 +131,13 @@ if Qsolvation != "0" or Qformation != 0:
   if len(Pout) > 0:
     if Pout[0] != "-ct":
       Pout.insert(0,"-ct")
-if len(Pout) > 0:
+if len(Qtemps) > 1:
+  #TEMPERATURE SWEEP: G(T) for all clusters (or cluster types with -glob/-bavg)
+  from take_bavg import take_sweep
+  output = take_sweep(clusters_df, sweep[clusters_df.index.values], Qtemps, Qglob, Qbavg, QUenergy, Qformation)
+  if Qformation == 0 and Qsolvation == "0":
+    output = array([array(["T[K]"]+list(output[0]), dtype = object)]+[array([Qtemps[j]]+list(output[j+1]), dtype = object) for j in range(len(Qtemps))])
+elif len(Pout) > 0:
   from print_output import print_output
   output = array(print_output(clusters_df,Qoutpkl,input_pkl,output_pkl,Qsplit,Qclustername,Qt,Qcolumn,Qbonded,Qdistances,Pout,QUenergy,QUentropy))
   if Qout == 2:
@@ -102,12 +148,12 @@ else:
 ## PRINT DATA ##
 if not len(output) == 0:
   #TAKING GLOBAL MINIMA ONLY: not needed if sort and select used
-  if (Qglob == 1 or Qglob == 2) and (len(clusters_df)>1):
+  if (Qglob == 1 or Qglob == 2) and (len(clusters_df)>1) and len(Qtemps) <= 1:
     from take_glob import take_glob
     output = take_glob(output, clusters_df, Qglob)
   
   #TAKING BOLTZMANN AVERAGE OVER ALL MINIMA 
-  if Qbavg == 1 or Qbavg == 2:
+  if (Qbavg == 1 or Qbavg == 2) and len(Qtemps) <= 1:
     from math import isnan
     if isnan(Qt):
       Qt = 298.15
@@ -116,12 +162,8 @@ if not len(output) == 0:
 
   #PRINTING (if required)
   if not(Qout < 1 and (Qformation == 1 or Qsolvation != "0")):
-    toprint = list(zip(*output)) #[row for row in list(zip(*output))]
-    if len(toprint) > 0:
-      column_widths = [max(len(str(row[i])) for row in toprint) for i in range(len(toprint[0]))]
-      for row in toprint:
-        formatted_row = [str(row[i]).ljust(column_widths[i]) for i in range(len(row))]
-        print(" ".join(formatted_row),flush = True)
+    from print_output import print_table
+    print_table(output)
     if Qout == 2:
       print("DONE] Printing done: "+str(time() - start));
 
@@ -147,7 +189,7 @@ if Qsolvation != "0" or Qformation == 1:
       Qt = 298.15
     if isnan(Qp):
       Qp = 101325
-    print_formation(output,Qout,Qt,Qp,Qconc,conc,CNTfactor,QUenergy)
+    print_formation(output,Qout,Qt,Qp,Qconc,conc,CNTfactor,QUenergy,Qtemps if len(Qtemps) > 1 else None)
     if Qout == 2:
       print("DONE] Formation done: "+str(time() - start));
 
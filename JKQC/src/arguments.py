@@ -11,8 +11,15 @@ def print_help():
   print(" -info       information about a database")
   print(" -in X.pkl   read data from a database")
   print(" -out X.pkl  save data to XX.pkl (-noex = do not print example)")
+  print(" X.jkqc      columnar (memory-mapped) database; can be used instead of .pkl for -in/-out")
   print(" -orcaext X  if ORCA has different extension than out")
   print(" -folder X   takes in all X/*.log files (use -R for resursive)")
+  print(" -cpu X      read files using X processes")
+  print(" -cache      remember parsed files in .JKQCcache and re-read only new/changed files")
+  print(" -lowmem     load input pickles one by one and keep only rows which can pass the filters")
+  print(" -chunk X    process input pickles in blocks of X rows; without relative cuts, -extract, -uniq, -sort etc.")
+  print("             rows keep the input order and -out X.pkl is saved by blocks as X_s1,_s2,... + X.manifest.json")
+  print(" -compress   compress output pickles (zstd or gzip); -split also writes X.manifest.json usable as input")
   print(" -noname     the file names are not analysed (e.g. 1000-10_1.xyz)")
   print(" -rename X Y renames e.g. 1X2sa to 1Y2sa")
   print(" -extract X  prints only selected clusters (e.g. 1sa1w,1sa3-4w or 1sa1w-1_0 or file.pkl)")
@@ -51,6 +58,7 @@ def print_help():
   print(" -fc [value in cm^-1] frequency cut-off for low-vibrational frequencies CITE: Grimme")
   print(" -antifc [value]      in ORCA6.0 deapply QHA and apply again. Useful for correct vib. scaling")
   print(" -temp [value in K]   recalculate for different temperature")
+  print(" -temp <start:stop:step> temperature sweep, e.g. 200:320:5, prints G for all T (also with -bavg,-glob,-formation)")
   print(" -v,-as [value]       anharmonicity scaling factor CITE: Grimme")
   print(" -unit                converts units [Eh] -> [kcal/mol] (for entropy: [Eh/K] -> [cal/mol/K])")
   print("\nFILTERING:")
@@ -82,7 +90,7 @@ def print_help():
   print("\nOTHERS:")
   print(" -add <column> <file>, -extra <column>, -rebasename, -presplit, -i/-index <int:int>, -imos, -imos_xlsx, -maxdist")
   print(" -forces [Eh/Ang], -meanforce, -shuffle, -seed <int>, -split <int>, -underscore, -addSP <pickle>, -complement <pickle>, -errpa, -dropimg")
-  print(" -column <COL1> <COL2>, -drop <COL>, -log2out, -out2log, -levels, -atoms, -hydration/-solvation <str>, -id,-maxf")
+  print(" -column <COL1> <COL2>, -drop <COL>, -log2out, -out2log, -levels, -atoms, -hydration/-solvation <str>, -id,-id_smiles,-maxf")
   print(" -rh <0.0-1.0>, -psolvent <float in Pa>, -anharm, -test, -bonded <float thr.> <element> <element>, -atomize/-clusterize, -gif")
   print(" -eldisp [Eh], -forcedisp [Eh/Ang], -aimnet_prep","-distances/-maxdistances/-mindistances <atom> <atom>")
 
@@ -101,6 +109,11 @@ def arguments(argument_list = []):
   input_pkl_sp = []
   output_pkl = "mydatabase.pkl"
   Qforces = 0 #should I collect forces? 0/1
+  Qcpu = 1 #number of processes used for reading files
+  Qcache = "" #cache file with already parsed outputs
+  Qlowmem = 0 #filter each input pickle while loading?
+  Qchunk = 0 #process the input pickles in blocks of Qchunk rows?
+  Qcompress = 0 #compress output pickles?
   
   #global addcolumn,Qmodify,Qrename,QrenameWHAT,Qiamifo,Qrebasename,Qunderscore,Qchangeall,Qcomplement,QcolumnDO,Qcolumn
   addcolumn = []
@@ -115,7 +128,7 @@ def arguments(argument_list = []):
   Qcomplement = 0 #subtract these from the list base on basename of the new pickle file
   QcolumnDO = 0
   Qcolumn = []
-  Qid = 0 #calculate IDs if missing?
+  Qid = 0 #calculate IDs if missing? (1 = connectivity fingerprint, 2 = RDKit SMILES)
  
   #global Qclustername,Qextract,Pextract,Qreacted,bonddistancethreshold 
   Qclustername = 1 #Analyse file names for cluster definition?
@@ -136,6 +149,7 @@ def arguments(argument_list = []):
   #global Qqha,Qt,Qp,Qfc,Qanh,Qanharm
   Qqha = 0 #Run the QHA
   Qt = missing
+  Qtemps = [] #temperature sweep
   Qp = missing
   Qafc = 0 #Run antiQHA with vib. frequency cutoff
   Qfc = 0 #Run QHA with vib. frequency cutoff
@@ -220,12 +234,44 @@ def arguments(argument_list = []):
     if i == "-R":
       Qrecursive = True
       continue
+    #CPU
+    if i == "-cpu" or i == "-ncpus":
+      last = "-cpu"
+      continue
+    if last == "-cpu":
+      last = ""
+      Qcpu = int(i)
+      continue
+    #CACHE
+    if i == "-cache":
+      Qcache = ".JKQCcache"
+      continue
+    #LOW MEMORY
+    if i == "-lowmem":
+      Qlowmem = 1
+      continue
+    #COMPRESSION
+    if i == "-compress":
+      Qcompress = 1
+      continue
+    #CHUNKS
+    if i == "-chunk":
+      last = "-chunk"
+      continue
+    if last == "-chunk":
+      last = ""
+      Qchunk = int(i)
+      continue
     #INPKL
     if i == "-in":
       last = "-in"
       continue
     if last == "-in":
       last = ""
+      if path.exists(i) and i.endswith(".manifest.json"):
+        from save_pickle import read_manifest
+        input_pkl += read_manifest(i)
+        continue
       if path.exists(i):    
         input_pkl.append(i)
         continue
@@ -527,6 +573,33 @@ def arguments(argument_list = []):
       Pextract.append(i)
       continue
     #INPUT FILES
+    if i.endswith(".manifest.json"):
+      if path.exists(i):
+        from save_pickle import read_manifest
+        input_pkl += read_manifest(i)
+        continue
+      else:
+        print("File "+i+" does not exist. Sorry [EXITING]")
+        exit()
+    if i.rstrip("/").endswith(".jkqc"):
+      if path.exists(i):
+        input_pkl.append(i.rstrip("/"))
+        continue
+      else:
+        if output_pkl != "mydatabase.pkl":
+          print("Hey either one input database does not exist or you are trying to use two different outputs? "+output_pkl+"/"+i+" [EXITING]")
+          exit()
+        else:
+          output_pkl = i.rstrip("/")
+          continue
+    #compressed pickles (-compress)
+    if i.endswith(".pkl.zst") or i.endswith(".pkl.gz"):
+      if path.exists(i):
+        input_pkl.append(i)
+        continue
+      else:
+        print("File "+i+" does not exist. Sorry [EXITING]")
+        exit()
     if len(i) > 3:
       ext = i[-4:]
       if ext == ".xyz" or ext == ".log" or ext == ".out":
@@ -734,7 +807,7 @@ def arguments(argument_list = []):
     # ID
     if i == "-id1":
       Pout.append("-id1")
-      Qid = 1
+      Qid = max(Qid,1)
       continue
     # XYZ
     if i == "-xyz" or i == "--xyz" or i == "-XYZ" or i == "--XYZ":
@@ -963,7 +1036,10 @@ def arguments(argument_list = []):
       Qfc = float(i)
       continue
     if i == "-id":
-      Qid = 1
+      Qid = max(Qid,1)
+      continue
+    if i == "-id_smiles":
+      Qid = 2
       continue
     if i == "-temp" or i == "--temp":
       Qqha = 1
@@ -971,7 +1047,9 @@ def arguments(argument_list = []):
       continue
     if last == "-temp":
       last = ""
-      Qt = float(i)
+      from thermodynamics import parse_temperatures
+      Qtemps = parse_temperatures(i)
+      Qt = Qtemps[0]
       continue
     if i == "-as" or i == "--as" or i == "-v" or i == "--v":
       Qqha = 1
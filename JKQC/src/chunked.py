@@ -0,0 +1,183 @@
+####################################################################################################
+# CHUNKED (STREAMING) JKQC PIPELINE (-chunk <int>)
+# The input databases are read in blocks of rows which go through the row-local stages (id1, -add,
+# -extract, -qha, absolute cuts) one after another. Without global stages, every block is printed
+# and saved (as <output>_s1, _s2, ... parts and <output>.manifest.json) right away and the rows keep
+# the input order (without -chunk, absolute cuts group the rows by cluster type). Global stages
+# (relative cuts, uniqueness, sampling, reacted, sorting, ArbAlign, selection, shuffling), -extract
+# (rows ordered by request), printing that needs all rows and -split are done in two passes: the
+# first pass keeps only the columns the global filter needs and finds the selected rows (in the order
+# of the run without -chunk), the second pass reads the blocks again and keeps only these rows.
+####################################################################################################
+
+#printing options which need all rows at once
+GLOBAL_PRINT = ["-info","-levels","-movie","-gif","-atoms","-pop","-popEL","-ePKL"]
+
+def chunk_supported(args):
+  """Can this JKQC run be done block by block?"""
+  return len(args["input_pkl"]) > 0 and len(args["files"]) == 0 and len(args["input_pkl_sp"]) == 0 \
+    and args["Qcomplement"] == 0 and args["Qmodify"] == 0 and len(args["Qtemps"]) <= 1 \
+    and args["Qglob"] == 0 and args["Qbavg"] == 0 and args["Qformation"] == 0 and args["Qsolvation"] == "0" \
+    and args["Qaimnet_prep"] == 0
+
+def split_cuts(Qcut):
+  """Leading absolute cuts (row-local) and the remaining cuts (from the first relative one)"""
+  for i in range(len(Qcut)):
+    if Qcut[i][1] == "relative":
+      return Qcut[:i], Qcut[i:]
+  return Qcut, []
+
+def global_stages(args):
+  """Does the filtering (or printing) need all rows?"""
+  local_cuts, global_cuts = split_cuts(args["Qcut"])
+  return (args["Qthreshold"] != 0 and len(global_cuts) > 0) or str(args["Quniq"]) != "0" or args["Qreacted"] > 0 \
+    or args["Qarbalign"] > 0 or args["QMWarbalign"] > 0 or str(args["Qsort"]) not in ["0","no"] \
+    or str(args["Qselect"]) != "0" or args["Qshuffle"] == 1 or any(i in GLOBAL_PRINT for i in args["Pout"]) \
+    or args["Qextract"] == 1
+
+def cluster_type_order(clusters_df, args):
+  """Rows grouped by (sorted) cluster type, as after the absolute cuts of the run without -chunk"""
+  from pandas import isna
+  if args["Qthreshold"] == 0 or len(split_cuts(args["Qcut"])[0]) == 0 or args["Qclustername"] == 0:
+    return clusters_df
+  if not ("info","cluster_type") in clusters_df.columns or isna(clusters_df.loc[:,("info","cluster_type")].values).any():
+    return clusters_df
+  return clusters_df.iloc[clusters_df.loc[:,("info","cluster_type")].values.argsort(kind = "stable")]
+
+def global_columns(args):
+  """Columns which the global filter may use"""
+  from plan_columns import key_columns, STRUCTURE
+  needed = ["info",("log","electronic_energy"),("log","gibbs_free_energy"),("out","electronic_energy")]
+  needed += key_columns(args["Qsort"])
+  if str(args["Quniq"]) != "0":
+    from filter_uniq import seperate_string_number2
+    for separated_input in seperate_string_number2(str(args["Quniq"])):
+      if isinstance(separated_input,list):
+        separated_input = separated_input[0]
+      needed += key_columns(separated_input)
+  for cut in split_cuts(args["Qcut"])[1]:
+    needed += key_columns(cut[2])
+  if args["Qreacted"] > 0 or args["Qarbalign"] > 0 or args["QMWarbalign"] > 0:
+    needed += [STRUCTURE]
+  return needed
+
+def row_local(clusters_df, args):
+  """Row-local stages for one block: returns the block as it would be saved and as it is filtered/printed"""
+  if args["Qid"] >= 1 and (args["Qid"] == 2 or not ("xyz","id1") in clusters_df.columns) and ("xyz","structure") in clusters_df.columns:
+    from read_xyz import identify_batch
+    clusters_df[("xyz","id1")] = identify_batch(clusters_df.loc[:,("xyz","structure")].values, Qsmiles = 1 if args["Qid"] == 2 else 0, Qcpu = args["Qcpu"])
+  if len(args["addcolumn"]) > 0:
+    from add_column import add_column
+    clusters_df = add_column(clusters_df,args["addcolumn"])
+  if args["Qextract"] > 0 and len(clusters_df) > 0:
+    from extract_clusters import extract_clusters
+    clusters_df = extract_clusters(clusters_df,args["Qextract"],args["Pextract"],args["Qclustername"],0)
+  original_clusters_df = clusters_df.copy() if args["Qoutpkl"] > 0 else None
+  if args["Qqha"] == 1 and len(clusters_df) > 0:
+    from thermodynamics import thermodynamics
+    clusters_df = thermodynamics(clusters_df, args["Qanh"], args["Qafc"], args["Qfc"], args["Qt"], args["Qdropimg"])
+  local_cuts = split_cuts(args["Qcut"])[0]
+  if args["Qthreshold"] != 0 and len(local_cuts) > 0 and len(clusters_df) > 0:
+    from filter_threshold import filter_threshold
+    #(absolute cuts do not need cluster types, the block keeps its order, see cluster_type_order)
+    clusters_df = filter_threshold(clusters_df,local_cuts,0,0)
+    if "cache" in clusters_df.columns.get_level_values(0):
+      clusters_df = clusters_df.drop(["cache"], axis=1, level=0)
+  return original_clusters_df, clusters_df
+
+def print_block(clusters_df, args):
+  from numpy import array
+  if len(args["Pout"]) == 0 or len(clusters_df) == 0:
+    return
+  from print_output import print_output, print_table
+  output = array(print_output(clusters_df,args["Qoutpkl"],args["input_pkl"],args["output_pkl"],args["Qsplit"],args["Qclustername"],args["Qt"],args["Qcolumn"],args["Qbonded"],args["Qdistances"],args["Pout"],args["QUenergy"],args["QUentropy"]))
+  if len(output) > 0:
+    print_table(output)
+
+def run_chunked(args, Qcolumns = None):
+  """JKQC run block by block (see chunk_supported)"""
+  from numpy import concatenate, zeros
+  from pandas import concat, DataFrame
+  from load_pickles import iterate_chunks
+  from save_pickle import save_pickle
+  from columnar_db import is_columnar
+  Qout = args["Qout"]
+  chunk = args["Qchunk"]
+  #partially loaded columns are not completed for saving
+  if args["Qoutpkl"] > 0:
+    Qcolumns = None
+
+  if not global_stages(args) and args["Qsplit"] == 1:
+    #ONE PASS: every block is printed and saved right away (in the input order)
+    from save_pickle import compression_codec, manifest_name, write_manifest
+    extension = ".jkqc" if is_columnar(args["output_pkl"]) else ".pkl"
+    compression, suffix = compression_codec(args["Qcompress"]) if extension == ".pkl" else (None, "")
+    shards = []
+    nrows = []
+    columns = []
+    empty = None
+    for clusters_df in iterate_chunks(args["input_pkl"],Qout,chunk,Qcolumns):
+      original_clusters_df, clusters_df = row_local(clusters_df, args)
+      print_block(clusters_df, args)
+      if args["Qoutpkl"] > 0 and empty is None:
+        empty = original_clusters_df.iloc[:0]
+      if args["Qoutpkl"] > 0 and len(clusters_df) > 0:
+        shards.append(args["output_pkl"][:-len(extension)]+"_s"+str(len(shards)+1)+extension)
+        nrows.append(len(clusters_df))
+        columns += [column for column in original_clusters_df.columns if column not in columns]
+        save_pickle(original_clusters_df.loc[clusters_df.index],shards[-1],1,0,args["Qcompress"])
+    if args["Qoutpkl"] == 0:
+      return
+    if len(shards) <= 1:
+      #the requested output itself (also when no rows passed, as without -chunk)
+      from os import replace
+      if len(shards) == 1:
+        replace(shards[0]+suffix, args["output_pkl"]+suffix)
+      else:
+        save_pickle(empty if empty is not None else DataFrame(),args["output_pkl"],1,Qout,args["Qcompress"])
+      if Qout >= 1:
+        print("Number of files in "+args["output_pkl"]+suffix+": "+str(sum(nrows)))
+    else:
+      write_manifest(manifest_name(args["output_pkl"]), [shard+suffix for shard in shards], nrows, columns, None if compression is None else compression["method"])
+      #(reported also with -noex, the output is not a single file)
+      print("-chunk: "+args["output_pkl"]+" saved as "+str(len(shards))+" parts "+shards[0]+suffix+" ... "+shards[-1]+suffix+" with "+str(sum(nrows))+" files, use "+manifest_name(args["output_pkl"])+" as input")
+    return
+
+  #FIRST PASS: global filter on the columns it needs
+  from filter import filter
+  needed = global_columns(args)
+  selected = []
+  rows = []
+  for clusters_df in iterate_chunks(args["input_pkl"],Qout,chunk,Qcolumns):
+    original_clusters_df, clusters_df = row_local(clusters_df, args)
+    selected.append(clusters_df.loc[:,[column for column in clusters_df.columns if column in needed or column[0] in needed]])
+    rows.append(clusters_df.index.values)
+  if len(selected) == 0:
+    return
+  selected = concat(selected, ignore_index = True)
+  if args["Qextract"] == 1 and len(selected) > 0:
+    #rows of each request across all blocks (the blocks are extracted already, extracting again only orders them)
+    from extract_clusters import extract_clusters
+    selected = extract_clusters(selected,1,args["Pextract"],args["Qclustername"],0)
+    selected = selected.loc[~selected.index.duplicated()]
+  selected = cluster_type_order(selected, args)
+  rows = concatenate(rows) if len(rows) > 0 else zeros(0, dtype = int)
+  if global_stages(args):
+    selected = filter(selected, args["Qsort"], args["Qreverse"], args["Qarbalign"], args["QMWarbalign"], args["Quniq"], args["Qsample"], args["Qclustername"], args["Qthreshold"] if len(split_cuts(args["Qcut"])[1]) > 0 else 0, split_cuts(args["Qcut"])[1], args["Qshuffle"], args["Qselect"], args["Qreacted"], args["bonddistancethreshold"], Qout, args["seed"])
+  order = rows[selected.index.values]
+  del selected
+
+  #SECOND PASS: only the selected rows are kept, in the order given by the filter
+  from numpy import isin
+  kept = []
+  originals = []
+  for clusters_df in iterate_chunks(args["input_pkl"],0,chunk,Qcolumns):
+    original_clusters_df, clusters_df = row_local(clusters_df, args)
+    clusters_df = clusters_df.loc[isin(clusters_df.index.values, order)]
+    kept.append(clusters_df)
+    if original_clusters_df is not None:
+      originals.append(original_clusters_df.loc[clusters_df.index])
+  clusters_df = concat(kept).loc[order]
+  if args["Qoutpkl"] > 0:
+    save_pickle(concat(originals).loc[order],args["output_pkl"],args["Qsplit"],Qout,args["Qcompress"],args["Qcpu"])
+  print_block(clusters_df, args)
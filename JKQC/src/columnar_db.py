@@ -0,0 +1,234 @@
+####################################################################################################
+# COLUMNAR JKQC DATABASE (.jkqc)
+# A .jkqc database is a folder with one .npy file (or a few) per column and a small columns.json.
+# Scalars are stored as typed arrays, strings as fixed-width unicode arrays, ASE structures as flat
+# positions/atomic numbers plus row offsets and lists (frequencies, forces, ...) as flat values plus
+# row offsets. Everything is loaded with mmap_mode="r", so only requested columns are ever touched.
+# Columns that do not fit any of these layouts are stored as a pickled list (read only when needed).
+####################################################################################################
+
+COLUMNAR_VERSION = 1
+
+def is_columnar(filename):
+  return filename.rstrip("/").endswith(".jkqc")
+
+def _is_missing(value):
+  return isinstance(value, float) and value != value
+
+def _column_kind(values):
+  """Decide how an object column is stored: str/structure/ragged/number/pickle"""
+  from numpy import ndarray, asarray, number
+  present = [v for v in values if not _is_missing(v) and v is not None]
+  if len(present) == 0:
+    return "number", None
+  if all(isinstance(v, str) for v in present):
+    return "str", None
+  if all(isinstance(v, (int, float, number)) and not isinstance(v, bool) for v in present):
+    return "number", None
+  try:
+    from ase import Atoms
+    if all(isinstance(v, Atoms) for v in present):
+      for v in present:
+        if v.pbc.any() or v.cell.any() or len(v.info) > 0 or v.calc is not None or len(v.constraints) > 0:
+          return "pickle", None
+      return "structure", None
+  except ImportError:
+    pass
+  if all(isinstance(v, (list, tuple, ndarray)) for v in present):
+    container = "array" if isinstance(present[0], ndarray) else "list"
+    try:
+      tails = set()
+      dtype = "int64"
+      for v in present:
+        if container == "array" and not isinstance(v, ndarray):
+          return "pickle", None
+        arr = asarray(v)
+        if arr.ndim == 0 or (arr.size > 0 and arr.dtype.kind not in "iuf"):
+          return "pickle", None
+        if arr.dtype.kind == "f":
+          dtype = "float64"
+        tails.add(arr.shape[1:])
+      if len(tails) != 1:
+        return "pickle", None
+      tail = list(tails.pop())
+      if container == "list" and len(tail) > 0 and not isinstance(present[0][0], ndarray):
+        container = "nestedlist"
+      return "ragged", {"tail": tail, "container": container, "values_dtype": dtype}
+    except (TypeError, ValueError):
+      return "pickle", None
+  return "pickle", None
+
+def save_columnar(tosave, output_jkqc):
+  """Write JKQC DataFrame to columnar .jkqc folder"""
+  from os import makedirs, path, replace
+  from shutil import rmtree
+  from json import dump
+  from numpy import save, array, asarray, zeros, concatenate, empty
+  from pickle import dump as pickle_dump
+
+  tmp_folder = output_jkqc.rstrip("/")+".tmp"
+  if path.exists(tmp_folder):
+    rmtree(tmp_folder)
+  makedirs(tmp_folder)
+
+  nrows = len(tosave)
+  meta = {"version": COLUMNAR_VERSION, "nrows": nrows, "columns": []}
+  for i, column in enumerate(tosave.columns):
+    values = tosave[column].values
+    entry = {"label": column[0], "name": column[1], "file": "c"+str(i), "dtype": str(values.dtype)}
+    prefix = tmp_folder+"/c"+str(i)
+    if values.dtype.kind in "biuf":
+      entry["kind"] = "number"
+      save(prefix+".npy", values)
+      meta["columns"].append(entry)
+      continue
+    kind, extra = _column_kind(values)
+    entry["kind"] = kind
+    mask = array([_is_missing(v) or v is None for v in values], dtype = bool)
+    if kind == "number":
+      save(prefix+".npy", array([float("nan") if m else v for v, m in zip(values, mask)], dtype = float))
+    elif kind == "str":
+      save(prefix+".npy", array(["" if m else v for v, m in zip(values, mask)], dtype = str))
+      save(prefix+".mask.npy", mask)
+    elif kind == "structure":
+      offsets = zeros(nrows+1, dtype = "int64")
+      for j in range(nrows):
+        offsets[j+1] = offsets[j] + (0 if mask[j] else len(values[j]))
+      positions = empty((offsets[-1], 3), dtype = float)
+      numbers = empty(offsets[-1], dtype = "int16")
+      for j in range(nrows):
+        if not mask[j]:
+          positions[offsets[j]:offsets[j+1]] = values[j].get_positions()
+          numbers[offsets[j]:offsets[j+1]] = values[j].get_atomic_numbers()
+      save(prefix+".positions.npy", positions)
+      save(prefix+".numbers.npy", numbers)
+      save(prefix+".offsets.npy", offsets)
+      save(prefix+".mask.npy", mask)
+    elif kind == "ragged":
+      entry.update(extra)
+      offsets = zeros(nrows+1, dtype = "int64")
+      chunks = []
+      for j in range(nrows):
+        if mask[j]:
+          offsets[j+1] = offsets[j]
+        else:
+          arr = asarray(values[j], dtype = extra["values_dtype"]).reshape([-1]+extra["tail"])
+          chunks.append(arr)
+          offsets[j+1] = offsets[j] + len(arr)
+      flat = concatenate(chunks) if len(chunks) > 0 else empty([0]+extra["tail"], dtype = extra["values_dtype"])
+      save(prefix+".values.npy", flat)
+      save(prefix+".offsets.npy", offsets)
+      save(prefix+".mask.npy", mask)
+    else:
+      with open(prefix+".pkl", "wb") as f:
+        pickle_dump(list(values), f)
+    meta["columns"].append(entry)
+
+  with open(tmp_folder+"/columns.json", "w") as f:
+    dump(meta, f)
+  if path.exists(output_jkqc):
+    rmtree(output_jkqc)
+  replace(tmp_folder, output_jkqc)
+
+def columnar_columns(input_jkqc):
+  """Return list of (label,name) columns stored in .jkqc folder without loading any data"""
+  from json import load
+  with open(input_jkqc+"/columns.json", "r") as f:
+    meta = load(f)
+  return [(c["label"], c["name"]) for c in meta["columns"]]
+
+def columnar_nrows(input_jkqc):
+  from json import load
+  with open(input_jkqc+"/columns.json", "r") as f:
+    return load(f)["nrows"]
+
+def _wanted(column, columns, exclude = None):
+  if exclude is not None and (column in exclude or column[0] in exclude):
+    return False
+  if columns is None:
+    return True
+  return column in columns or column[0] in columns
+
+def _load_column(input_jkqc, entry, nrows, rows = None):
+  from numpy import load, empty, arange
+  prefix = input_jkqc+"/"+entry["file"]
+  kind = entry["kind"]
+  if kind == "number":
+    values = load(prefix+".npy", mmap_mode = "r")
+    if rows is not None:
+      values = values[rows]
+    if entry["dtype"] == "object":
+      values = values.astype(object)
+    return values
+  if rows is None:
+    rows = arange(nrows)
+  column = empty(len(rows), dtype = object)
+  if kind == "pickle":
+    from pickle import load as pickle_load
+    with open(prefix+".pkl", "rb") as f:
+      allvalues = pickle_load(f)
+    for j, row in enumerate(rows):
+      column[j] = allvalues[row]
+    return column
+  mask = load(prefix+".mask.npy", mmap_mode = "r")
+  if kind == "str":
+    values = load(prefix+".npy", mmap_mode = "r")
+    for j, row in enumerate(rows):
+      column[j] = float("nan") if mask[row] else str(values[row])
+  elif kind == "structure":
+    from ase import Atoms
+    positions = load(prefix+".positions.npy", mmap_mode = "r")
+    numbers = load(prefix+".numbers.npy", mmap_mode = "r")
+    offsets = load(prefix+".offsets.npy")
+    for j, row in enumerate(rows):
+      if mask[row]:
+        column[j] = float("nan")
+      else:
+        column[j] = Atoms(numbers = numbers[offsets[row]:offsets[row+1]], positions = positions[offsets[row]:offsets[row+1]])
+  elif kind == "ragged":
+    values = load(prefix+".values.npy", mmap_mode = "r")
+    offsets = load(prefix+".offsets.npy")
+    container = entry["container"]
+    for j, row in enumerate(rows):
+      if mask[row]:
+        column[j] = float("nan")
+        continue
+      arr = values[offsets[row]:offsets[row+1]].copy()
+      if container == "array":
+        column[j] = arr
+      elif container == "nestedlist":
+        column[j] = arr.tolist()
+      else:
+        column[j] = list(arr) if arr.ndim > 1 else arr.tolist()
+  return column
+
+def load_columnar(input_jkqc, columns = None, rows = None, exclude = None):
+  """Load .jkqc folder into JKQC DataFrame
+  columns = None (all) or list of (label,name) tuples and/or labels, e.g. [("log","electronic_energy"),"info"]
+  rows    = None (all) or array of row positions to be loaded
+  exclude = columns/labels that should not be loaded
+  """
+  from json import load
+  from pandas import DataFrame, MultiIndex
+  with open(input_jkqc+"/columns.json", "r") as f:
+    meta = load(f)
+  if meta["version"] > COLUMNAR_VERSION:
+    print("The database "+input_jkqc+" was written by a newer JKQC version. [EXITING]")
+    exit()
+  nrows = meta["nrows"]
+  data = {}
+  for entry in meta["columns"]:
+    column = (entry["label"], entry["name"])
+    if _wanted(column, columns, exclude):
+      data[column] = _load_column(input_jkqc, entry, nrows, rows)
+  clusters_df = DataFrame(data, index = range(nrows if rows is None else len(rows)), copy = False)
+  if len(data) > 0:
+    clusters_df.columns = MultiIndex.from_tuples(list(data.keys()))
+  return clusters_df
+
+def pkl2columnar(input_pkl, output_jkqc):
+  from pandas import read_pickle
+  save_columnar(read_pickle(input_pkl).reset_index(drop = True), output_jkqc)
+
+def columnar2pkl(input_jkqc, output_pkl):
+  load_columnar(input_jkqc).to_pickle(output_pkl)
@@ -67,20 +67,6 @@ def fitPlaneSVD(XYZ, res):
     
     return refined_plane_coeffs
 
-def mergeDictionary(dict_1, dict_2):
-  if len(dict_1) == 0:
-    return dict_2
-  dict_3 = {**dict_1, **dict_2}
-  for key, value in dict_3.items():
-    if key in dict_1 and key in dict_2:
-      dict_3[key] = value + dict_1[key]
-    elif key in dict_1:
-      dict_3[key] = [float("nan")] + value
-    else:
-      ml = max([len(x) for x in dict_1.values()])
-      dict_3[key] = value + ml*[float("nan")]
-  return dict_3
-
 def data_modification(clusters_df, Qunderscore, Qrename, Qclustername, QrenameWHAT, Qiamifo, Qrebasename, Qdrop, Qout2log,Qpresplit,Qindex, seed,Qatomize):
 
   #SPLIT THE DATABASE AT START  
@@ -206,7 +192,8 @@ def data_modification(clusters_df, Qunderscore, Qrename, Qclustername, QrenameWH
       overall_counts_new.append(toappend)
     if ('log','electronic_energy') in clusters_df:
       fitted = fitPlaneSVD(overall_counts_new,overall_properties)
-    mons_dic = {}
+    from row_builder import RowBuilder
+    mons_rows = RowBuilder()
     from numpy import array
     from ase import Atoms
     for i in range(len(overall_symbols_new)):
@@ -221,9 +208,8 @@ def data_modification(clusters_df, Qunderscore, Qrename, Qclustername, QrenameWH
       if ('log','electronic_energy') in clusters_df:
         dic.update({("log","electronic_energy"):[fitted[i]]})
       dic.update({("xyz","structure"):[Atoms(overall_symbols_new[i], positions = [[0,0,0]])]})
-      mons_dic = mergeDictionary(mons_dic,dic)
-    from pandas import DataFrame
-    mons_df = DataFrame(mons_dic,index=range(len(overall_symbols_new)))
+      mons_rows.append(dic)
+    mons_df = mons_rows.finalize(reverse = True)
     mons_df.to_pickle("atoms.pkl")
   elif Qatomize == 2:
     for cluster_id in clusters_df.index:
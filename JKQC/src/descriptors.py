@@ -0,0 +1,94 @@
+####################################################################################################
+# STRUCTURAL DESCRIPTORS
+# Radius of gyration, total mass and number of bonded atom pairs shared by filter_uniq, filter_sort,
+# filter_threshold and print_output. Instead of looping over the ASE structures one by one, clusters
+# with the same number of atoms are stacked into (clusters x atoms x 3) arrays and the descriptors
+# are evaluated for the whole stack at once (distances chunked to keep the memory bounded).
+# Computed values are memoized as ("cache",<name>) columns of the DataFrame, so e.g. -uniq rg,g
+# followed by -cut rg evaluates Rg only once. The cache columns are never saved into output pickles
+# (those are taken from the original copy of the database).
+####################################################################################################
+
+STRUCTURE = ("xyz","structure")
+missing = float("nan")
+
+def stack_structures(structures):
+  """Group structures by number of atoms: yields rows, positions (g,n,3), masses (g,n), atomic numbers (g,n)"""
+  from numpy import array, unique
+  from ase import Atoms
+  rows = [r for r, s in enumerate(structures) if isinstance(s, Atoms)]
+  if len(rows) == 0:
+    return
+  natoms = array([len(structures[r]) for r in rows])
+  rows = array(rows)
+  for n in unique(natoms):
+    group = rows[natoms == n]
+    atoms = [structures[r] for r in group]
+    positions = array([s.positions for s in atoms], dtype = float).reshape(len(group), n, 3)
+    masses = array([s.get_masses() for s in atoms], dtype = float).reshape(len(group), n)
+    numbers = array([s.numbers for s in atoms]).reshape(len(group), n)
+    yield group, positions, masses, numbers
+
+def radius_of_gyration(structures):
+  """Mass-weighted radius of gyration of each structure (NaN if missing)"""
+  from numpy import full, errstate
+  result = full(len(structures), missing)
+  with errstate(all = "ignore"):
+    for rows, positions, masses, numbers in stack_structures(structures):
+      total = masses.sum(axis = 1)
+      com = (masses[:,:,None]*positions).sum(axis = 1)/total[:,None]
+      result[rows] = ((((positions-com[:,None,:])**2).sum(axis = -1)*masses).sum(axis = 1)/total)**0.5
+  return result
+
+def total_mass(structures):
+  """Sum of atomic masses of each structure (NaN if missing)"""
+  from numpy import full
+  result = full(len(structures), missing)
+  for rows, positions, masses, numbers in stack_structures(structures):
+    result[rows] = masses.sum(axis = 1)
+  return result
+
+def bonded_count(structures, threshold, element1, element2, chunk = 4000000):
+  """Number of element1-element2 pairs closer than threshold [Angstrom] in each structure (NaN if missing)
+  For element1 == element2 each pair is counted once and an atom is not bonded to itself."""
+  from numpy import full
+  from ase.data import atomic_numbers
+  result = full(len(structures), missing)
+  threshold = float(threshold)
+  number1 = atomic_numbers.get(str(element1), -1)
+  number2 = atomic_numbers.get(str(element2), -1)
+  for rows, positions, masses, numbers in stack_structures(structures):
+    mask1 = numbers == number1
+    mask2 = numbers == number2
+    n = positions.shape[1]
+    step = max(1, chunk//max(1, n*n))
+    for start in range(0, len(rows), step):
+      p = positions[start:start+step]
+      d = (((p[:,:,None,:]-p[:,None,:,:])**2).sum(axis = -1))**0.5
+      pairs = mask2[start:start+step,:,None] & mask1[start:start+step,None,:]
+      bonds = ((d <= threshold) & pairs).sum(axis = (1,2))
+      if str(element1) == str(element2):
+        bonds = (bonds - mask1[start:start+step].sum(axis = 1))//2
+      result[rows[start:start+step]] = bonds
+  return result
+
+DESCRIPTORS = {
+  "rg"     : radius_of_gyration,
+  "mass"   : total_mass,
+  "bonded" : bonded_count,
+}
+
+def descriptor(clusters_df, name, *args, index = None):
+  """Values of descriptor name (rg/mass/bonded + its arguments) for rows index (default = all rows)
+  Computed once for all rows of clusters_df and cached in the column ("cache",name[_arg...])."""
+  column = ("cache", "_".join([name]+[str(arg) for arg in args]))
+  if column not in clusters_df.columns:
+    if STRUCTURE in clusters_df.columns:
+      values = DESCRIPTORS[name](clusters_df.loc[:,STRUCTURE].values, *args)
+    else:
+      from numpy import full
+      values = full(len(clusters_df), missing)
+    clusters_df[column] = values
+  if index is None:
+    return clusters_df.loc[:,column].values
+  return clusters_df.loc[index,column].values
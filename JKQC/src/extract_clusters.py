@@ -176,13 +176,79 @@ def my_special_compare_with_asterix(string1,string2_array,howmany,what):
   else:
     return False
 
+def normalize_cluster_type(cluster_type):
+  """1w0b1sa -> 1sa1w (components sorted by name, zero counts removed); other strings are kept"""
+  try:
+    cluster_type_array = seperate_string_number(cluster_type)
+  except:
+    return cluster_type
+  if is_nameable(cluster_type_array):
+    cluster_type_2array_sorted = sorted([cluster_type_array[i:i + 2] for i in range(0, len(cluster_type_array), 2)],key=lambda x: x[1])
+    cluster_type_array_sorted = [item for sublist in cluster_type_2array_sorted for item in sublist]
+    return zeros(cluster_type_array_sorted)
+  return cluster_type
+
+def inverted_index(values):
+  """Unique values (NaN excluded) and the row positions of each of them (in row order)"""
+  from pandas import factorize
+  from numpy import argsort, bincount, cumsum, split
+  codes, uniques = factorize(values)
+  order = argsort(codes, kind = "stable")
+  groups = split(order, cumsum(bincount(codes+1, minlength = len(uniques)+1))[:-1])
+  return list(uniques), groups[1:]
+
+def component_counts(cluster_types):
+  """Component-count matrix of nameable cluster types: matrix (types x names), names and nameable flags"""
+  from numpy import zeros as npzeros, array
+  parsed = []
+  for cluster_type in cluster_types:
+    try:
+      cluster_type_array = seperate_string_number(cluster_type)
+    except:
+      cluster_type_array = []
+    if len(cluster_type_array) > 0 and is_nameable(cluster_type_array):
+      parsed.append({cluster_type_array[i+1]:int(cluster_type_array[i]) for i in range(0, len(cluster_type_array), 2)})
+    else:
+      parsed.append(None)
+  names = sorted(set(name for components in parsed if components is not None for name in components))
+  columns = {name:i for i, name in enumerate(names)}
+  counts = npzeros((len(cluster_types),len(names)), dtype = int)
+  for i, components in enumerate(parsed):
+    if components is not None:
+      for name, count in components.items():
+        counts[i,columns[name]] += count
+  return counts, names, array([components is not None for components in parsed], dtype = bool)
+
+def match_asterix(cluster_types, counts, names, nameable, new_extract_i, howmany, what):
+  """my_special_compare_with_asterix() for all cluster types at once (vectorized on the component-count matrix)"""
+  from numpy import array
+  if not is_nameable(new_extract_i):
+    return array([my_special_compare_with_asterix(cluster_type,new_extract_i,howmany,what) for cluster_type in cluster_types], dtype = bool)
+  pattern = {new_extract_i[i+1]:int(new_extract_i[i]) for i in range(0, len(new_extract_i), 2)}
+  ok = nameable.copy()
+  in_pattern = array([name in pattern for name in names], dtype = bool)
+  for name, count in pattern.items():
+    if name in names:
+      ok &= counts[:,names.index(name)] == count
+    else:
+      ok[:] = False
+  extra = counts[:,~in_pattern]
+  if len(what) > 0 and what[0] == "whatever":
+    if howmany >= 0:
+      ok &= extra.sum(axis = 1) == howmany
+  else:
+    allowed = array([name in what for name in names], dtype = bool)[~in_pattern]
+    ok &= ~((extra > 0) & ~allowed).any(axis = 1)
+  #strings which are not cluster names are compared as before
+  for i in (~nameable).nonzero()[0]:
+    ok[i] = my_special_compare_with_asterix(cluster_types[i],new_extract_i,howmany,what)
+  return ok
+
 ###########################################################
 ###########################################################
 ###########################################################
 
 def extract_clusters(clusters_df,Qextract,Pextract,Qclustername,Qout):
-  from pandas import DataFrame,concat
-  from re import split
 
   #COMMA SEPARATED 
   # 1sa,2sa-02 -> ["1sa","2sa-02"]
@@ -235,66 +301,70 @@ def extract_clusters(clusters_df,Qextract,Pextract,Qclustername,Qout):
     Pextract_ultimate = unique(Pextract_final)
 
   #JK note: I got once fucked up that this was not sorted so I am sorting it here:
-  for index in clusters_df.index:
-    file_basename_split = clusters_df.loc[index,("info","cluster_type")]
-    split_numbers_letters = split('(\d+)',file_basename_split)[1:]
-    cluster_type_array = seperate_string_number(file_basename_split)
-    if is_nameable(cluster_type_array):
-      cluster_type_2array_sorted = sorted([cluster_type_array[i:i + 2] for i in range(0, len(cluster_type_array), 2)],key=lambda x: x[1])
-      cluster_type_array_sorted = [item for sublist in cluster_type_2array_sorted for item in sublist]
-      cluster_type = zeros(cluster_type_array_sorted)
-      clusters_df.loc[index,("info","cluster_type")] = cluster_type    
+  #(every distinct cluster type is normalized only once)
+  from numpy import array, concatenate, ones, sort
+  if ("info","cluster_type") in clusters_df.columns:
+    cluster_types, cluster_rows = inverted_index(clusters_df.loc[:,("info","cluster_type")].values)
+    normalized = clusters_df.loc[:,("info","cluster_type")].values.copy()
+    for cluster_type, rows in zip(cluster_types, cluster_rows):
+      normalized[rows] = normalize_cluster_type(cluster_type)
+    clusters_df[("info","cluster_type")] = normalized
+
+  #INVERTED INDEX: (normalized) name -> row positions
+  if Qclustername == 0:
+    index_names, index_rows = inverted_index(clusters_df.loc[:,("info","file_basename")].values)
+  else:
+    index_names, index_rows = inverted_index(clusters_df.loc[:,("info","cluster_type")].values)
+  index = dict(zip(index_names, index_rows))
 
   #SEARCHING FOR CLUSTERS IN THE DATABASE
-  newclusters_df = DataFrame()
+  extracted = []
+  counts = None
   for extract_i in Pextract_ultimate: 
-    if Qclustername == 0:
-      extracted_df = clusters_df[clusters_df["info"]["file_basename"].values == extract_i].copy()
+    if Qclustername == 0 or "*" not in extract_i:
+      if extract_i in index:
+        extracted.append(index[extract_i])
     else:
-      if "*" not in extract_i:
-        extracted_df = clusters_df[clusters_df["info"]["cluster_type"].values == extract_i].copy()
-      else:
+      try:
+        asterix_position=seperate_string_number(extract_i)[1::2].index('*')
+        new_extract_i=seperate_string_number(extract_i)[:2*asterix_position]+seperate_string_number(extract_i)[asterix_position*2+1+1:]
         try:
-          asterix_position=seperate_string_number(extract_i)[1::2].index('*')
-          new_extract_i=seperate_string_number(extract_i)[:2*asterix_position]+seperate_string_number(extract_i)[asterix_position*2+1+1:]
-          try:
-            howmany=int(extract_i[asterix_position*2])
-          except:
-            howmany=-1
-          what=["whatever"]
+          howmany=int(extract_i[asterix_position*2])
         except:
-          what=[]
-          while 1==1:
+          howmany=-1
+        what=["whatever"]
+      except:
+        what=[]
+        while 1==1:
+          try:
+            asterix_position=seperate_string_number(extract_i)[::2].index('*')
             try:
-              asterix_position=seperate_string_number(extract_i)[::2].index('*')
-              try:
-                if len(asterix_position)>1:
-                  asterix_position=asterix_position[0]
-              except:
-                howmany=-1
-              new_extract_i=seperate_string_number(extract_i)[:2*asterix_position]+seperate_string_number(extract_i)[asterix_position*2+1+1:]
-              howmany=-1
-              what.append(seperate_string_number(extract_i)[asterix_position*2+1])
-              extract_i=new_extract_i
+              if len(asterix_position)>1:
+                asterix_position=asterix_position[0]
             except:
-              break
-        extracted_df = clusters_df[[my_special_compare_with_asterix(value_i,new_extract_i,howmany,what) for value_i in clusters_df["info"]["cluster_type"].values]].copy()
-   
-    if len(extracted_df) > 0:
-      if len(newclusters_df) == 0:
-        newclusters_df = extracted_df.copy()
-      else:
-        newclusters_df = concat([newclusters_df, extracted_df.copy()], axis=0, ignore_index=False)
+              howmany=-1
+            new_extract_i=seperate_string_number(extract_i)[:2*asterix_position]+seperate_string_number(extract_i)[asterix_position*2+1+1:]
+            howmany=-1
+            what.append(seperate_string_number(extract_i)[asterix_position*2+1])
+            extract_i=new_extract_i
+          except:
+            break
+      if counts is None:
+        counts, names, nameable = component_counts(index_names)
+      matched = match_asterix(index_names, counts, names, nameable, new_extract_i, howmany, what)
+      if matched.any():
+        extracted.append(sort(concatenate([index_rows[i] for i in matched.nonzero()[0]])))
   
   #RETURNING CLUSTERS_DF
   prelen=len(clusters_df)
+  extracted = concatenate(extracted) if len(extracted) > 0 else array([], dtype = int)
   if Qextract == 2:
-    from pandas import Index
-    a1 = Index(clusters_df.index)
-    a2 = Index(newclusters_df.index)
-    clusters_df = clusters_df.iloc[a1.difference(a2, sort=False)]
+    keep = ones(len(clusters_df), dtype = bool)
+    keep[extracted] = False
+    clusters_df = clusters_df.iloc[keep.nonzero()[0]]
   else:
-    clusters_df = newclusters_df.copy()
+    #rows of each request in the order of the requests, rows within a request in the database order
+    clusters_df = clusters_df.iloc[extracted].copy()
   if Qout >= 1:
     print("Extracting: "+str(prelen)+" --> "+str(len(clusters_df)))
  
@@ -68,3 +68,44 @@ def filter(clusters_df, Qsort, Qreverse, Qarbalign, QMWarbalign, Quniq, Qsample,
     clusters_df = clusters_df.sample(frac=1, random_state=seed)
   
   return clusters_df
+
+def prefilter(Qsort, Qreverse, Qarbalign, QMWarbalign, Quniq, Qsample, Qclustername, Qthreshold, Qcut, Qshuffle, Qselect, Qreacted, bonddistancethreshold, seed):
+  """Filter applied to each input database separately before concatenation (-lowmem)
+  Only the stages for which filtering every part and then the whole gives the same result as filtering
+  the whole are used: absolute cuts, a leading relative cut of type < or <= (the minimum of a part is never
+  lower), uniqueness (the first occurrence is the first in its part) and selection of the best ones.
+  A stage which keeps more than needed ends the chain. Returns None if no stage can be used."""
+  nan_strings = ["nan","NA","na","NaN"]
+  def value(cut):
+    return cut[4] if cut[2] == "bonded" else cut[3]
+  exact = True
+  pre_threshold, pre_cut, pre_uniq, pre_select = 0, Qcut, "0", "0"
+  if Qthreshold != 0:
+    if all(cut[1] != "relative" for cut in Qcut):
+      pre_threshold = Qthreshold
+    elif Qcut[0][0] in ["<","<="] and value(Qcut[0]) not in nan_strings and all(cut[1] != "relative" for cut in Qcut[1:]):
+      #only the relative cut (the absolute ones could remove the global minimum of the part before it)
+      pre_threshold = Qthreshold
+      pre_cut = Qcut[:1]
+      exact = False
+    else:
+      exact = False
+  if exact and str(Quniq) != "0" and Qsample == 0:
+    pre_uniq = Quniq
+    exact = False
+  elif str(Quniq) != "0":
+    exact = False
+  if exact and Qreacted == 0 and Qarbalign == 0 and QMWarbalign == 0 and str(Qselect) != "0":
+    pre_select = Qselect
+  if pre_threshold == 0 and str(pre_uniq) == "0" and str(pre_select) == "0":
+    return None
+  def apply(clusters_df):
+    clusters_df = filter(clusters_df, "no", Qreverse, 0, 0, pre_uniq, 0, Qclustername, pre_threshold, pre_cut, 0, "0", 0, bonddistancethreshold, 0, seed)
+    #(selection from an empty part would stop JKQC)
+    if str(pre_select) != "0" and len(clusters_df) > 0:
+      clusters_df = filter(clusters_df, Qsort, Qreverse, 0, 0, "0", 0, Qclustername, 0, Qcut, 0, pre_select, 0, bonddistancethreshold, 0, seed)
+    #cached descriptors are not part of the database
+    if "cache" in clusters_df.columns.get_level_values(0):
+      clusters_df = clusters_df.drop(["cache"], axis=1, level=0)
+    return clusters_df
+  return apply
@@ -1,8 +1,181 @@
+####################################################################################################
+# ARBALIGN FILTERING
+# Structures are compared with ArbAlign only if they can be closer than the RMSD threshold.
+# For each structure, the distances of the atoms from the (mass-weighted) centroid are sorted and
+# scaled such that the Euclidean distance between two such fingerprints is a lower bound of the
+# ArbAlign RMSD (rotations, reflections and atom permutations keep these distances). The pairs are
+# found with a KD-tree on a few block norms of the fingerprints (also a lower bound), checked with
+# the full fingerprints and only the remaining pairs go through the full ArbAlign comparison.
+# The structures are placed once into shared memory and the pairs are sent in batches to one
+# pool of workers which lives for the whole run. Results are applied in the order of the pairs,
+# so the kept structures are the same as when comparing one reference after another.
+####################################################################################################
+
+def arbalign_fingerprints(structures, mass_weighted = 0):
+  """Group keys of comparable structures (None if missing) and the lower-bound fingerprints
+  RMSD: all atoms sorted by distance from the centroid, scaled by 1/sqrt(N) (valid for any atom permutation)
+  MW-RMSD: sqrt(mass fraction)*distance from the mass-weighted centroid sorted within each element (valid for
+  structures with the same order of elements, i.e., the same key)"""
+  from numpy import sqrt, sort, lexsort, take_along_axis, arange
+  from ase.data import atomic_masses
+  from descriptors import stack_structures
+  keys = [None]*len(structures)
+  fingerprints = [None]*len(structures)
+  for rows, positions, masses, numbers in stack_structures(structures):
+    N = positions.shape[1]
+    if N == 0:
+      continue
+    if mass_weighted:
+      w = atomic_masses[numbers]
+      w = w/w.sum(axis = 1)[:,None]
+      centered = positions - (positions*w[:,:,None]).sum(axis = 1)[:,None,:]
+      r = sqrt(w)*sqrt((centered**2).sum(axis = -1))
+      F = take_along_axis(r, lexsort((r, numbers)), axis = 1)
+    else:
+      centered = positions - positions.mean(axis = 1)[:,None,:]
+      F = sort(sqrt((centered**2).sum(axis = -1)), axis = 1)/sqrt(N)
+    for k in arange(len(rows)):
+      composition = tuple(sort(numbers[k]))
+      keys[rows[k]] = (composition, tuple(numbers[k])) if mass_weighted else composition
+      fingerprints[rows[k]] = F[k]
+  return keys, fingerprints
+
+def arbalign_candidates(structures, comparison_threshold, mass_weighted = 0, chunk = 100000):
+  """For each structure i, the sorted list of structures j > i which can have RMSD < comparison_threshold"""
+  from numpy import array, sqrt, array_split, arange, stack
+  from scipy.spatial import cKDTree
+  keys, fingerprints = arbalign_fingerprints(structures, mass_weighted)
+  #tiny tolerance so that rounding of the bounds never drops a pair at the threshold
+  limit = comparison_threshold*(1+1e-8)
+  candidates = [set() for i in range(len(structures))]
+  groups = {}
+  for i, key in enumerate(keys):
+    if key is not None:
+      groups.setdefault(key, []).append(i)
+
+  for key, members in groups.items():
+    if len(members) < 2:
+      continue
+    members = array(members)
+    F = array([fingerprints[i] for i in members])
+    blocks = array_split(arange(F.shape[1]), min(8, F.shape[1]))
+    P = stack([sqrt((F[:,block]**2).sum(axis = 1)) for block in blocks], axis = 1)
+    pairs = cKDTree(P).query_pairs(limit, output_type = "ndarray")
+    for start in range(0, len(pairs), chunk):
+      part = pairs[start:start+chunk]
+      bound = sqrt(((F[part[:,0]] - F[part[:,1]])**2).sum(axis = 1))
+      for i, j in members[part[bound < limit]]:
+        candidates[min(i, j)].add(max(i, j))
+
+  if mass_weighted:
+    #structures with the same composition but a different order of atoms are always compared
+    orders = {}
+    for key, members in groups.items():
+      orders.setdefault(key[0], []).append(members)
+    for composition, same in orders.items():
+      for a in range(len(same)):
+        for b in range(a+1, len(same)):
+          for i in same[a]:
+            for j in same[b]:
+              candidates[min(i, j)].add(max(i, j))
+  return [sorted(c) for c in candidates]
+
+_shared = {}
+
+def arbalign_share(structures):
+  """Place positions, atomic numbers and atom offsets of all structures into shared memory
+  Returns the SharedMemory blocks (to be closed/unlinked), their specification for the workers and the arrays"""
+  from multiprocessing import shared_memory
+  from numpy import ndarray, zeros, concatenate, cumsum, float64, int64
+  from ase import Atoms
+  natoms = [len(s) if isinstance(s, Atoms) else 0 for s in structures]
+  offsets = zeros(len(structures)+1, dtype = int64)
+  offsets[1:] = cumsum(natoms)
+  present = [s for s in structures if isinstance(s, Atoms) and len(s) > 0]
+  arrays = {
+    "positions" : concatenate([s.positions for s in present]).astype(float64) if len(present) > 0 else zeros((0,3), dtype = float64),
+    "numbers"   : concatenate([s.numbers for s in present]).astype(int64) if len(present) > 0 else zeros(0, dtype = int64),
+    "offsets"   : offsets,
+  }
+  blocks = []
+  spec = {}
+  for name, array in arrays.items():
+    block = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+    ndarray(array.shape, dtype = array.dtype, buffer = block.buf)[...] = array
+    blocks.append(block)
+    spec[name] = (block.name, array.shape, array.dtype.str)
+  return blocks, spec, arrays
+
+def arbalign_init(spec, mass_weighted, arrays = None):
+  """Worker initializer: attach the shared structures (or use the given arrays when running in this process)"""
+  from multiprocessing import shared_memory
+  from numpy import ndarray
+  _shared.clear()
+  _shared["blocks"] = []
+  for name, (block_name, shape, dtype) in spec.items():
+    if arrays is not None:
+      _shared[name] = arrays[name]
+      continue
+    block = shared_memory.SharedMemory(name = block_name)
+    _shared["blocks"].append(block)
+    _shared[name] = ndarray(shape, dtype = dtype, buffer = block.buf)
+  _shared["mass_weighted"] = mass_weighted
+  _shared["cache"] = {}
+
+def arbalign_atoms(i):
+  """ASE Atoms of the shared structure i (the last two are kept)"""
+  from ase import Atoms
+  if i not in _shared["cache"]:
+    offsets = _shared["offsets"]
+    if len(_shared["cache"]) > 1:
+      _shared["cache"].clear()
+    _shared["cache"][i] = Atoms(numbers = _shared["numbers"][offsets[i]:offsets[i+1]], positions = _shared["positions"][offsets[i]:offsets[i+1]])
+  return _shared["cache"][i]
+
+def arbalign_batch(pairs):
+  """ArbAlign RMSDs of a batch of (i, j) pairs of the shared structures"""
+  from ArbAlign import compare
+  return [compare(arbalign_atoms(i), arbalign_atoms(j), mass_weighted = _shared["mass_weighted"]) for i, j in pairs]
+
+def arbalign_stream(candidates, rows, comparison_threshold, pool = None, batch_size = 1, window = 1):
+  """Greedy removal: j is removed if it is closer than the threshold to a kept structure i < j
+  Pairs (i, j) go out in batches (ordered by i, j) skipping structures removed so far and the results are applied
+  in the same order, which gives the same outcome as comparing one reference after another."""
+  from collections import deque
+  from numpy import zeros
+  removed = zeros(len(candidates), dtype = bool)
+  stream = ((i, j) for i in range(len(candidates)) for j in candidates[i])
+  pending = deque()
+
+  def submit():
+    batch = []
+    for i, j in stream:
+      if removed[i] or removed[j]:
+        continue
+      batch.append((i, j))
+      if len(batch) == batch_size:
+        break
+    if len(batch) == 0:
+      return False
+    tasks = [(rows[i], rows[j]) for i, j in batch]
+    pending.append((batch, pool.apply_async(arbalign_batch, (tasks,)) if pool is not None else arbalign_batch(tasks)))
+    return True
+
+  while True:
+    while len(pending) < window and submit():
+      pass
+    if len(pending) == 0:
+      break
+    batch, result = pending.popleft()
+    rmsds = result.get() if pool is not None else result
+    for (i, j), rmsd in zip(batch, rmsds):
+      if not removed[i] and not removed[j] and rmsd < comparison_threshold:
+        removed[j] = True
+  return removed
+
 def filter_arbalign(clusters_df,Qclustername,Qarbalign,QMWarbalign,Qout):
-  from joblib import Parallel, delayed
   from os import environ
-
-  missing = float("nan")
+  from numpy import arange
 
   try:
     num_cores = int(environ['SLURM_JOB_CPUS_PER_NODE'])
@@ -14,6 +187,7 @@ def filter_arbalign(clusters_df,Qclustername,Qarbalign,QMWarbalign,Qout):
     comparison_threshold = Qarbalign
   else:
     comparison_threshold = QMWarbalign
+  mass_weighted = 1 if QMWarbalign > 0 else 0
 
   if Qclustername != 0:
     from numpy import unique
@@ -22,44 +196,46 @@ def filter_arbalign(clusters_df,Qclustername,Qarbalign,QMWarbalign,Qout):
     uniqueclusters = "1"
 
   original_length = len(clusters_df)
-  myNaN = lambda x : missing if x == "NaN" else x
-  global preselected_df,comparepairs,allindexes
-
-  def compare_pair(arg):
-    from ArbAlign import compare
-    tobecompared = comparepairs[arg]
-    AAci = preselected_df.loc[allindexes[tobecompared[0]],("xyz","structure")]
-    AAcj = preselected_df.loc[allindexes[tobecompared[1]],("xyz","structure")]
-    if QMWarbalign > 0:
-      return compare(AAci,AAcj,mass_weighted=1)
-    else:
-      return compare(AAci,AAcj)
+  structures = clusters_df.loc[:,("xyz","structure")].values
 
+  #cheap lower bounds first, only candidate pairs are aligned
+  tosearch = []
   for i in uniqueclusters:
-     if Qclustername != 0:
-       preselected_df = clusters_df.loc[clusters_df.loc[:,("info","cluster_type")] == i]
-     else:
-       preselected_df = clusters_df
-     allindexes = preselected_df.index
-     removedindexes = []
-     for AAi in range(len(allindexes)):
-       if allindexes[AAi] in removedindexes:
-         continue
-       comparepairs = []
-       for AAj in range(AAi+1,len(allindexes)):
-         if allindexes[AAj] in removedindexes:
-           continue
-         pair = [AAi,AAj]
-         comparepairs.append(pair)
-       comparison = Parallel(n_jobs=num_cores)(delayed(compare_pair)(i) for i in range(len(comparepairs)))
-       for AAc in range(len(comparison)):
-         if comparison[AAc] < comparison_threshold:
-           removedindexes.append(allindexes[comparepairs[AAc][1]])
-     clusters_df = clusters_df.drop(removedindexes)
+    if Qclustername != 0:
+      rows = arange(len(clusters_df))[clusters_df.loc[:,("info","cluster_type")].values == i]
+    else:
+      rows = arange(len(clusters_df))
+    tosearch.append([rows, arbalign_candidates(structures[rows], comparison_threshold, mass_weighted)])
+  npairs = sum(len(c) for rows, candidates in tosearch for c in candidates)
+
+  #one pool for the whole run, structures in shared memory
+  blocks, spec, arrays = arbalign_share(structures)
+  pool = None
+  try:
+    if num_cores > 1 and npairs > 1:
+      from multiprocessing import Pool
+      pool = Pool(num_cores, initializer = arbalign_init, initargs = (spec, mass_weighted))
+      batch_size = max(1, min(256, npairs//(4*num_cores)))
+      window = 2*num_cores
+    else:
+      arbalign_init(spec, mass_weighted, arrays)
+      batch_size = 1
+      window = 1
+    removedindexes = []
+    for rows, candidates in tosearch:
+      removed = arbalign_stream(candidates, rows, comparison_threshold, pool, batch_size, window)
+      removedindexes += list(clusters_df.index[rows[removed]])
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+    _shared.clear()
+    for block in blocks:
+      block.close()
+      block.unlink()
+  clusters_df = clusters_df.drop(removedindexes)
 
   if Qout >= 1:
     print("ArbAlign: "+str(original_length)+" --> "+str(len(clusters_df)))
 
   return clusters_df
-
-
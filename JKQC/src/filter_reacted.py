@@ -1,112 +1,119 @@
-def bonded(x,xA,xB, bonddistancethreshold = 2.0):
-  #Are two atoms bonded?
-  if xA == "C" and xB == "N" and x < 1.75:
-    return 1
-  elif xA == "N" and xB == "C" and x < 1.75:
-    return 1
-  elif xA == "N" and xB == "N" and x < 1.5:
-    return 1
-  elif xA == "S" and xB == "O" and x < 1.9:
-    return 1
-  elif xA == "O" and xB == "S" and x < 1.9:
-    return 1
-  elif xA == "O" and xB == "N" and x < 1.9:
-    return 1
-  elif xA == "N" and xB == "O" and x < 1.9:
-    return 1
-  elif xA == "H" or xB == "H":
-    if xA == "H" and xB == "H" and x < 0.8:
-      return 1
-    else:
-      return 0
-  elif x < bonddistancethreshold:
-    return 1
-  else:
-    return 0
+####################################################################################################
+# REACTED STRUCTURES
+# Structures are split into molecules (connected components of the bond graph) and the most common
+# set of molecular formulas within each cluster type is taken as the non-reacted one. Same-size
+# structures are stacked: distances are evaluated by broadcasting, compared with an element-pair
+# cutoff table and the components of a whole stack are found by one csgraph call on the
+# block-diagonal bond graph. Formulas are kept as integer ids instead of strings.
+####################################################################################################
+
+def bond_cutoff(xA, xB, bonddistancethreshold = 2.0):
+  """Atoms xA and xB are bonded if their distance is below this value"""
+  special = {("C","N"):1.75, ("N","N"):1.5, ("S","O"):1.9, ("O","N"):1.9}
+  if xA == "H" or xB == "H":
+    #H is bonded only to H
+    return 0.8 if xA == "H" and xB == "H" else 0.0
+  cutoff = special.get((xA,xB), special.get((xB,xA)))
+  if cutoff is None:
+    return bonddistancethreshold
+  #the special distances are tested first, then the general threshold
+  return max(cutoff, bonddistancethreshold)
 
-def most_frequent(List):
-  return max(set(List), key = List.count)
+def bond_cutoff_table(bonddistancethreshold = 2.0):
+  """bond_cutoff() for all pairs of atomic numbers"""
+  from numpy import empty
+  from ase.data import chemical_symbols
+  table = empty((len(chemical_symbols),len(chemical_symbols)))
+  for i, xA in enumerate(chemical_symbols):
+    for j, xB in enumerate(chemical_symbols):
+      table[i,j] = bond_cutoff(xA, xB, bonddistancethreshold)
+  return table
+
+def reacted_fingerprints(structures, bonddistancethreshold = 2.0, chunk = 4000000):
+  """Fingerprint of each structure = sorted tuple of formula ids of all its molecules (None if missing)"""
+  from numpy import array, arange, repeat, nonzero, ones, unique, searchsorted, bincount, lexsort, split, cumsum
+  from scipy.sparse import coo_matrix
+  from scipy.sparse.csgraph import connected_components
+  from descriptors import stack_structures
+  cutoffs = bond_cutoff_table(bonddistancethreshold)
+  formulas = {}
+  fingerprints = [None]*len(structures)
+  for rows, positions, masses, numbers in stack_structures(structures):
+    n = positions.shape[1]
+    if n == 0:
+      for row in rows:
+        fingerprints[row] = ()
+      continue
+    step = max(1, chunk//(n*n))
+    for start in range(0, len(rows), step):
+      p = positions[start:start+step]
+      z = numbers[start:start+step]
+      g = len(p)
+      #bond graph of all structures of the chunk (block diagonal)
+      d = (((p[:,:,None,:]-p[:,None,:,:])**2).sum(axis = -1))**0.5
+      s, i, j = nonzero(d < cutoffs[z[:,:,None], z[:,None,:]])
+      graph = coo_matrix((ones(len(s), dtype = bool), (s*n+i, s*n+j)), shape = (g*n, g*n))
+      ncomponents, labels = connected_components(graph, directed = False)
+      #element counts of each molecule -> formula id
+      elements = unique(z)
+      codes = searchsorted(elements, z.ravel())
+      counts = bincount(labels*len(elements)+codes, minlength = ncomponents*len(elements)).reshape(ncomponents, len(elements))
+      unique_counts, inverse = unique(counts, axis = 0, return_inverse = True)
+      ids = []
+      for row in unique_counts:
+        formula = tuple((int(elements[e]), int(row[e])) for e in nonzero(row)[0])
+        ids.append(formulas.setdefault(formula, len(formulas)))
+      component_ids = array(ids)[inverse.reshape(-1)]
+      #molecules of each structure
+      owner = repeat(-1, ncomponents)
+      owner[labels] = repeat(arange(g), n)
+      order = lexsort((component_ids, owner))
+      for k, part in enumerate(split(component_ids[order], cumsum(bincount(owner, minlength = g))[:-1])):
+        fingerprints[rows[start+k]] = tuple(int(f) for f in part)
+  return fingerprints
 
 ### REACTED ###
 def filter_reacted(clusters_df, Qclustername = 0, Qreacted = 1, bonddistancethreshold = 2.0, Qout = 1):
   """for removing reacting structures
   clusters_df = JKQC pandas dataframe
   """
-  from pandas import isna
-  from numpy import sort, array, unique, dtype, sqrt, sum, asarray
-  missing = float("nan")
-  
-  dt = dtype(object)
+  from numpy import array, unique, arange, concatenate
+  from collections import Counter
+  from os import environ
+
   #Are there some cluster types which I should distinguish?
   if Qclustername != 0:
-    unique_cluster_types = unique(clusters_df.loc[:,("info","cluster_type")])
-    cluster_subsets = []
-    for unique_cluster_type in unique_cluster_types:
-      indexes = clusters_df[clusters_df.loc[:,("info","cluster_type")]==unique_cluster_type].index.values
-      cluster_subsets.append(indexes)
+    cluster_types = clusters_df.loc[:,("info","cluster_type")].values
+    cluster_subsets = [arange(len(clusters_df))[cluster_types == unique_cluster_type] for unique_cluster_type in unique(cluster_types)]
   else:
-    cluster_subsets = []
-    indexes = clusters_df.index.values
-    cluster_subsets.append(indexes)   
-  
-  #Loop over all unique cluster subsets
-  dist = lambda p1, p2: sqrt(sum(((p1-p2)**2)))
-  for k0 in range(len(cluster_subsets)):
-    all_molecules = []
-    #Loop over the configuration of k0 subset
-    for k in range(len(cluster_subsets[k0])):
-      b = clusters_df.loc[cluster_subsets[k0][k],("xyz","structure")]
-      if isna(b):
-        all_molecules.append(str(missing))
-      else:
-        p = b.positions
-        symb = array(b.get_chemical_symbols())
-        ind = [i != 'test' for i in symb] 
-   
-        #distance matrix and bond matrix 
-        dm = asarray([[dist(p1, p2) for p2 in p[ind]] for p1 in p[ind]])
-        bm = array([[bonded(dm[i][j],symb[ind][i],symb[ind][j],bonddistancethreshold) for j in range(len(dm[i]))] for i in range(len(dm))])
+    cluster_subsets = [arange(len(clusters_df))]
 
-        test = 0
-        choosing_list = range(len(bm))
-        molecules=[]
-        if len(choosing_list) == 0:
-          test = 1
-        while test == 0:
-          selected = [choosing_list[0]]
-          test_chosen = 0
-          j = -1
-          while test_chosen == 0:
-            j += 1
-            chosen = selected[j]
-            for i in choosing_list:
-              if bm[chosen][i] == 1 and chosen != i and (not (i in selected)):
-                selected.append(i)
-            if len(selected)-1 == j:
-              test_chosen = 1
-          molecules.append("".join(sort([symb[ind][i] for i in selected])))
-          choosing_list = [i for i in choosing_list if i not in selected]
-          if len(choosing_list) == 0:
-            test = 1
-        all_molecules.append(str(sort(array(sort(molecules),dtype = dt))))
-  
-    
-    mf = most_frequent(all_molecules)
-    
-    if Qreacted != 2:
-      nind = [ i == mf for i in all_molecules ]
-    else:
-      nind = [ i != mf for i in all_molecules ]
-    if k0 == 0:
-      selclusters_df = clusters_df.loc[cluster_subsets[0][nind]].copy()
-    else:
-      from pandas import concat
-      #selclusters_df = concat([selclusters_df, clusters_df.loc[cluster_subsets[k0][nind]].copy()], ignore_index=True)
-      selclusters_df = concat([selclusters_df, clusters_df.loc[cluster_subsets[k0][nind]].copy()])
-      #selclusters_df = selclusters_df.append(clusters_df.loc[cluster_subsets[k0][nind]].copy())
-  if Qout >= 1:
-    original_length = len(clusters_df)
-  clusters_df = selclusters_df.copy()
+  #molecular fingerprints (in parallel over cluster types)
+  structures = clusters_df.loc[:,("xyz","structure")].values
+  if len(cluster_subsets) > 1:
+    from joblib import Parallel, delayed
+    try:
+      num_cores = int(environ['SLURM_JOB_CPUS_PER_NODE'])
+    except:
+      from multiprocessing import cpu_count
+      num_cores = cpu_count()
+    all_fingerprints = Parallel(n_jobs = min(num_cores, len(cluster_subsets)))(delayed(reacted_fingerprints)(structures[subset], bonddistancethreshold) for subset in cluster_subsets)
+  else:
+    all_fingerprints = [reacted_fingerprints(structures[subset], bonddistancethreshold) for subset in cluster_subsets]
+
+  #the most frequent set of molecules is the non-reacted one
+  selected = []
+  for subset, fingerprints in zip(cluster_subsets, all_fingerprints):
+    if len(subset) == 0:
+      continue
+    mf = Counter(fingerprints).most_common(1)[0][0]
+    nind = array([fingerprint == mf for fingerprint in fingerprints], dtype = bool)
+    if Qreacted == 2:
+      nind = ~nind
+    selected.append(subset[nind])
+
+  original_length = len(clusters_df)
+  clusters_df = clusters_df.iloc[concatenate(selected) if len(selected) > 0 else []].copy()
   if Qout >= 1:
     print("Removing reacted: "+str(original_length)+" --> "+str(len(clusters_df)))
   return clusters_df
@@ -1,6 +1,7 @@
 def filter_threshold(clusters_df,Qcut,Qclustername,Qout):
-  from numpy import array, tile, errstate, unique, sum
+  from numpy import array, errstate, unique
   from pandas import isna
+  from descriptors import descriptor
   missing = float("nan")
   original_length = len(clusters_df)
 
@@ -11,6 +12,13 @@ def filter_threshold(clusters_df,Qcut,Qclustername,Qout):
     uniqueclusters = "1"
   newclusters_df = []
 
+  #structural descriptors are evaluated for all clusters at once (and cached) before splitting into types
+  for cut in Qcut:
+    if cut[2] == "rg":
+      descriptor(clusters_df, "rg")
+    elif cut[2] == "bonded":
+      descriptor(clusters_df, "bonded", *cut[3][:3])
+
   bonded_incr = 0
   myNaN = lambda x : missing if x == "NaN" else x
   for i in uniqueclusters:
@@ -54,32 +62,9 @@ def filter_threshold(clusters_df,Qcut,Qclustername,Qout):
         what = array([array(ii) if (isna([ii]).any() or type(ii)==type(array([]))) else array(ii[0]) for ii in preselected_df.loc[:,("log","vibrational_frequencies")].values], dtype=object)
         #what = array([array(ii) if isna([ii]).any() else array(ii[0]) for ii in preselected_df.loc[:,("log","vibrational_frequencies")].values], dtype=object)
       elif Qcut[i][2] == "rg":
-        rg = []
-        for aseCL in preselected_df.loc[:,("xyz","structure")].values:
-          try:
-            rg.append((sum(sum((aseCL.positions-tile(aseCL.get_center_of_mass().transpose(),(len(aseCL.positions),1)))**2,axis=-1)*aseCL.get_masses())/sum(aseCL.get_masses()))**0.5)
-          except:
-            rg.append(missing)
-        what = array(rg)
+        what = descriptor(clusters_df, "rg", index = preselected_df.index)
       elif Qcut[i][2] == "bonded":
-        bonded = []
-        for ind in clusters_df.index:
-          try:
-            aseCL = clusters_df.loc[ind,("xyz","structure")]
-            positions = aseCL.positions
-            symb = aseCL.get_chemical_symbols()
-            dist = lambda p1, p2: sum((p1-p2)**2)**0.5
-            symb_ind = array(aseCL.get_chemical_symbols())
-            mask1 = symb_ind == Qcut[i][3][1]
-            mask2 = symb_ind == Qcut[i][3][2]
-            dm = [dist(p1, p2) for p2 in positions[mask1] for p1 in positions[mask2]]
-            bonds = sum(test_i <= float(Qcut[i][3][0]) for test_i in dm)
-            if str(Qcut[i][3][1]) == str(Qcut[i][3][2]):
-              bonds = (bonds-sum(mask1))/2
-            bonded.append(int(bonds))
-          except:
-            bonded.append(float("nan"))
-        what = array(bonded)       
+        what = descriptor(clusters_df, "bonded", *Qcut[i][3][:3], index = preselected_df.index)
         bonded_incr = 1
       elif len(Qcut[i][2].split(",")) == 2:
         what = preselected_df.loc[:,(Qcut[i][2].split(",")[0],Qcut[i][2].split(",")[1])].values
@@ -27,127 +27,129 @@ def seperate_string_number2(string):
             newword = ''
     return groups
 
-def filter_uniq(clusters_df,Quniq,Qclustername,Qsample,Qout):
-  from numpy import unique, transpose, sum, tile, floor
+def uniq_criteria(Quniq):
+  """rg3,el2.4,g -> ["rg","electronic_energy","gibbs_free_energy"], [3,2.4,3] (names and number of decimals)"""
+  compare_list = []
+  compare_list_num = []
+  for separated_input in seperate_string_number2(str(Quniq)):
+    if isinstance(separated_input,list):
+      if separated_input[0] == "el":
+        compare_list.append("electronic_energy")
+      elif separated_input[0] == "g":
+        compare_list.append("gibbs_free_energy")
+      elif separated_input[0] == "d" or separated_input[0] == "dip":
+        compare_list.append("dipole_moment")
+      else:
+        compare_list.append(separated_input[0])
+      compare_list_num.append(float(separated_input[1]))
+    else:
+      if separated_input == "rg" or separated_input == "mass":
+        compare_list.append(separated_input)
+        compare_list_num.append(2)
+      elif separated_input == "el":
+        compare_list.append("electronic_energy")
+        compare_list_num.append(3)
+      elif separated_input == "g":
+        compare_list.append("gibbs_free_energy")
+        compare_list_num.append(3)
+      elif separated_input == "d" or separated_input == "dip":
+        compare_list.append("dipole_moment")
+        compare_list_num.append(1)
+      else:
+        compare_list.append(separated_input)
+        compare_list_num.append(1)
+  return compare_list, compare_list_num
+
+def uniq_values(clusters_df, compare_list):
+  """Matrix (clusters x criteria) of the compared values for all clusters at once"""
+  from numpy import array, full, column_stack
+  from descriptors import descriptor
   missing = float("nan")
+  myNaN = lambda x : missing if x == "NaN" else x
+  def as_float(values):
+    try:
+      return values.astype(float)
+    except (ValueError, TypeError):
+      return array([float(myNaN(o)) for o in values])
+  columns = []
+  for j in compare_list:
+    if j == "rg" or j == "mass":
+      columns.append(descriptor(clusters_df, j))
+    elif j == "gout":
+      if ("out","electronic_energy") in clusters_df.columns:
+        columns.append(as_float(clusters_df.loc[:,("log","gibbs_free_energy")].values)-as_float(clusters_df.loc[:,("log","electronic_energy")].values)+as_float(clusters_df.loc[:,("out","electronic_energy")].values))
+      else:
+        columns.append(full(len(clusters_df), missing))
+    else:
+      columns.append(as_float(clusters_df.loc[:,("log",j)].values))
+  return column_stack(columns) if len(columns) > 0 else full((len(clusters_df),0), missing)
+
+def uniq_keys(values, compare_list_num, scale = 0):
+  """Values rounded down on the grid 10**-(decimals+scale)"""
+  from numpy import floor, array, errstate
+  with errstate(all = "ignore"):
+    return floor(values*10**(scale+array(compare_list_num, dtype = float)))
+
+def sample_scale(values, compare_list_num, Qsample):
+  """Grid scale giving (as close as possible) Qsample unique clusters
+  The number of unique keys grows with the scale, so the scale is first bracketed and then bisected."""
+  from numpy import unique
+  count = lambda scale : len(unique(uniq_keys(values, compare_list_num, scale), axis = 0))
+  n = count(0)
+  if n == Qsample or len(values) < Qsample:
+    return 0
+  if n > Qsample:
+    low, high, step = -1.0, 0.0, 1.0
+    while count(low) > Qsample and step < 2**10:
+      high = low
+      step *= 2
+      low -= step
+  else:
+    low, high, step = 0.0, 1.0, 1.0
+    while count(high) < Qsample and step < 2**5:
+      low = high
+      step *= 2
+      high += step
+  for iteration in range(60):
+    middle = 0.5*(low + high)
+    n = count(middle)
+    if n == Qsample:
+      return middle
+    if n > Qsample:
+      high = middle
+    else:
+      low = middle
+  return high
+
+def filter_uniq(clusters_df,Quniq,Qclustername,Qsample,Qout):
+  from numpy import unique, column_stack, zeros, concatenate, argsort, split, cumsum, bincount
 
   if Quniq == "dup":
     newclusters_df = clusters_df.copy()
     newclusters_df = newclusters_df.drop_duplicates(subset=[("info","file_basename")])
   else:
+    #one group (cluster type) code per cluster, codes follow the sorted cluster types
     if Qclustername != 0:
-      uniqueclusters = unique(clusters_df.loc[:,("info","cluster_type")].values)
+      group = unique(clusters_df.loc[:,("info","cluster_type")].values, return_inverse = True)[1].reshape(-1)
     else:
-      uniqueclusters = "1"
-    newclusters_df = []
+      group = zeros(len(clusters_df), dtype = int)
+    compare_list, compare_list_num = uniq_criteria(Quniq)
+    values = uniq_values(clusters_df, compare_list)
 
-    myNaN = lambda x : missing if x == "NaN" else x
-    for i in uniqueclusters:
-       if Qclustername != 0:
-         preselected_df = clusters_df[clusters_df.loc[:,("info","cluster_type")] == i]
-       else:
-         preselected_df = clusters_df
-       separated_inputs = seperate_string_number2(str(Quniq))
-       compare_list = []
-       compare_list_num = []
-       for separated_input in separated_inputs:
-         if isinstance(separated_input,list):
-           if separated_input[0] == "rg":
-             import warnings
-             warnings.filterwarnings("ignore", category=RuntimeWarning)
-             compare_list.append("rg")
-           elif separated_input[0] == "el":
-             compare_list.append("electronic_energy")
-           elif separated_input[0] == "g":
-             compare_list.append("gibbs_free_energy")
-           elif separated_input[0] == "d" or separated_input[0] == "dip":
-             compare_list.append("dipole_moment")
-           else:
-             compare_list.append(separated_input[0])
-           compare_list_num.append(float(separated_input[1]))
-         else:
-           #compare_list.append(separated_input)
-           if separated_input == "rg":
-             import warnings
-             warnings.filterwarnings("ignore", category=RuntimeWarning)
-             compare_list.append("rg")
-             compare_list_num.append(2)
-           elif separated_input == "mass":
-             compare_list.append("mass")
-             compare_list_num.append(2)
-           elif separated_input == "el":
-             compare_list.append("electronic_energy")
-             compare_list_num.append(3)
-           elif separated_input == "g":
-             compare_list.append("gibbs_free_energy")
-             compare_list_num.append(3)
-           elif separated_input == "d" or separated_input == "dip":
-             compare_list.append("dipole_moment")
-             compare_list_num.append(1)
-           else:
-             compare_list.append(separated_input)
-             compare_list_num.append(1)
-       scale_test=1
-       scale=0
-       scale_scale = 0.1
-       scale_iter = 0
-       while scale_test == 1:
-         scale_iter = scale_iter + 1
-         tocompare = []
-         for compare_element_i in range(len(compare_list)):
-           j = compare_list[compare_element_i]
-           jj = scale+compare_list_num[compare_element_i]
-           if j == "rg":
-             rg = []
-             for aseCL in preselected_df["xyz"]["structure"]:
-               try:
-                 rg.append((sum(sum((aseCL.positions-tile(aseCL.get_center_of_mass().transpose(),(len(aseCL.positions),1)))**2,axis=-1)*aseCL.get_masses())/sum(aseCL.get_masses()))**0.5)
-               except:
-                 rg.append(missing)
-             values = [floor(myNaN(o)*10**jj) for o in rg]
-           elif j == "mass":
-             mass = []
-             for aseCL in preselected_df["xyz"]["structure"]:
-               try:
-                 mass.append(sum(aseCL.get_masses()))
-               except:
-                 mass.append(missing)
-             values = [floor(myNaN(o)*10**jj) for o in mass]
-           elif j == "gout":
-             gout = []
-             for Gouti in range(len(preselected_df)):
-               try:
-                 gout.append(preselected_df.loc[Gouti,("log","gibbs_free_energy")].values-preselected_df.loc[Gouti,("log","electronic_energy")].values+preselected_df.loc[Gouti,("out","electronic_energy")].values)
-               except:
-                 gout.append(missing)
-             values = [floor(myNaN(o)*10**jj) for o in gout]
-           else:
-             values = [floor(float(myNaN(o))*10**jj) for o in preselected_df.loc[:,("log",j)].values]
-           tocompare.append(values)
-         tocompare = transpose(tocompare)
-         uniqueindexes = unique(tocompare,axis = 0,return_index=True)[1]
-         if Qsample > 0 and len(uniqueindexes) > Qsample and scale_iter < 100:
-           if scale_scale > 0:
-             scale_scale = -0.9*scale_scale
-           else:
-             scale_scale = 1.1*scale_scale
-           scale = scale - abs(scale_scale)
-         elif Qsample > 0 and len(uniqueindexes) < Qsample and len(preselected_df) >= Qsample and scale_iter < 100:
-           if scale_scale < 0:
-             scale_scale = -0.9*scale_scale
-           else:
-             scale_scale = 1.1*scale_scale       
-           scale = scale + abs(scale_scale)
-         else:
-           scale_test = 0
-       selected_df = preselected_df.iloc[uniqueindexes]
-       if len(newclusters_df) == 0:
-         newclusters_df = selected_df
-       else:
-         from pandas import concat
-         #newclusters_df = concat([newclusters_df,selected_df.copy()], ignore_index=True)
-         newclusters_df = concat([newclusters_df,selected_df.copy()])
-         #newclusters_df = newclusters_df.append(selected_df)
+    if Qsample > 0:
+      #every cluster type is rounded on its own grid found by bisection on the precomputed values
+      order = argsort(group, kind = "stable")
+      members = split(order, cumsum(bincount(group))[:-1]) if len(group) > 0 else []
+      selected = []
+      for rows in members:
+        keys = uniq_keys(values[rows], compare_list_num, sample_scale(values[rows], compare_list_num, Qsample))
+        selected.append(rows[unique(keys, axis = 0, return_index = True)[1]])
+      selected = concatenate(selected) if len(selected) > 0 else zeros(0, dtype = int)
+    else:
+      #all cluster types at once: the group code is the leading key
+      keys = column_stack([group, uniq_keys(values, compare_list_num)])
+      selected = unique(keys, axis = 0, return_index = True)[1] if len(keys) > 0 else zeros(0, dtype = int)
+    newclusters_df = clusters_df.iloc[selected]
   if Qout >= 1:
     if Qsample > 0:
       print("Sampled: "+str(len(clusters_df))+" --> "+str(len(newclusters_df)))
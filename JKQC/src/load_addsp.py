@@ -1,33 +1,66 @@
-def load_addsp(clusters_df,input_pkl_sp,Qout):
-  from pandas import read_pickle  
-  from numpy import array
+####################################################################################################
+# ADDING SINGLE POINTS (-addSP)
+# The SP database is joined on ("info","file_basename") through a hash index: every SP row gets the
+# position of the cluster with the same basename (or -1) and the values are scattered into
+# preallocated columns. A .jkqc SP database is read in chunks of rows (only the basenames and the
+# log/out columns), so the whole SP database is never in memory next to the clusters.
+####################################################################################################
+
+def open_database(filename, labels = None, chunk = 100000):
+  """Basenames of a .pkl/.jkqc database and a generator of (start, frame) chunks with the given labels"""
+  from columnar_db import is_columnar, load_columnar, columnar_nrows
+  if is_columnar(filename):
+    basenames = load_columnar(filename, [("info","file_basename")]).loc[:,("info","file_basename")].values
+    def chunks():
+      from numpy import arange
+      nrows = columnar_nrows(filename)
+      for start in range(0, nrows, chunk):
+        yield start, load_columnar(filename, labels, rows = arange(start, min(start+chunk, nrows)))
+  else:
+    from pandas import read_pickle
+    database = read_pickle(filename)
+    basenames = database.loc[:,("info","file_basename")].values
+    def chunks():
+      for start in range(0, len(database), chunk):
+        part = database.iloc[start:start+chunk]
+        yield start, part if labels is None else part.loc[:,part.columns.get_level_values(0).isin(labels)]
+  return basenames, chunks()
+
+def load_addsp(clusters_df,input_pkl_sp,Qout,chunk = 100000):
+  from pandas import Index, DataFrame, MultiIndex, concat
+  from numpy import empty, nan
 
   for i in range(len(input_pkl_sp)):
-    newclusters_df_sp = read_pickle(input_pkl_sp[i])
+    basenames_new, chunks = open_database(input_pkl_sp[i], ["log","out"], chunk)
     if Qout >= 1:
-      print("Number of files in "+input_pkl_sp[i]+": "+str(len(newclusters_df_sp)))
-    if "log" in newclusters_df_sp:
-      newclusters_df_sp = newclusters_df_sp.rename(columns={"log": "out"})
+      print("Number of files in "+input_pkl_sp[i]+": "+str(len(basenames_new)))
     if "out" in clusters_df:
       clusters_df = clusters_df.drop(["out"], axis=1, level=0)
-    index_old = []
-    index_new = []
-    basenames_old = list(clusters_df.loc[:,('info', 'file_basename')].values)
-    basenames_new = list(newclusters_df_sp.loc[:,('info', 'file_basename')].values)
-    if len(basenames_old) != len(list(set(basenames_old))):
+    basenames_old = Index(clusters_df.loc[:,('info', 'file_basename')].values)
+    if not basenames_old.is_unique:
       print("The -addSP database has multiple occurances")
       exit()
-    if len(basenames_new) != len(list(set(basenames_new))):
+    if not Index(basenames_new).is_unique:
       print("The original database(s) has multiple occurances")
       exit()
-    for ii in range(len(basenames_old)):
-      try:
-        index_new.append(basenames_new.index(basenames_old[ii]))
-        index_old.append(ii)
-      except:
+    #hash join: position of each SP row in clusters_df (-1 = not there)
+    target = basenames_old.get_indexer(basenames_new)
+    columns = {}
+    for start, newclusters_df_sp in chunks:
+      if "log" in newclusters_df_sp:
+        newclusters_df_sp = newclusters_df_sp.rename(columns={"log": "out"})
+      if not "out" in newclusters_df_sp:
         continue
-    for ii in newclusters_df_sp.loc[:,"out"].columns.values:
-      toadd = array(newclusters_df_sp.loc[index_new,("out",ii)], dtype=object)
-      clusters_df.at[index_old,("out",ii)]=toadd
+      rows = target[start:start+len(newclusters_df_sp)]
+      found = rows >= 0
+      for ii in newclusters_df_sp.loc[:,"out"].columns.values:
+        if ii not in columns:
+          columns[ii] = empty(len(clusters_df), dtype=object)
+          columns[ii][:] = nan
+        columns[ii][rows[found]] = newclusters_df_sp.loc[:,("out",ii)].values[found]
+    if len(columns) > 0:
+      toadd = DataFrame(columns, index = clusters_df.index)
+      toadd.columns = MultiIndex.from_tuples([("out",ii) for ii in columns])
+      clusters_df = concat([clusters_df, toadd], axis = 1)
 
   return clusters_df
@@ -1,5 +1,9 @@
 def load_complement(clusters_df, Qcomplement):
-  from pandas import read_pickle
-  newclusters_df = read_pickle(Qcomplement)
-  clusters_df = clusters_df.merge(newclusters_df, on = [('info', 'file_basename')], how = "outer", indicator = True).loc[lambda x: x['_merge'] == 'left_only'].drop('_merge', axis=1)
+  """Keep only clusters whose basename is not in the Qcomplement database (.pkl or .jkqc)"""
+  from pandas import Index
+  from load_addsp import open_database
+  basenames, chunks = open_database(Qcomplement)
+  remove = Index(basenames).unique()
+  keep = ~clusters_df.loc[:,("info","file_basename")].isin(remove).values
+  clusters_df = clusters_df.iloc[keep.nonzero()[0]].reset_index(drop=True)
   return clusters_df
@@ -1,36 +1,85 @@
-def load_pickles(input_pkl,Qout,Qid):
-  from pandas import DataFrame
-  if len(input_pkl) == 0:
-    clusters_df = DataFrame()
-  else:
-    from pandas import read_pickle
-    import gc
-    for i in range(len(input_pkl)):
+def iterate_pickles(input_pkl,Qout,Qcolumns = None):
+  """Yield the input databases (.pkl/.jkqc) one by one"""
+  from pandas import DataFrame, read_pickle
+  from columnar_db import is_columnar,load_columnar
+  for i in range(len(input_pkl)):
+    if is_columnar(input_pkl[i]):
+      newclusters_df = load_columnar(input_pkl[i],Qcolumns)
+    else:
+      newclusters_df = read_pickle(input_pkl[i])
+    if not isinstance(newclusters_df, DataFrame):
+      print("File "+input_pkl[i]+" is not JKQC-compatible Pandas.DataFrame. Try to use JKTS.")
+      exit()
+    if Qout >= 1 and len(input_pkl) > 1:
+      print("Number of files in "+input_pkl[i]+": "+str(len(newclusters_df)))
+    yield newclusters_df
+
+def iterate_chunks(input_pkl,Qout,chunk,Qcolumns = None):
+  """Yield consecutive blocks of (at most) chunk rows of all input databases, indexed by the row position
+  in the concatenated inputs (.jkqc inputs are read block by block, a .pkl is read once and sliced)"""
+  from pandas import DataFrame, read_pickle
+  from columnar_db import is_columnar,load_columnar,columnar_nrows
+  from numpy import arange
+  offset = 0
+  for i in range(len(input_pkl)):
+    if is_columnar(input_pkl[i]):
+      nrows = columnar_nrows(input_pkl[i])
+      read_rows = lambda start, end : load_columnar(input_pkl[i],Qcolumns,rows = arange(start,end))
+    else:
       newclusters_df = read_pickle(input_pkl[i])
       if not isinstance(newclusters_df, DataFrame):
         print("File "+input_pkl[i]+" is not JKQC-compatible Pandas.DataFrame. Try to use JKTS.")
         exit()
-      if Qout >= 1 and len(input_pkl) > 1:
-        print("Number of files in "+input_pkl[i]+": "+str(len(newclusters_df)))
-      if i == 0:
-        clusters_df = newclusters_df
-      else:
-        from pandas import concat
-        clusters_df = concat([clusters_df,newclusters_df.copy()], ignore_index=True)
-        #clusters_df = clusters_df.append(newclusters_df, ignore_index=True)
-      gc.collect()
+      nrows = len(newclusters_df)
+      read_rows = lambda start, end : newclusters_df.iloc[start:end].copy()
+    if Qout >= 1 and len(input_pkl) > 1:
+      print("Number of files in "+input_pkl[i]+": "+str(nrows))
+    for start in range(0, nrows, chunk):
+      end = min(start+chunk, nrows)
+      part = read_rows(start, end)
+      part.index = range(offset+start, offset+end)
+      yield part
+    offset += nrows
+    newclusters_df = None
+
+def load_pickles(input_pkl,Qout,Qid,Qcolumns = None,Qcpu = 1,Qprefilter = None):
+  """Qprefilter = None or function applied to each input database, only its rows are kept (see filter.prefilter)
+  The returned rows are indexed by their position in the concatenated inputs (also after prefiltering)"""
+  from pandas import DataFrame
+  if len(input_pkl) == 0:
+    clusters_df = DataFrame()
+  else:
+    from pandas import concat
+    #all inputs are collected first and concatenated (and columns aligned) only once
+    frames = []
+    offset = 0
+    for newclusters_df in iterate_pickles(input_pkl,Qout,Qcolumns):
+      if Qprefilter is not None:
+        #prefiltered rows keep their global position (needed to complete the unplanned columns when saving)
+        nrows = len(newclusters_df)
+        newclusters_df.index = range(offset, offset+nrows)
+        offset += nrows
+        newclusters_df = Qprefilter(newclusters_df)
+      frames.append(newclusters_df)
+      del newclusters_df
     if Qout >= 2:
-      print("Pickles collected, resetting index...")
-    clusters_df = clusters_df.reset_index(drop=True)
+      print("Pickles collected, concatenating...")
+    if Qprefilter is not None:
+      clusters_df = concat(frames, copy=False)
+    elif len(frames) == 1:
+      clusters_df = frames[0].reset_index(drop=True)
+    else:
+      clusters_df = concat(frames, ignore_index=True, copy=False)
+    del frames
     if Qout >= 2:
       print("Checking xyz_id1...")
 
-  if Qid == 1 and not ("xyz","id1") in clusters_df.columns and ("xyz","structure") in clusters_df.columns:
+  if Qid >= 1 and (Qid == 2 or not ("xyz","id1") in clusters_df.columns) and ("xyz","structure") in clusters_df.columns:
     if Qout >= 2:
       print("Adding id1...") 
     from functions import df_add_iter
-    from read_xyz import identify_1
-    variables = [ identify_1(ase_ID) for ase_ID in clusters_df.loc[:,("xyz","structure")] ]
+    from read_xyz import identify_batch
+    variables = identify_batch(clusters_df.loc[:,("xyz","structure")].values, Qsmiles = 1 if Qid == 2 else 0, Qcpu = Qcpu)
     clusters_df = df_add_iter(clusters_df,"xyz","id1", range(len(clusters_df)),variables) 
   if Qout >= 2:
     print("Sending back to the main file.")
@@ -0,0 +1,85 @@
+####################################################################################################
+# SINGLE-PASS OUTPUT SCANNER
+# The readers used to search the whole output once per property (mm.find/mm.rfind + regex findall).
+# OutputScanner walks the file only once with one combined pattern of all section headers (anchors)
+# and remembers where each of them occurs. Afterwards, find_line() and the block patterns are
+# resolved from these positions without touching the rest of the file again.
+# find()/find_line() keep exactly the semantics of mm.find/mm.rfind and the readers' find_line():
+#   take_first = 1 ... first occurrence starting at >= idx
+#   take_first = 0 ... last occurrence starting at >= idx
+# Anchors which are too common to be indexed (e.g. "Total") can be passed as local; those are
+# searched directly in the file (from idx), just as before.
+####################################################################################################
+
+class OutputScanner:
+  def __init__(self, mm, anchors, local = []):
+    from re import compile, escape
+    from bisect import bisect_left
+    self.mm = mm
+    self.bisect_left = bisect_left
+    #an anchor contained in another one would be hidden by the combined pattern -> search it locally
+    self.local = set(local) | set(a for a in anchors for b in anchors if a != b and a in b)
+    anchors = [anchor for anchor in anchors if anchor not in self.local]
+    self.positions = {anchor:[] for anchor in anchors}
+    #one pass over the whole file collecting all anchor positions
+    ordered = sorted(anchors, key = len, reverse = True)
+    combined = compile(b"|".join(escape(anchor) for anchor in ordered))
+    positions = self.positions
+    for match in combined.finditer(mm):
+      positions[match.group()].append(match.start())
+
+  def find(self, anchor, take_first = 1, idx = 0):
+    """Start of first/last occurrence of anchor at >= idx or -1 (as mm.find/mm.rfind after mm.seek(idx))"""
+    if anchor not in self.positions:
+      self.mm.seek(idx)
+      if take_first:
+        return self.mm.find(anchor)
+      else:
+        return self.mm.rfind(anchor)
+    positions = self.positions[anchor]
+    if take_first:
+      i = self.bisect_left(positions, idx)
+      return positions[i] if i < len(positions) else -1
+    else:
+      return positions[-1] if len(positions) > 0 and positions[-1] >= idx else -1
+
+  def line(self, start_index):
+    self.mm.seek(start_index)
+    return self.mm.readline().decode("utf-8").strip()
+
+  def find_line(self, bytes_string, take_first = 0, idx = 0):
+    start_index = self.find(bytes_string, take_first, idx)
+    if start_index != -1:
+      return self.line(start_index), start_index
+    else:
+      self.mm.seek(idx)
+      return None, idx
+
+  def findall(self, pattern, anchor):
+    """Same as pattern.findall(mm) for patterns starting with anchor (matches taken at anchor positions)"""
+    out = []
+    end = -1
+    for start in self.positions[anchor]:
+      if start < end:
+        continue
+      match = pattern.match(self.mm, start)
+      if match is not None:
+        out.append(match.group(1) if pattern.groups == 1 else match.group(0))
+        end = match.end()
+    return out
+
+  def findlast(self, pattern, anchor):
+    """Same as pattern.findall(mm)[-1] for patterns starting with anchor (raises IndexError if none)"""
+    for start in reversed(self.positions[anchor]):
+      match = pattern.match(self.mm, start)
+      if match is not None:
+        return match.group(1) if pattern.groups == 1 else match.group(0)
+    raise IndexError("No match of the block pattern.")
+
+  def findfirst(self, pattern, anchor):
+    """Same as pattern.findall(mm)[0] for patterns starting with anchor (raises IndexError if none)"""
+    for start in self.positions[anchor]:
+      match = pattern.match(self.mm, start)
+      if match is not None:
+        return match.group(1) if pattern.groups == 1 else match.group(0)
+    raise IndexError("No match of the block pattern.")
@@ -0,0 +1,184 @@
+####################################################################################################
+# COLUMN PLANNING
+# Works out which database columns the requested JKQC run actually touches so that columnar (.jkqc)
+# inputs are loaded only partially. Returns None whenever the whole database has to be loaded.
+####################################################################################################
+
+STRUCTURE = ("xyz","structure")
+FORCES = ("extra","forces")
+
+#columns needed by print_output for each Pout option
+PRINT_COLUMNS = {
+  "-info"        : None,
+  "-levels"      : ["log","out"],
+  "-cite"        : [],
+  "-id1"         : [("xyz","id1"),STRUCTURE],
+  "-xyz"         : [STRUCTURE],
+  "-imos"        : [STRUCTURE,("log","esp_charges")],
+  "-imos_xlsx"   : [STRUCTURE,("log","esp_charges"),("extra","esp_charges"),("extra","chelpg"),("log","charge")],
+  "-chargesESP"  : [("log","esp_charges")],
+  "-charges"     : [("log","mulliken_charges")],
+  "-movie"       : [STRUCTURE,("log","electronic_energy")],
+  "-gif"         : [STRUCTURE],
+  "-atoms"       : [STRUCTURE],
+  "-bonded"      : [STRUCTURE],
+  "-rg"          : [STRUCTURE],
+  "-meanforce"   : [FORCES],
+  "-maxdist"     : [STRUCTURE],
+  "-distances"   : [STRUCTURE],
+  "-maxdistances": [STRUCTURE],
+  "-mindistances": [STRUCTURE],
+  "-errpa"       : [STRUCTURE,("extra","error")],
+  "-radius"      : [STRUCTURE],
+  "-radius0.5"   : [STRUCTURE],
+  "-ct"          : [],
+  "-b"           : [],
+  "-nOUT"        : [],
+  "-nLOG"        : [],
+  "-nXYZ"        : [],
+  "-pOUT"        : [],
+  "-pLOG"        : [],
+  "-pXYZ"        : [],
+  "-ePKL"        : [],
+  "-mass"        : [STRUCTURE],
+  "-natoms"      : [STRUCTURE],
+  "-nel"         : [STRUCTURE],
+  "-maxf"        : [FORCES],
+  "-elsp"        : [("log","sp_electronic_energy")],
+  "-el"          : [("log","electronic_energy")],
+  "-elout"       : [("out","electronic_energy")],
+  "-elc"         : [("log","electronic_energy"),("out","electronic_energy")],
+  "-elscf"       : [("log","scf_energy")],
+  "-elcorr"      : [("log","correlation_energy")],
+  "-uc"          : [("log","energy_thermal_correction")],
+  "-u"           : [("log","electronic_energy"),("log","energy_thermal_correction")],
+  "-uout"        : [("out","electronic_energy"),("log","energy_thermal_correction")],
+  "-zpec"        : [("log","zero_point_correction")],
+  "-zpe"         : [("log","electronic_energy"),("log","zero_point_correction")],
+  "-zpeout"      : [("out","electronic_energy"),("log","zero_point_correction")],
+  "-g"           : [("log","gibbs_free_energy")],
+  "-pop"         : [("log","gibbs_free_energy"),("log","temperature")],
+  "-popEL"       : [("log","zero_point_energy"),("log","temperature")],
+  "-gc"          : [("log","gibbs_free_energy_thermal_correction")],
+  "-gout"        : [("log","gibbs_free_energy"),("log","electronic_energy"),("out","electronic_energy")],
+  "-h"           : [("log","enthalpy_energy")],
+  "-hc"          : [("log","enthalpy_thermal_correction")],
+  "-hout"        : [("log","enthalpy_energy"),("log","electronic_energy"),("out","electronic_energy")],
+  "-s"           : [("log","entropy")],
+  "-lf"          : [("log","vibrational_frequencies")],
+  "-level"       : [("log","program"),("log","method"),("out","program"),("out","method")],
+  "-f"           : [("log","vibrational_frequencies")],
+  "-rot"         : [("log","rotational_constant")],
+  "-rots"        : [("log","rotational_constants")],
+  "-mult"        : [("log","multiplicity")],
+  "-char"        : [("log","charge")],
+  "-esp"         : [("log","esp_charges")],
+  "-mull"        : [("log","mulliken_charges")],
+  "-dip"         : [("log","dipole_moment")],
+  "-dips"        : [("log","dipole_moments")],
+  "-pol"         : [("log","polarizability")],
+  "-templog"     : [("log","temperature")],
+  "-preslog"     : [("log","pressure")],
+  "-mi"          : [STRUCTURE],
+  "-ami"         : [STRUCTURE],
+  "-rsn"         : [("log","rotational_symmetry_number")],
+  "-t"           : [("log","time")],
+  "-termination" : [("log","termination")],
+  "-column"      : [],
+  "-extra"       : [],
+}
+
+#columns needed by filters for the given sort/uniq/cut keyword
+def key_columns(key):
+  key = str(key)
+  if key in ["0","no","b","dup"]:
+    return []
+  if key == "el":
+    return [("log","electronic_energy")]
+  if key == "g":
+    return [("log","gibbs_free_energy")]
+  if key == "elout":
+    return [("out","electronic_energy")]
+  if key == "gout":
+    return [("log","gibbs_free_energy"),("log","electronic_energy"),("out","electronic_energy")]
+  if key in ["rg","mass","bonded"]:
+    return [STRUCTURE]
+  if key == "errpa":
+    return [STRUCTURE,("extra","error")]
+  if key == "lf":
+    return [("log","vibrational_frequencies")]
+  if key in ["d","dip"]:
+    return [("log","dipole_moment")]
+  if len(key.split(",")) == 2:
+    return [(key.split(",")[0],key.split(",")[1])]
+  return [("log",key)]
+
+def plan_columns(input_pkl, files, input_pkl_sp, Qcomplement, addcolumn, Qmodify, Qqha, Qsort, Quniq, Qcut, Qreacted, Qarbalign, QMWarbalign, Qglob, Qbavg, Qaimnet_prep, Qid, Pout, Qcolumn):
+  """Return list of columns/labels needed by this JKQC run or None (= load everything)"""
+  from columnar_db import is_columnar
+  if len(input_pkl) == 0 or not all(is_columnar(i) for i in input_pkl):
+    return None
+  #stages which add or rewrite rows/columns need the full database
+  if len(files) > 0 or len(input_pkl_sp) > 0 or Qcomplement != 0 or len(addcolumn) > 0 or Qmodify > 0 or Qaimnet_prep == 1:
+    return None
+
+  #info + energies used by filter() to decide default sorting
+  needed = ["info",("log","electronic_energy"),("log","gibbs_free_energy"),("out","electronic_energy")]
+  if Qqha == 1:
+    needed += ["log","out",STRUCTURE]
+  if Qid == 1:
+    needed += [("xyz","id1"),STRUCTURE]
+  needed += key_columns(Qsort)
+  if str(Quniq) != "0":
+    from filter_uniq import seperate_string_number2
+    for separated_input in seperate_string_number2(str(Quniq)):
+      if isinstance(separated_input,list):
+        separated_input = separated_input[0]
+      needed += key_columns(separated_input)
+  for cut in Qcut:
+    needed += key_columns(cut[2])
+  if Qreacted > 0 or Qarbalign > 0 or QMWarbalign > 0:
+    needed += [STRUCTURE]
+  if Qglob > 0 or Qbavg > 0:
+    needed += [("log","temperature")]
+
+  last = ""
+  for i in Pout:
+    if last == "-extra":
+      last = ""
+      needed += [("extra",i)]
+      continue
+    if i not in PRINT_COLUMNS or PRINT_COLUMNS[i] is None:
+      return None
+    needed += PRINT_COLUMNS[i]
+    if i == "-extra":
+      last = "-extra"
+  for column in Qcolumn:
+    needed += [(column[0],column[1])]
+
+  return list(dict.fromkeys(needed))
+
+def complete_columns(tosave, input_pkl, Qcolumns, source_rows):
+  """Load the columns that were not needed during the run (only for the rows being saved)"""
+  from numpy import array, cumsum, concatenate, argsort, where
+  from pandas import concat
+  from columnar_db import columnar_nrows, columnar_columns, load_columnar
+  starts = cumsum([0]+[columnar_nrows(i) for i in input_pkl])
+  source_rows = array(source_rows)
+  parts = []
+  positions = []
+  for i in range(len(input_pkl)):
+    mask = (source_rows >= starts[i]) & (source_rows < starts[i+1])
+    if mask.any():
+      parts.append(load_columnar(input_pkl[i], rows = source_rows[mask] - starts[i], exclude = Qcolumns))
+      positions.append(where(mask)[0])
+  if len(parts) == 0:
+    return tosave
+  #rows were loaded file by file, put them back in the order of tosave
+  remaining = concat(parts, ignore_index = True).iloc[argsort(concatenate(positions))]
+  remaining.index = tosave.index
+  tosave = concat([tosave, remaining], axis = 1)
+  all_columns = []
+  for i in input_pkl:
+    all_columns += [column for column in columnar_columns(i) if column in tosave.columns and column not in all_columns]
+  return tosave.loc[:,all_columns+[column for column in tosave.columns if column not in all_columns]]
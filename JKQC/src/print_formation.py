@@ -74,9 +74,10 @@ def myFunc(e):
 ##########################################################################################
 ##########################################################################################
 
-def print_formation(output, Qout=1, Qt = 298.15, Qp = 101325.0, Qconc = 0, conc = [], CNTfactor = 0, QUenergy = 1):
+def print_formation(output, Qout=1, Qt = 298.15, Qp = 101325.0, Qconc = 0, conc = [], CNTfactor = 0, QUenergy = 1, Qtemps = None):
   """print formation/binding properties
   output = np.array of output
+  Qtemps = temperatures of the output rows 1,2,... (temperature sweep) or None (all rows at Qt)
   """
   from numpy import transpose,apply_along_axis,array,sum,dtype
   missing = float("nan") 
@@ -144,28 +145,44 @@ def print_formation(output, Qout=1, Qt = 298.15, Qp = 101325.0, Qconc = 0, conc
           monomers[j] = False
   if Qout >= 1:
     print("ANCHOR MONOMERS: " + " ".join(monomer_types),flush = True)
+  #temperature of each output row
+  if Qtemps is None:
+    row_temperatures = [Qt]*len(output)
+  else:
+    row_temperatures = [Qt]+list(Qtemps)
+  #monomer values and concentrations are evaluated only once
+  output_array = array(output)
+  monomer_values = output_array[:,monomers]
+  selected_monomers = [i[0][1] for i in array(cluster_types_sorted,dtype=dt)[monomers]]
+  def monomer_concentration(selected_monomer, Qt_row):
+    for conc_j in range(len(conc)):
+      if conc[conc_j][0] == selected_monomer:
+        try:
+          return float(eval(conc[conc_j][1].replace("ppt","*10**-12*"+str(Qp)).replace("ppb","*10**-9*"+str(Qp)).replace("^","**").replace("cmmc","*10**6*1.380662*10**-23*"+str(Qt_row)) ))
+        except:
+          return missing
+    return None
+  if Qconc > 0:
+    concentrations = [[monomer_concentration(selected_monomer, Qt_row) for Qt_row in row_temperatures] for selected_monomer in selected_monomers]
   new_output = []
-  #TODO slow for large number of files
   for i in range(len(output[0])):
-    line = array(output)[:,i]
+    line = output_array[:,i].copy()
     cluster_total_number = sum([int(sel[0]) for sel in cluster_types_sorted[i]])
     for j in range(len(cluster_types_sorted[i])):
       cluster_molecule = cluster_types_sorted[i][j][1]
       cluster_molecule_number = cluster_types_sorted[i][j][0]
       test_monomer = 0
-      #for k in range(len(array(output)[:,monomers][0])):
-      for k in range(sum(monomers)):
-        selected_monomer = array(cluster_types_sorted,dtype=dt)[monomers][k][0][1]
+      for k in range(len(selected_monomers)):
+        selected_monomer = selected_monomers[k]
         if cluster_molecule == selected_monomer:
           for line_i in range(1,len(line)):
             if type(line[line_i]) != type("str"):
               try:
-                line[line_i] = float(line[line_i]) - float(cluster_molecule_number) * float(array(output)[:,monomers][line_i,k])
+                line[line_i] = float(line[line_i]) - float(cluster_molecule_number) * float(monomer_values[line_i,k])
                 if Qconc > 0:
-                  for conc_j in range(len(conc)):
-                    if conc[conc_j][0] == selected_monomer:         
-                      conc_mon=float(eval(conc[conc_j][1].replace("ppt","*10**-12*"+str(Qp)).replace("ppb","*10**-9*"+str(Qp)).replace("^","**").replace("cmmc","*10**6*1.380662*10**-23*"+str(Qt)) ))
-                      line[line_i] = float(line[line_i]) - QUenergy*(float(cluster_molecule_number) - CNTfactor*float(cluster_molecule_number)/cluster_total_number) * R/1000/627.503 * Qt * log( conc_mon / Qp)
+                  conc_mon = concentrations[k][line_i]
+                  if conc_mon is not None:
+                    line[line_i] = float(line[line_i]) - QUenergy*(float(cluster_molecule_number) - CNTfactor*float(cluster_molecule_number)/cluster_total_number) * R/1000/627.503 * row_temperatures[line_i] * log( conc_mon / Qp)
               except:
                 line[line_i] = missing
           test_monomer = 1
@@ -174,6 +191,8 @@ def print_formation(output, Qout=1, Qt = 298.15, Qp = 101325.0, Qconc = 0, conc
     new_output.append(line)
   new_output = transpose(array(new_output))
   toprint = list(zip(*new_output)) #[row for row in list(zip(*out))]
+  if Qtemps is not None:
+    toprint.insert(0, tuple(["T[K]"]+list(Qtemps)))
   if len(toprint) > 0:
     column_widths = [max(len(str(row[i])) for row in toprint) for i in range(len(toprint[0]))]
     for row in toprint:
@@ -229,40 +229,15 @@ def print_output(clusters_df, Qoutpkl, input_pkl, output_pkl, Qsplit, Qclusterna
       continue
     #bonded
     if i == "-bonded":
-      from numpy import array,sum
-      bonded = []
+      from descriptors import descriptor
       Qbonded_index += 1
-      for ind in clusters_df.index:
-        try:
-          aseCL = clusters_df.loc[ind,("xyz","structure")]
-          positions = aseCL.positions
-          symb = aseCL.get_chemical_symbols()
-          dist = lambda p1, p2: sum((p1-p2)**2)**0.5
-          symb_ind = array(aseCL.get_chemical_symbols())
-          mask1 = symb_ind == Qbonded[Qbonded_index][1]
-          mask2 = symb_ind == Qbonded[Qbonded_index][2]
-          dm = [dist(p1, p2) for p2 in positions[mask1] for p1 in positions[mask2]]
-          bonds = sum(test_i <= float(Qbonded[Qbonded_index][0]) for test_i in dm)
-          if Qbonded[Qbonded_index][1] == Qbonded[Qbonded_index][2]:
-            bonds = (bonds-sum(mask1))/2
-          bonded.append(str(int(bonds)))
-        except:
-          bonded.append(missing)
+      bonded = [missing if b != b else str(int(b)) for b in descriptor(clusters_df, "bonded", *Qbonded[Qbonded_index][:3])]
       output.append(bonded)
       continue
     #Rg
     if i == "-rg":
-      from numpy import tile,sum
-      import warnings
-      warnings.filterwarnings("ignore", category=RuntimeWarning)
-      rg = []
-      for ind in clusters_df.index:
-        try:
-          aseCL=clusters_df.loc[ind,("xyz","structure")]
-          rg.append((sum(sum((aseCL.positions-tile(aseCL.get_center_of_mass().transpose(),(len(aseCL.positions),1)))**2,axis=-1)*aseCL.get_masses())/sum(aseCL.get_masses()))**0.5)
-        except:
-          rg.append(missing)
-      output.append(rg)
+      from descriptors import descriptor
+      output.append(list(descriptor(clusters_df, "rg")))
       continue
     #mean force
     if i == "-meanforce":
@@ -442,13 +417,8 @@ def print_output(clusters_df, Qoutpkl, input_pkl, output_pkl, Qsplit, Qclusterna
       continue
     #MASS
     if i == "-mass":
-      masses = []  
-      for ind in clusters_df.index:
-        try:
-          masses.append(str((clusters_df.loc[ind,("xyz","structure")].get_masses()).sum()))
-        except:
-          masses.append(missing)
-      output.append(masses)
+      from descriptors import descriptor
+      output.append([missing if m != m else str(m) for m in descriptor(clusters_df, "mass")])
       continue
     #Natoms
     if i == "-natoms":
@@ -834,3 +804,12 @@ def print_output(clusters_df, Qoutpkl, input_pkl, output_pkl, Qsplit, Qclusterna
     output.append(["UNKNOWN_ARGUMENT"]*len(clusters_df))
   return output
   
+
+def print_table(output):
+  """Print output columns as space-aligned rows"""
+  toprint = list(zip(*output)) #[row for row in list(zip(*output))]
+  if len(toprint) > 0:
+    column_widths = [max(len(str(row[i])) for row in toprint) for i in range(len(toprint[0]))]
+    for row in toprint:
+      formatted_row = [str(row[i]).ljust(column_widths[i]) for i in range(len(row))]
+      print(" ".join(formatted_row),flush = True)
@@ -1,6 +1,8 @@
 ###############
 ###  G16  #####
 ###############
+scanner = None
+
 def read_g16_init(Qforces = 0, Qanharm = 0):
   from re import compile
   global PATTERN_G16_out_program,PATTERN_G16_out_method,PATTERN_G16_out_mulliken_charges,PATTERN_G16_out_dipole_moment,PATTERN_G16_out_esp_charges
@@ -15,8 +17,32 @@ def read_g16_init(Qforces = 0, Qanharm = 0):
   if Qanharm == 1:
     global PATTERN_G16_out_anharm
     PATTERN_G16_out_anharm = compile(rb'Fundamental Bands.*\n.*\n.*Mode.*\n((?:\s*\w*\s*\d+\(.\)\s+\w+\s+[-+]?\d+\.\d+.*\n)+).*\n.*Overtones\n')
+  #ANCHORS FOR THE SINGLE-PASS SCANNER
+  global ANCHORS_G16
+  ANCHORS_G16 = [rb"Elapsed time",rb"Normal termination",rb' Mulliken charges:',rb' ESP charges:',rb" Gaussian",rb"\n #",rb'Dipole moment (field-independent basis, Debye):',rb" Charge = ",rb"NAtoms=",rb'Rotational constants ',rb'Exact polarizability',rb'SCF Done',rb" Frequencies -- ",rb' Temperature ',rb'Eigenvalues -- ',rb'Rotational symmetry number',rb'Zero-point correction=',rb'Thermal correction to Energy',rb'Thermal correction to Enthalpy',rb'Thermal correction to Gibbs Free Energy',rb'Sum of electronic and zero-point Energies',rb'Sum of electronic and thermal Energies',rb'Sum of electronic and thermal Enthalpies',rb'Sum of electronic and thermal Free Energies']
+  if Qforces == 1:
+    ANCHORS_G16 += [rb'Center     Atomic                   Forces']
+  if Qanharm == 1:
+    ANCHORS_G16 += [rb'Fundamental Bands']
+
+def find(bytes_string):
+  if scanner is not None:
+    return scanner.find(bytes_string, 1, mm.tell())
+  return mm.find(bytes_string)
+
+def findlast(pattern, anchor):
+  if scanner is not None:
+    return scanner.findlast(pattern, anchor)
+  return pattern.findall(mm)[-1]
+
+def findfirst(pattern, anchor):
+  if scanner is not None:
+    return scanner.findfirst(pattern, anchor)
+  return pattern.findall(mm)[0]
 
 def find_line(bytes_string,take_first = 0,idx = 0):
+  if scanner is not None:
+    return scanner.find_line(bytes_string,take_first,idx)
   mm.seek(idx)
   if take_first:
     start_index = mm.find(bytes_string)
@@ -38,7 +64,7 @@ def find_lines(bytes_string,take_first = 0,idx = 0):
       lines.append(line)
   return lines, idx
 
-def read_g16(mmm, Qforces = 0, Qanharm = 0):
+def read_g16(mmm, Qforces = 0, Qanharm = 0, Qscan = 1):
   from numpy import array
   from math import sqrt
   missing = float("nan")
@@ -47,8 +73,13 @@ def read_g16(mmm, Qforces = 0, Qanharm = 0):
   columns.append("esp_charges")
   columns.append("moments_of_inertia")
 
-  global mm
+  global mm,scanner
   mm = mmm
+  if Qscan == 1:
+    from output_scanner import OutputScanner
+    scanner = OutputScanner(mm, ANCHORS_G16)
+  else:
+    scanner = None
       
   #TIME
   try:
@@ -59,7 +90,7 @@ def read_g16(mmm, Qforces = 0, Qanharm = 0):
 
   #TERMINATION
   try:
-    if mm.find(rb"Normal termination") > 0:
+    if find(rb"Normal termination") > 0:
       out_termination = 1
     else:
       out_termination = 0
@@ -68,33 +99,33 @@ def read_g16(mmm, Qforces = 0, Qanharm = 0):
 
   #MULLIKEN ATOMIC CHARGES 
   try: 
-    out_mulliken_charges = [float(line.split()[2]) for line in PATTERN_G16_out_mulliken_charges.findall(mm)[-1].decode("utf-8").split("\n")[:-1]]     
+    out_mulliken_charges = [float(line.split()[2]) for line in findlast(PATTERN_G16_out_mulliken_charges,rb' Mulliken charges:').decode("utf-8").split("\n")[:-1]]     
   except:
     out_mulliken_charges = missing
 
   #ESP CHARGES
   try:
-    out_esp_charges = [float(line.split()[2]) for line in PATTERN_G16_out_esp_charges.findall(mm)[-1].decode("utf-8").split("\n")[:-1]]
+    out_esp_charges = [float(line.split()[2]) for line in findlast(PATTERN_G16_out_esp_charges,rb' ESP charges:').decode("utf-8").split("\n")[:-1]]
   except:
     out_esp_charges = missing
      
   #PROGRAM VERSION
   try:
-    line = PATTERN_G16_out_program.findall(mm)[0].decode("utf-8").split("\n")[-1]
+    line = findfirst(PATTERN_G16_out_program,rb" Gaussian").decode("utf-8").split("\n")[-1]
     out_program = "G" + str(line.split(",")[0].split()[1]) + "_" + str(line.split(",")[1].split()[1])
   except:
     out_program = missing
 
   #METHOD
   try:
-    line = PATTERN_G16_out_method.findall(mm)[-1].decode("utf-8").split("\n")[-1]
+    line = findlast(PATTERN_G16_out_method,rb"\n #").decode("utf-8").split("\n")[-1]
     out_method = "_".join(line.lower().split())
   except:
     out_method = missing
   
   #DIPOLE MOMENTS
   try:
-    line = PATTERN_G16_out_dipole_moment.findall(mm)[-1].decode("utf-8").split("\n")[-2]
+    line = findlast(PATTERN_G16_out_dipole_moment,rb'Dipole moment (field-independent basis, Debye):').decode("utf-8").split("\n")[-2]
     out_dipole_moments = [float(line.split()[1]), float(line.split()[3]), float(line.split()[5])]
     out_dipole_moment = float(line.split()[7])
   except:
@@ -247,20 +278,21 @@ def read_g16(mmm, Qforces = 0, Qanharm = 0):
   #FORCES
   if Qforces == 1:
     try:
-      lines = PATTERN_G16_out_forces.findall(mm)[-1].decode("utf-8").split("\n")[:-2]
-      out_forces = [array([float(line.split()[2]),float(line.split()[3]),float(line.split()[4])])/0.529177 for line in PATTERN_G16_out_forces.findall(mm)[-1].decode("utf-8").split("\n")[:-1]]
+      lines = findlast(PATTERN_G16_out_forces,rb'Center     Atomic                   Forces').decode("utf-8").split("\n")[:-2]
+      out_forces = [array([float(line.split()[2]),float(line.split()[3]),float(line.split()[4])])/0.529177 for line in findlast(PATTERN_G16_out_forces,rb'Center     Atomic                   Forces').decode("utf-8").split("\n")[:-1]]
     except:
       out_forces = missing
 
   #ANHARMONIC FREQS
   if Qanharm == 1:
     try:
-      lines = PATTERN_G16_out_anharm.findall(mm)[-1].decode("utf-8").split("\n")[:-1]
+      lines = findlast(PATTERN_G16_out_anharm,rb'Fundamental Bands').decode("utf-8").split("\n")[:-1]
       out_anharm = [float(line.split()[-4]) for line in lines][-1::-1]
     except:
       out_anharm = missing
 
   #SAVE
+  scanner = None
   mm.close()
   all_locals = locals()
   dic = {("log",column):[all_locals.get("out_"+column)] for column in columns}
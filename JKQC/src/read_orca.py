@@ -1,6 +1,8 @@
 ###############
 ### ORCA ######
 ###############
+scanner = None
+
 def read_orca_init(Qforces = 0, Qanharm = 0, Qdisp_forces = 0):
   from re import compile
   global PATTERN_ORCA_out_method,PATTERN_ORCA_out_vibrational_frequencies,PATTERN_ORCA_out_mulliken_charges
@@ -17,8 +19,29 @@ def read_orca_init(Qforces = 0, Qanharm = 0, Qdisp_forces = 0):
   if Qdisp_forces == 1:
     global PATTERN_ORCA_out_dispersion_forces
     PATTERN_ORCA_out_dispersion_forces = compile(rb'DISPERSION GRADIENT\s*\n-{2,}\n((?:\s+\d+\s+\w+\s*:\s*[-+]?\d*\.\d+(?:[eE][-+]?\d+)?\s+[-+]?\d*\.\d+(?:[eE][-+]?\d+)?\s+[-+]?\d*\.\d+(?:[eE][-+]?\d+)?\n)+)')
+  #ANCHORS FOR THE SINGLE-PASS SCANNER
+  global ANCHORS_ORCA
+  ANCHORS_ORCA = [rb"TOTAL RUN TIME",rb'FINAL SINGLE POINT ENERGY',rb'VIBRATIONAL FREQUENCIES',rb"\n|",rb'MULLIKEN ATOMIC CHARGES',rb"ORCA TERMINATED NORMALLY",rb'Program Version',rb"Number of atoms",rb"Total Charge",rb' Multiplicity',rb'Total Dipole Moment',rb'Magnitude (Debye)',rb'Rotational constants in MHz',rb'Temperature         ...',rb'Pressure            ...',rb'Zero point energy                ...',rb'Total thermal energy',rb'Symmetry Number',rb'Final entropy term',rb'Final Gibbs free energy',rb'Total enthalpy',rb'Total Energy']
+  if Qanharm == 1:
+    ANCHORS_ORCA += [rb'Fundamental transitions',rb'Anharmonic constants']
+  if Qforces == 1:
+    ANCHORS_ORCA += [rb'CARTESIAN GRADIENT']
+  if Qdisp_forces == 1:
+    ANCHORS_ORCA += [rb'DISPERSION GRADIENT']
+
+def find(bytes_string):
+  if scanner is not None:
+    return scanner.find(bytes_string, 1, mm.tell())
+  return mm.find(bytes_string)
+
+def findlast(pattern, anchor):
+  if scanner is not None:
+    return scanner.findlast(pattern, anchor)
+  return pattern.findall(mm)[-1]
 
 def find_line(bytes_string,take_first = 0,idx = 0):
+  if scanner is not None:
+    return scanner.find_line(bytes_string,take_first,idx)
   mm.seek(idx)
   if take_first:
     start_index = mm.find(bytes_string)
@@ -31,14 +54,19 @@ def find_line(bytes_string,take_first = 0,idx = 0):
   else:
     return None, idx
 
-def read_orca(mmm, orcaextname, Qforces = 0, Qanharm = 0, Qdisp_electronic_energy = 0, Qdisp_forces = 0):
+def read_orca(mmm, orcaextname, Qforces = 0, Qanharm = 0, Qdisp_electronic_energy = 0, Qdisp_forces = 0, Qscan = 1):
   from numpy import array,sqrt
   missing = float("nan")
 
   columns = ["program","method","time","termination","charge","multiplicity","NAtoms","rotational_constants","rotational_constant","sp_electronic_energy","electronic_energy","mulliken_charges","dipole_moment","dipole_moments","polarizability","vibrational_frequencies","temperature","pressure","moments_of_inertia","rotational_symmetry_number","zero_point_correction","energy_thermal_correction","enthalpy_thermal_correction","gibbs_free_energy_thermal_correction","zero_point_energy","internal_energy","enthalpy_energy","gibbs_free_energy","entropy","scf_energy"]
 
-  global mm
+  global mm,scanner
   mm = mmm
+  if Qscan == 1:
+    from output_scanner import OutputScanner
+    scanner = OutputScanner(mm, ANCHORS_ORCA)
+  else:
+    scanner = None
 
   #TIME
   try:
@@ -59,11 +87,11 @@ def read_orca(mmm, orcaextname, Qforces = 0, Qanharm = 0, Qdisp_electronic_energ
 
   #VIBRATIONAL FREQUENCIES
   try:
-    lines = PATTERN_ORCA_out_vibrational_frequencies.findall(mm)[-1].decode("utf-8").split("\n")
+    lines = findlast(PATTERN_ORCA_out_vibrational_frequencies,rb'Fundamental transitions' if Qanharm == 1 else rb'VIBRATIONAL FREQUENCIES').decode("utf-8").split("\n")
     if Qanharm == 1:
       out_vibrational_frequencies = [float(line.split()[1]) for line in lines[0:-1]]
       try:
-        lines = PATTERN_ORCA_anharm.findall(mm)[-1].decode("utf-8").split("\n")
+        lines = findlast(PATTERN_ORCA_anharm,rb'Anharmonic constants').decode("utf-8").split("\n")
         corrections = array([array([float(number) for number in line.split()]) for line in lines[0:-1]])
         out_anharmonicties = []
         for i in range(len(out_vibrational_frequencies)):
@@ -88,20 +116,20 @@ def read_orca(mmm, orcaextname, Qforces = 0, Qanharm = 0, Qdisp_electronic_energ
  
   #METHOD
   try:
-    out_method = "_".join(PATTERN_ORCA_out_method.findall(mm)[-1].decode("utf-8").split("> ")[1].split())
+    out_method = "_".join(findlast(PATTERN_ORCA_out_method,rb"\n|").decode("utf-8").split("> ")[1].split())
   except:
     out_method = missing
 
   #MULLIKEN ATOMIC CHARGES 
   try: 
-    out_mulliken_charges = [float(line.split()[3]) for line in PATTERN_ORCA_out_mulliken_charges.findall(mm)[-1].decode("utf-8").split("\n")[:-1]]     
+    out_mulliken_charges = [float(line.split()[3]) for line in findlast(PATTERN_ORCA_out_mulliken_charges,rb'MULLIKEN ATOMIC CHARGES').decode("utf-8").split("\n")[:-1]]     
   except:
     out_mulliken_charges = missing
      
   #TERMINATION
   try:
     #out_termination = len(PATTERN_ORCA_out_termination.findall(mm))
-    if mm.find(rb"ORCA TERMINATED NORMALLY") > 0:
+    if find(rb"ORCA TERMINATED NORMALLY") > 0:
       out_termination = 1
     else:
       out_termination = 0
@@ -224,7 +252,7 @@ def read_orca(mmm, orcaextname, Qforces = 0, Qanharm = 0, Qdisp_electronic_energ
   #FORCES
   if Qforces == 1:
     try:
-      out_forces = [-array([float(line.split()[3]),float(line.split()[4]),float(line.split()[5])])/0.529177 for line in PATTERN_ORCA_out_forces.findall(mm)[-1].decode("utf-8").split("\n")[:-1]]
+      out_forces = [-array([float(line.split()[3]),float(line.split()[4]),float(line.split()[5])])/0.529177 for line in findlast(PATTERN_ORCA_out_forces,rb'CARTESIAN GRADIENT').decode("utf-8").split("\n")[:-1]]
     except:
       out_forces = missing
 
@@ -239,7 +267,7 @@ def read_orca(mmm, orcaextname, Qforces = 0, Qanharm = 0, Qdisp_electronic_energ
   #FORCES DISPERSION CORRECTION
   if Qdisp_forces == 1:
     try:
-      out_disp_forces = [-array([float(line.split()[3]),float(line.split()[4]),float(line.split()[5])]) / 0.529177 for line in PATTERN_ORCA_out_dispersion_forces.findall(mm)[-1].decode("utf-8").split("\n")[1:-1]]
+      out_disp_forces = [-array([float(line.split()[3]),float(line.split()[4]),float(line.split()[5])]) / 0.529177 for line in findlast(PATTERN_ORCA_out_dispersion_forces,rb'DISPERSION GRADIENT').decode("utf-8").split("\n")[1:-1]]
     except:
       out_disp_forces = missing
 
@@ -264,6 +292,7 @@ def read_orca(mmm, orcaextname, Qforces = 0, Qanharm = 0, Qdisp_electronic_energ
   out_polarizability = missing
 
   #SAVE
+  scanner = None
   mm.close()
   all_locals = locals()
   dic = {(orcaextname,column):[all_locals.get("out_"+column)] for column in columns}
@@ -1,19 +1,14 @@
 def infer_bonds(atomic_numbers, positions, scale_factor=1.2):
   """Infer bonds based on interatomic distances and covalent radii."""
-  from numpy import linalg
+  from numpy import array, sqrt, triu, nonzero
   from ase.data import covalent_radii
-  bonds = []
-  num_atoms = len(atomic_numbers)
-  # Loop over all atom pairs
-  for i in range(num_atoms):
-      for j in range(i + 1, num_atoms):
-          dist = linalg.norm(positions[i] - positions[j])  # Interatomic distance
-          r_i = covalent_radii[atomic_numbers[i]]  # Covalent radius of atom i
-          r_j = covalent_radii[atomic_numbers[j]]  # Covalent radius of atom j
-          # If dist. is less than the sum of the covalent radii (with a scale factor)
-          if dist < scale_factor * (r_i + r_j):
-              bonds.append((i, j))  # Bond exists between atoms i and j
-  return bonds
+  atomic_numbers = array(atomic_numbers)
+  positions = array(positions, dtype = float).reshape(-1,3)
+  # All atom pairs at once: bonded if dist. is less than the sum of the covalent radii (with a scale factor)
+  dist = sqrt(((positions[:,None,:] - positions[None,:,:])**2).sum(axis = -1))
+  radii = covalent_radii[atomic_numbers]
+  i, j = nonzero(triu(dist < scale_factor * (radii[:,None] + radii[None,:]), 1))
+  return list(zip(i.tolist(), j.tolist()))
 
 def read_xyz(file_i_XYZ):
   from ase.io import read
@@ -23,7 +18,95 @@ def read_xyz(file_i_XYZ):
     out = float("nan")
   return out 
 
+ID_FORMAT = "wl1" #format of xyz/id1 (changes invalidate cached ids)
+
+def mix(x):
+  """64-bit integer hash (splitmix64 finalizer) applied elementwise"""
+  from numpy import uint64
+  x = (x ^ (x >> uint64(30))) * uint64(0xbf58476d1ce4e5b9)
+  x = (x ^ (x >> uint64(27))) * uint64(0x94d049bb133111eb)
+  return x ^ (x >> uint64(31))
+
+def formula(numbers):
+  """Hill formula, e.g. C2N1O4"""
+  from collections import Counter
+  from ase.data import chemical_symbols
+  counts = Counter(chemical_symbols[number] for number in numbers)
+  order = [e for e in ["C","H"] if e in counts] + sorted(e for e in counts if e not in ["C","H"])
+  return "".join(e+str(counts[e]) for e in order)
+
+def identify_wl(structures, scale_factor = 1.2, iterations = 4, chunk = 4000000):
+  """Connectivity fingerprints of structures (without H, as identify_smiles) = formula + Weisfeiler-Lehman hash
+  Bonds are taken from covalent radii as in infer_bonds(), atom labels start as atomic numbers and are then
+  repeatedly hashed together with the sum of hashed neighbour labels. The sorted labels of all iterations give
+  a hash which does not depend on the order of atoms. Same-size structures are processed together."""
+  from numpy import uint64, nonzero, zeros, flatnonzero, add, where, sort, arange, concatenate
+  from hashlib import blake2b
+  from ase.data import covalent_radii
+  from descriptors import stack_structures
+  ids = [float("nan")]*len(structures)
+  for rows, positions, masses, numbers in stack_structures(structures):
+    n = positions.shape[1]
+    step = max(1, chunk//max(1, n*n))
+    for start in range(0, len(rows), step):
+      p = positions[start:start+step]
+      z = numbers[start:start+step]
+      g = len(p)
+      heavy = z != 1
+      radii = covalent_radii[z]
+      d = (((p[:,:,None,:]-p[:,None,:,:])**2).sum(axis = -1))**0.5
+      adjacency = (d < scale_factor*(radii[:,:,None] + radii[:,None,:])) & heavy[:,:,None] & heavy[:,None,:]
+      adjacency[:, arange(n), arange(n)] = False
+      s, i, j = nonzero(adjacency)
+      source = s*n + i
+      target = s*n + j
+      starts = flatnonzero(concatenate([[True], source[1:] != source[:-1]])) if len(source) > 0 else source
+      labels = mix(z.reshape(-1).astype(uint64))
+      history = []
+      for iteration in range(iterations):
+        neighbours = zeros(g*n, dtype = uint64)
+        if len(source) > 0:
+          neighbours[source[starts]] = add.reduceat(mix(labels[target]), starts)
+        labels = mix(labels*uint64(0x9e3779b97f4a7c15) + neighbours)
+        #H labels (0) are sorted first and cut away below
+        history.append(sort(where(heavy, labels.reshape(g,n), uint64(0)), axis = 1))
+      nH = (~heavy).sum(axis = 1)
+      for k in range(g):
+        digest = blake2b(b"".join(h[k, nH[k]:].tobytes() for h in history), digest_size = 8).hexdigest()
+        ids[rows[start+k]] = formula(z[k][heavy[k]])+"-"+digest
+  return ids
+
+def identify_batch(structures, Qsmiles = 0, Qcpu = 1):
+  """xyz/id1 of many structures: WL fingerprints (optionally in parallel), with Qsmiles = 1 replaced by RDKit
+  SMILES evaluated once per distinct fingerprint"""
+  from numpy import array_split, arange
+  structures = list(structures)
+  if Qcpu > 1 and len(structures) > 1000:
+    from multiprocessing import Pool
+    parts = [[structures[i] for i in part] for part in array_split(arange(len(structures)), 4*Qcpu)]
+    with Pool(Qcpu) as pool:
+      ids = [i for part in pool.map(identify_wl, parts) for i in part]
+  else:
+    ids = identify_wl(structures)
+  if Qsmiles == 1:
+    smiles = {}
+    for k, identity in enumerate(ids):
+      if isinstance(identity, str) and identity not in smiles:
+        smiles[identity] = identify_smiles(structures[k])
+    ids = [smiles[identity] if isinstance(identity, str) else identity for identity in ids]
+  return ids
+
 def identify_1(out):
+  from numpy import isnan
+  if type(out) == type(float(0)):
+    if isnan(out):
+      return out
+  try:
+    return identify_wl([out])[0]
+  except:
+    return float("nan")
+
+def identify_smiles(out):
   from numpy import isnan
   if type(out) == type(float(0)):
     if isnan(out):
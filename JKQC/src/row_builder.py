@@ -0,0 +1,59 @@
+####################################################################################################
+# ROW BUILDER
+# Append-only collector of JKQC rows. Each appended dictionary looks like the ones produced by the
+# readers, i.e. {("log","electronic_energy"):[value], ...}. Appending is amortized O(1) (only the
+# present columns are touched) and columns missing in some rows are filled with NaN once at the end.
+####################################################################################################
+
+class RowBuilder:
+  def __init__(self):
+    self.nrows = 0
+    self.columns = {} #column -> [row positions, values]
+
+  def __len__(self):
+    return self.nrows
+
+  def append(self, dic):
+    """Append dictionary with lists of values (all lists have the same length, usually 1)"""
+    if len(dic) == 0:
+      return
+    length = len(next(iter(dic.values())))
+    for key, values in dic.items():
+      if key not in self.columns:
+        self.columns[key] = [[], []]
+      rows, column = self.columns[key]
+      rows.extend(range(self.nrows, self.nrows+length))
+      column.extend(values)
+    self.nrows += length
+
+  def extend(self, other):
+    """Append all rows of another RowBuilder"""
+    for key, (rows, values) in other.columns.items():
+      if key not in self.columns:
+        self.columns[key] = [[], []]
+      self.columns[key][0].extend([self.nrows + row for row in rows])
+      self.columns[key][1].extend(values)
+    self.nrows += other.nrows
+
+  def to_dict(self, reverse = False):
+    """Dictionary of full columns (missing values = NaN), optionally with the rows in reverse order"""
+    missing = float("nan")
+    dic = {}
+    for key, (rows, values) in self.columns.items():
+      if len(rows) == self.nrows:
+        column = list(values)
+      else:
+        column = [missing]*self.nrows
+        for row, value in zip(rows, values):
+          column[row] = value
+      if reverse:
+        column.reverse()
+      dic[key] = column
+    return dic
+
+  def finalize(self, reverse = False, index = None):
+    """Build JKQC (MultiIndex) DataFrame from all rows"""
+    from pandas import DataFrame
+    if index is None:
+      index = range(self.nrows)
+    return DataFrame(self.to_dict(reverse), index = index)
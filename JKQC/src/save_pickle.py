@@ -1,8 +1,87 @@
-def save_pickle(tosave,output_pkl,Qsplit,Qout):
+####################################################################################################
+# SAVING THE DATABASE
+# With -split, the rows are partitioned by position (no row is written twice) and the shards are
+# written concurrently by forked processes which see the database without copying it. Shards can
+# be compressed (-compress: zstd if available, otherwise fast gzip) and a small manifest
+# (<output>.manifest.json) lists them, so that JKQC (-in) and JKML can read them as one database.
+####################################################################################################
+
+MANIFEST_VERSION = 1
+
+_tosave = None
+
+def is_manifest(filename):
+  return filename.endswith(".manifest.json")
+
+def manifest_name(output_pkl):
+  from columnar_db import is_columnar
+  extension = ".jkqc" if is_columnar(output_pkl) else ".pkl"
+  return output_pkl[:-len(extension)]+".manifest.json"
+
+def read_manifest(input_manifest):
+  """Shard files (with paths) listed in the manifest"""
+  from json import load
+  from os import path
+  with open(input_manifest, "r") as f:
+    manifest = load(f)
+  if manifest["version"] > MANIFEST_VERSION:
+    print("The manifest "+input_manifest+" was written by a newer JKQC version. [EXITING]")
+    exit()
+  folder = path.dirname(input_manifest)
+  return [path.join(folder, shard["file"]) for shard in manifest["shards"]]
+
+def write_manifest(output_manifest, shards, nrows, columns, compression = None):
+  """shards = list of (file, number of rows)"""
+  from json import dump
+  from os import path
+  manifest = {
+    "version"     : MANIFEST_VERSION,
+    "nrows"       : int(sum(nrows)),
+    "compression" : compression,
+    "columns"     : [list(column) if isinstance(column, tuple) else [column] for column in columns],
+    "shards"      : [{"file":path.basename(shard), "nrows":int(n)} for shard, n in zip(shards, nrows)],
+  }
+  with open(output_manifest, "w") as f:
+    dump(manifest, f, indent = 1)
+
+def compression_codec(Qcompress):
+  """pandas compression argument and file suffix for -compress"""
+  if Qcompress == 0:
+    return None, ""
+  try:
+    import zstandard
+    return {"method":"zstd", "level":3}, ".zst"
+  except ImportError:
+    return {"method":"gzip", "compresslevel":1}, ".gz"
+
+def write_shard(task):
+  """Write rows start:end of the (inherited) database"""
+  start, end, filename, compression = task
+  from columnar_db import is_columnar
+  shard = _tosave.iloc[start:end]
+  if is_columnar(filename):
+    from columnar_db import save_columnar
+    save_columnar(shard.reset_index(drop=True), filename)
+  else:
+    shard.to_pickle(filename, compression = compression)
+  return end - start
+
+def save_pickle(tosave,output_pkl,Qsplit,Qout,Qcompress = 0,Qcpu = 1):
+  global _tosave
   tosave = tosave.reset_index(drop=True)
+  from columnar_db import is_columnar
+  if is_columnar(output_pkl):
+    from columnar_db import save_columnar as write_database
+    extension = ".jkqc"
+    compression, suffix = None, ""
+  else:
+    compression, suffix = compression_codec(Qcompress)
+    write_database = lambda df,filename: df.to_pickle(filename, compression = compression)
+    extension = ".pkl"
   if Qsplit == 1:
+    output_pkl = output_pkl+suffix
     try:
-      tosave.to_pickle(output_pkl)
+      write_database(tosave,output_pkl)
     except:
       print("Pickle was not written down due to an error.")
     if Qout >= 1:
@@ -19,13 +98,26 @@ def save_pickle(tosave,output_pkl,Qsplit,Qout):
         print(tosave)
         print("No files in the input!")
     else:
+      #contiguous, non-overlapping row ranges
       lengths = -(-len(tosave)//Qsplit)
+      tasks = []
       for split in range(Qsplit):
-        output_pkl_split = output_pkl[:-4]+"_s"+str(split+1)+".pkl"
-        start=split*lengths
-        end=(split+1)*lengths
-        if end > len(tosave):
-          end = len(tosave)
-        tosave.loc[start:end].to_pickle(output_pkl_split)
-        if Qout >= 1:
-          print("Number of files in "+output_pkl_split+": "+str(len(tosave.loc[start:end])))
+        output_pkl_split = output_pkl[:-len(extension)]+"_s"+str(split+1)+extension+suffix
+        start = min(split*lengths, len(tosave))
+        end = min(start+lengths, len(tosave))
+        tasks.append((start, end, output_pkl_split, compression))
+      _tosave = tosave
+      try:
+        from multiprocessing import get_all_start_methods, get_context
+        if Qcpu > 1 and "fork" in get_all_start_methods():
+          with get_context("fork").Pool(min(Qcpu, Qsplit)) as pool:
+            written = pool.map(write_shard, tasks, chunksize = 1)
+        else:
+          written = [write_shard(task) for task in tasks]
+      finally:
+        _tosave = None
+      write_manifest(manifest_name(output_pkl), [task[2] for task in tasks], written, tosave.columns, None if compression is None else compression["method"])
+      if Qout >= 1:
+        for task, n in zip(tasks, written):
+          print("Number of files in "+task[2]+": "+str(n))
+        print("Manifest: "+manifest_name(output_pkl))
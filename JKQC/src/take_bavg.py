@@ -90,3 +90,45 @@ def take_bavg(output, clusters_df, Qbavg, Qt, QUenergy, Pout, Qclustername):
     newoutput.append(array(toappend, dtype=object))
   output = array(newoutput)
   return output
+
+def take_sweep(clusters_df, sweep, Qtemps, Qglob, Qbavg, QUenergy, Qformation):
+  """Gibbs free energies of a temperature sweep (-temp start:stop:step) in the format of output
+  (first row = names, then one row per temperature). With -glob/-bavg (-globout/-bavgout) the values
+  are taken for each cluster type, for all temperatures at once."""
+  from numpy import unique, exp, log, array, isnan, nanmin, where, errstate
+  missing = float("nan")
+  k = 1.380662*10**-23 # [J/K]
+  T = array(Qtemps)
+
+  GFE = sweep
+  if Qglob == 2 or Qbavg == 2:
+    try:
+      GFE = GFE + (clusters_df.loc[:,("out","electronic_energy")].values - clusters_df.loc[:,("log","electronic_energy")].values).astype(float)[:,None]
+    except:
+      GFE = GFE + missing
+
+  if Qglob == 0 and Qbavg == 0:
+    if Qformation == 1:
+      names = clusters_df.loc[:,("info","cluster_type")].values
+    else:
+      names = clusters_df.loc[:,("info","file_basename")].values
+    values = QUenergy*GFE
+  else:
+    cluster_types = clusters_df.loc[:,("info","cluster_type")].values
+    names = unique(cluster_types)
+    values = []
+    with errstate(all = "ignore"):
+      for i in names:
+        GFE_i = GFE[cluster_types == i]
+        minimum = nanmin(GFE_i, axis = 0) if len(GFE_i) > 0 else T*missing
+        if Qglob > 0:
+          values.append(QUenergy*minimum)
+          continue
+        preportions = where(isnan(GFE_i), 0, exp(-(GFE_i-minimum)*43.60*10**-19/k/T))
+        values.append(QUenergy*(minimum - 1/43.60/10**-19*k*T*log(preportions.sum(axis = 0))))
+    values = array(values).reshape(len(names), len(T))
+
+  output = [array(names, dtype = object)]
+  for j in range(len(T)):
+    output.append(array(values[:,j], dtype = object))
+  return array(output)
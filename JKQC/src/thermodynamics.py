@@ -1,3 +1,61 @@
+####################################################################################################
+# THERMODYNAMICS (-qha)
+# All clusters are treated at once: the frequency lists are packed into one NaN-padded 2D array
+# (rows = clusters, valid entries given by mask) and the corrections are evaluated column-wise with
+# numpy. The results are written back as whole columns. The results (incl. the treatment of missing
+# or invalid data) are the same as of the former loop over clusters.
+####################################################################################################
+
+h = 6.626176*10**-34 #m^2 kg s^-1
+R = 1.987 #cal/mol/K #=8.31441
+k = 1.380662*10**-23 #m^2 kg s^-2 K^-1
+c = 2.99793*10**10 #cm s^-1
+
+missing = float("nan")
+
+#keywords of -anh which are not a plain scaling factor
+ANH_KEYWORDS = {"anh","anh2","B97-3c_1","B97-3c_2","B97-3c_sf","B97-3c_mult","r2SCAN-3c_1","r2SCAN-3c_2","r2SCAN-3c_sf","r2SCAN-3c_mult","wb97-3c_1","wb97-3c_2","wb97-3c_sf","wb97-3c_mult","wB97X-D_1", "wB97X-D_2","wB97X-D_sf","wB97X-D_mult"}
+
+SCALING_B97_3c_mult = [1.00058, 0.999846, 0.935579, 0.967753, 0.964498, 0.964641, 0.948904, 0.96143, 0.962068, 0.965688, 0.972093, 0.971545, 0.971685, 0.973273, 0.971551, 0.969923, 0.968905, 0.962642, 0.974881, 0.326225, 0.325892, 0.41384, 0.441502, 0.526397, 0.687563, 0.758214, 0.803279, 0.806293, 0.844447, 0.941828, 0.961305, 0.95736, 0.955739, 0.919227, 0.947026, 0.951936, 0.950952, 0.945497, 0.951473, 0.954571, 0.954571]
+SCALING_r2SCAN_mult = [0.993869, 0.929885, 0.940778, 0.962749, 0.970478, 0.967294, 0.953732, 0.964591, 0.966077, 0.973015, 0.976342, 0.972922, 0.972205, 0.974236, 0.973522, 0.97198, 0.972194, 0.970429, 0.946279, 0.450775, 0.429606, 0.533808, 0.593157, 0.657998, 0.747984, 0.78632, 0.802993, 0.852336, 0.879202, 0.947577, 0.961449, 0.954227, 0.91328, 0.925493, 0.956013, 0.953386, 0.949111, 0.951456, 0.954239, 0.956302, 0.956302]
+SCALING_wB97X_3c_mult = [0.938768, 0.905829, 0.921018, 0.942186, 0.959706, 0.964414, 0.950646, 0.955143, 0.964944, 0.968226, 0.979111, 0.976256, 0.974098, 0.97433, 0.975238, 0.973679, 0.970807, 0.968801, 0.974567, 0.978848, 0.30976, 0.342098, 0.420479, 0.553954, 0.693097, 0.733632, 0.76931, 0.804974, 0.83931, 0.876033, 0.950491, 0.962892, 0.958473, 0.915792, 0.946232, 0.956013, 0.955388, 0.9524, 0.952433, 0.955203, 0.955203]
+SCALING_wB97X_D_mult = [1.00058, 0.999846, 0.935579, 0.967753, 0.964498, 0.964641, 0.948904, 0.96143, 0.962068, 0.965688, 0.972093, 0.971545, 0.971685, 0.973273, 0.971551, 0.969923, 0.968905, 0.962642, 0.974881, 0.326225, 0.325892, 0.41384, 0.441502, 0.526397, 0.687563, 0.758214, 0.803279, 0.806293, 0.844447, 0.941828, 0.961305, 0.95736, 0.955739, 0.919227, 0.947026, 0.951936, 0.950952, 0.945497, 0.951473, 0.954571, 0.954571]
+
+def binned_scaling(x, scaling):
+  """Scaling factor taken from 100 cm-1 wide bins between 0 and 4000 cm-1 (last one for > 4000 cm-1, 0 otherwise)"""
+  from numpy import zeros_like, array, errstate
+  factor = zeros_like(x)
+  with errstate(invalid = "ignore"):
+    inside = (x >= 0) & (x < 4000)
+    factor[inside] = array(scaling)[(x[inside]//100).astype(int)]
+    factor[x > 4000] = scaling[40]
+  return factor*x
+
+def two_scalings(x, low, high):
+  from numpy import where, errstate
+  with errstate(invalid = "ignore"):
+    return where(x < 2000, low*x, high*x)
+
+#frequency corrections applied to all frequencies (array) at once
+ANH_SCALINGS = {
+  "B97-3c_1"     : lambda x: 0.944*x,
+  "B97-3c_2"     : lambda x: two_scalings(x, 0.967, 0.937),
+  "B97-3c_sf"    : lambda x: (0.969507 - 8.55527*10**-6*x + 1.99602/(-0.0447777 + x))*x,
+  "B97-3c_mult"  : lambda x: binned_scaling(x, SCALING_B97_3c_mult),
+  "r2SCAN-3c_1"  : lambda x: 0.950*x,
+  "r2SCAN_2"     : lambda x: two_scalings(x, 0.969, 0.944),
+  "r2SCAN_sf"    : lambda x: (1.0211 - 1.59745*10**-5*x - 102.482/(1517.15 + x))*x,
+  "r2SCAN_mult"  : lambda x: binned_scaling(x, SCALING_r2SCAN_mult),
+  "wB97X-3c_1"   : lambda x: 0.954*x,
+  "wB97X-3c_2"   : lambda x: two_scalings(x, 0.971, 0.949),
+  "wB97X-3c_sf"  : lambda x: (1.07555 - 2.42816*10**-5*x - 188.46/(1179.03 + x))*x,
+  "wB97X-3c_mult": lambda x: binned_scaling(x, SCALING_wB97X_3c_mult),
+  "wB97X-D_1"    : lambda x: 0.950*x,
+  "wB97X-D_2"    : lambda x: two_scalings(x, 0.967, 0.945),
+  "wB97X-D_sf"   : lambda x: (0.961752 - 3.89697*10**-6*x + 2.814/(5.5432 + x))*x,
+  "wB97X-D_mult" : lambda x: binned_scaling(x, SCALING_wB97X_D_mult),
+}
+
 def replace_by_nonnegative(new, orig, q):
   from numpy import array
   if q == 0:
@@ -9,323 +67,341 @@ def replace_by_nonnegative(new, orig, q):
   orig[mask] = new[mask]
   return list(orig)
 
-def thermodynamics(clusters_df, Qanh, Qafc, Qfc, Qt, Qdropimg):
-  from numpy import array, sum, log, exp, isnan, mean, pi
-  from pandas import isna
-  missing = float("nan")
+def pack_frequencies(vibs, width = None):
+  """Pack lists of frequencies into a NaN-padded 2D array
+  returns freqs (N x width), mask (valid entries), counts (N) and islist (N, False e.g. for missing frequencies)"""
+  from numpy import array, full, arange, fromiter, ndarray
+  from itertools import chain
+  islist = array([isinstance(v, (list, tuple, ndarray)) for v in vibs], dtype = bool)
+  counts = array([len(v) if l else 0 for v, l in zip(vibs, islist)], dtype = int)
+  if width is None:
+    width = max(counts.max() if len(counts) > 0 else 0, 1)
+  freqs = full((len(vibs), width), missing)
+  mask = arange(width)[None,:] < counts[:,None]
+  fits = counts <= width
+  flat = fromiter(chain.from_iterable(v for v, l, f in zip(vibs, islist, fits) if l and f), dtype = float, count = counts[fits].sum())
+  freqs[mask & fits[:,None]] = flat
+  return freqs, mask, counts, islist
+
+def unpack_frequencies(freqs, counts, islist, vibs):
+  rows = freqs.tolist()
+  return [row[:n] if l else v for row, n, l, v in zip(rows, counts, islist, vibs)]
+
+def first_frequency(freqs, counts, islist):
+  """float(vib[0]) for each cluster, 0 if there is no frequency"""
+  from numpy import zeros
+  lf = zeros(len(counts))
+  has = islist & (counts > 0)
+  lf[has] = freqs[has,0]
+  return lf
+
+def vibrational_entropy(freqs, mask, T):
+  """Sum of the harmonic vibrational entropies [cal/mol/K] for each cluster at temperature(s) T"""
+  from numpy import exp, log, where, errstate
+  with errstate(all = "ignore"):
+    x = h*freqs*c/k/T[:,None]
+    Sv = R*x/(exp(x)-1)-R*log(1-exp(-x))
+  return where(mask, Sv, 0).sum(axis = 1)
+
+def vibrational_energy(freqs, mask, T):
+  """Sum of the harmonic vibrational energies (incl. ZPE) [cal/mol] for each cluster at temperature(s) T"""
+  from numpy import exp, where, errstate
+  with errstate(all = "ignore"):
+    theta = R*h*freqs*c/k
+    Ev = theta/(exp(h*freqs*c/k/T[:,None])-1)+theta*0.5
+  return where(mask, Ev, 0).sum(axis = 1)
+
+def low_frequency_correction(freqs, mask, T, mi, cutoff):
+  """Sv_corr - Sv_each of the low vibrational frequency treatment (interpolation to free rotor entropy)"""
+  from numpy import exp, log, where, errstate, pi
+  with errstate(all = "ignore"):
+    T = T[:,None]
+    mi = mi[:,None]
+    mu = h/(8*pi**2*c*freqs)
+    Sr = R*(0.5+log((8*pi**2.99793*(mu*mi/(mu+mi))*k*T/h**2)**0.5)) #cal/mol/K
+    x = h*freqs*c/k/T
+    Sv = R*x/(exp(x)-1)-R*log(1-exp(-x)) #cal/mol/K
+    w = 1/(1+(cutoff/freqs)**4)
+    Sv_corr = where(mask, w*Sv+(1-w)*Sr, 0).sum(axis = 1)
+  return Sv_corr - where(mask, Sv, 0).sum(axis = 1)
 
-  h = 6.626176*10**-34 #m^2 kg s^-1
-  R = 1.987 #cal/mol/K #=8.31441
-  k = 1.380662*10**-23 #m^2 kg s^-2 K^-1
+def mean_moments_of_inertia(structures):
+  """mean(structure.get_moments_of_inertia()) of all structures at once (= trace of inertia tensor / 3), NaN if missing"""
+  from numpy import array, full, concatenate, bincount, repeat, arange, errstate
+  from ase import Atoms
+  result = full(len(structures), missing)
+  present = array([isinstance(s, Atoms) for s in structures], dtype = bool)
+  atoms = [s for s, p in zip(structures, present) if p]
+  if len(atoms) == 0:
+    return result
+  natoms = array([len(s) for s in atoms])
+  ids = repeat(arange(len(atoms)), natoms)
+  positions = concatenate([s.positions for s in atoms])
+  masses = concatenate([s.get_masses() for s in atoms])
+  with errstate(all = "ignore"):
+    total = bincount(ids, masses, minlength = len(atoms))
+    com = array([bincount(ids, masses*positions[:,j], minlength = len(atoms)) for j in range(3)]).T/total[:,None]
+    relative = positions - com[ids]
+    result[present] = 2*bincount(ids, masses*(relative**2).sum(axis = 1), minlength = len(atoms))/3
+  return result
+
+def resolve_temperature(Qt, temperature, rows):
+  """Temperature used if -temp was not given
+  As before, Qt takes the temperature of the first processed cluster with a known temperature and this is then used
+  for all following clusters. Returns new Qt and the temperature for each cluster."""
+  from numpy import full, isnan, where
+  if not isnan(Qt):
+    return Qt, full(len(rows), Qt)
+  if temperature is None:
+    if rows.any():
+      return 298.15, full(len(rows), 298.15)
+    return Qt, full(len(rows), Qt)
+  T = temperature.copy()
+  candidates = where(rows & ~isnan(temperature))[0]
+  if len(candidates) == 0:
+    return Qt, T
+  Qt = temperature[candidates[0]]
+  T[candidates[0]:] = Qt
+  return Qt, T
+
+def prepare_thermodynamics(clusters_df, Qanh, Qafc, Qfc, Qdropimg):
+  """Temperature independent part: packed frequencies after -dropimg and -anh (still at the original temperatures)"""
+  from numpy import isnan, argsort, take_along_axis, arange, full, array, where, errstate
+
+  n = len(clusters_df)
+  def get(label, name):
+    if (label, name) in clusters_df.columns:
+      return clusters_df[(label, name)].values.astype(float)
+    return full(n, missing)
+  def get_structures():
+    if ("xyz","structure") in clusters_df.columns:
+      return clusters_df[("xyz","structure")].values
+    return array([missing]*n, dtype = object)
+
+  data = {"n": n}
+  if ("log","vibrational_frequencies") in clusters_df.columns:
+    data["vibs"] = clusters_df[("log","vibrational_frequencies")].values
+    data["Qvibs"] = 1
+  else:
+    data["vibs"] = array([missing]*n, dtype = object)
+    data["Qvibs"] = 0
+  freqs, mask, counts, islist = pack_frequencies(data["vibs"])
+  data["Qvibs_changed"] = 0
+  new = {}
+  for name in ["entropy","enthalpy_energy","enthalpy_thermal_correction","internal_energy","energy_thermal_correction","zero_point_correction","zero_point_energy"]:
+    new[name] = get("log", name)
+  data["electronic_energy"] = get("log","electronic_energy")
+  if ("log","temperature") in clusters_df.columns:
+    data["temperature"] = clusters_df[("log","temperature")].values.astype(float)
+  else:
+    data["temperature"] = None
+  if Qafc > 0 or Qfc > 0:
+    data["mi"] = mean_moments_of_inertia(get_structures())
 
   if Qdropimg != 0:
-    for i in range(len(clusters_df)):
-      vib = clusters_df.at[i,("log","vibrational_frequencies")]
-      if type(vib) == type(missing):
-        continue
-      clusters_df.at[i,("log","vibrational_frequencies")] = [item for item in vib if item >= 0]
+    with errstate(invalid = "ignore"):
+      keep = mask & (freqs >= 0)
+    order = argsort(~keep, axis = 1, kind = "stable")
+    freqs = take_along_axis(freqs, order, axis = 1)
+    counts = keep.sum(axis = 1)
+    mask = arange(freqs.shape[1])[None,:] < counts[:,None]
+    freqs[~mask] = missing
+    data["Qvibs_changed"] = 1
 
-  ########################################################
-  # LOW VIBRATIONAL FREQUNECY ANTITREATMENT (S // G,Gc) ##
-  ########################################################
+  #-afc is applied to the frequencies before scaling
   if Qafc > 0:
-    for i in range(len(clusters_df)):
-      try:
-        lf = float(clusters_df.at[i,("log","vibrational_frequencies")][0])
-      except:
-        lf = 0
-      if lf <= 0:
-        clusters_df.at[i,("log","entropy")] = missing
-        continue
-      if isnan(Qt):
-        try:
-          Qt = clusters_df.at[i,("log","temperature")]
-        except:
-          Qt = 298.15
-      vibs = clusters_df.at[i,("log","vibrational_frequencies")]
-      structure = clusters_df.at[i,("xyz","structure")]
-
-      mu = [float(h/(8*pi**2*2.99793*10**10*vib)) for vib in vibs]
-      try:
-        mi = mean(structure.get_moments_of_inertia())
-        Sr = [R*(0.5+log((8*pi**2.99793*(mu[j]*mi/(mu[j]+mi))*k*Qt/h**2)**0.5)) for j in range(len(mu))]  #cal/mol/K
-        Sv = [R*h*vib*2.99793*10**10/k/Qt/(exp(h*vib*2.99793*10**10/k/Qt)-1)-R*log(1-exp(-h*vib*2.99793*10**10/k/Qt)) for vib in vibs] #cal/mol/K
-        w = [1/(1+(Qafc/vib)**4) for vib in vibs]
-        Sv_corr = sum([w[j]*Sv[j]+(1-w[j])*Sr[j] for j in range(len(w))])
-        Sv_each = sum(Sv)  #cal/mol/K
-        clusters_df.at[i,("log","entropy")] = clusters_df.at[i,("log","entropy")]-(Sv_corr-Sv_each)
-      except:
-        mi = missing
-        clusters_df.at[i,("log","entropy")] = missing
-    ###
- 
+    data["afc"] = (freqs.copy(), mask.copy(), counts.copy(), islist.copy())
+
   #########################
   ## VIBRATIONAL SCALING ##
   #########################
   if Qanh != "1":
     # VIBRATIONAL FREQ MODIFICATION e.g. anharmonicity (vib.freq.,ZPE,ZPEc,U,Uc,H,Hc,S // G,Gc)
-    for i in range(len(clusters_df)):
+    from ase import Atoms
+    structures = get_structures()
+    natoms = array([len(s) if isinstance(s, Atoms) else 0 for s in structures])
+    if (natoms == 0).any():
+      print("Structure is missing.")
+    lf = first_frequency(freqs, counts, islist)
+    lf[(isnan(freqs) & mask).any(axis = 1)] = 0
+    lf[natoms == 0] = 0
+    skip = natoms == 1
+    bad = ~skip & (lf <= 0)
+    rows = ~skip & ~bad
+    for name in new:
+      new[name][bad] = missing
+    QtOLD = data["temperature"][rows] if data["temperature"] is not None else full(rows.sum(), 298.15)
+
+    F = freqs[rows]
+    M = mask[rows]
+    Sv_OLD = vibrational_entropy(F, M, QtOLD) #cal/mol/K
+    Ev_OLD = vibrational_energy(F, M, QtOLD)
+    #
+    failed = full(len(F), False)
+    if str(Qanh) not in ANH_KEYWORDS:
       try:
-        structure = clusters_df.at[i,("xyz","structure")]
-        if isna(structure): 
-          print("Structure is missing.")
-        test = len(structure.get_atomic_numbers())
+        F = float(Qanh) * F
       except:
-        test = 0
-        lf = 0
-      if test != 1:
-        if test != 0:
-          try:
-            QtOLD = clusters_df.at[i,("log","temperature")]
-          except:
-            QtOLD = 298.15
-          try:
-            lf = float(clusters_df.at[i,("log","vibrational_frequencies")][0])
-          except:
-            lf = 0
-          try: 
-            if isna(clusters_df.at[i,("log","vibrational_frequencies")]).any():
-              lf = 0
-          except:
-            lf = 0
-        if lf <= 0:
-          clusters_df.at[i,("log","entropy")] = missing
-          clusters_df.at[i,("log","enthalpy_energy")] = missing
-          clusters_df.at[i,("log","enthalpy_thermal_correction")] = missing
-          clusters_df.at[i,("log","internal_energy")] = missing
-          clusters_df.at[i,("log","energy_thermal_correction")] = missing
-          clusters_df.at[i,("log","zero_point_correction")] = missing
-          clusters_df.at[i,("log","zero_point_energy")] = missing
-          continue
-        try:
-          Sv_OLD = sum([R*h*vib*2.99793*10**10/k/QtOLD/(exp(h*vib*2.99793*10**10/k/QtOLD)-1)-R*log(1-exp(-h*vib*2.99793*10**10/k/QtOLD)) for vib in clusters_df.at[i,("log","vibrational_frequencies")]]) #cal/mol/K
-          Ev_OLD = sum([R*h*vib*2.99793*10**10/k/(exp(h*vib*2.99793*10**10/k/QtOLD)-1)+R*h*vib*2.99793*10**10/k*0.5 for vib in clusters_df.at[i,("log","vibrational_frequencies")]])
-        except:
-          Sv_OLD = missing
-          Ev_OLD = missing
-        #
-        if str(Qanh) not in {"anh","anh2","B97-3c_1","B97-3c_2","B97-3c_sf","B97-3c_mult","r2SCAN-3c_1","r2SCAN-3c_2","r2SCAN-3c_sf","r2SCAN-3c_mult","wb97-3c_1","wb97-3c_2","wb97-3c_sf","wb97-3c_mult","wB97X-D_1", "wB97X-D_2","wB97X-D_sf","wB97X-D_mult"}:
-          try:
-            clusters_df.at[i,("log","vibrational_frequencies")] = [float(Qanh) * j for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-          except:
-            clusters_df.at[i,("log","vibrational_frequencies")] = [missing]
+        failed[:] = True
+    elif Qanh in ANH_SCALINGS:
+      F = ANH_SCALINGS[Qanh](F)
+    else:
+      q = 0 if Qanh == "anh" else 1
+      if ("extra","anharm") in clusters_df.columns:
+        anharm = clusters_df[("extra","anharm")].values[rows]
+      else:
+        anharm = array([missing]*len(F), dtype = object)
+      A, _, Acounts, Aislist = pack_frequencies(anharm, width = F.shape[1])
+      same = Aislist & (Acounts == counts[rows])
+      with errstate(invalid = "ignore"):
+        if q == 0:
+          replace = (A > 0) & M & same[:,None]
+          failed = ~same & (Aislist | (counts[rows] != 1))
         else:
-          try:
-            if Qanh == "anh":
-              clusters_df.at[i,("log","vibrational_frequencies")] = replace_by_nonnegative(clusters_df.at[i,("extra","anharm")],clusters_df.at[i,("log","vibrational_frequencies")],0)
-            ########################################################
-            elif Qanh == "B97-3c_1":
-              def anh_corr(x):
-                return 0.944*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "B97-3c_2":
-              def anh_corr(x):
-                if x < 2000:
-                  return 0.967*x
-                else:
-                  return 0.937*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "B97-3c_sf":
-              def anh_corr(x):
-                return (0.969507 - 8.55527*10**-6*x + 1.99602/(-0.0447777 + x))*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "B97-3c_mult":
-              from numpy import piecewise
-              def anh_corr(x):
-                scaling = [1.00058, 0.999846, 0.935579, 0.967753, 0.964498, 0.964641, 0.948904, 0.96143, 0.962068, 0.965688, 0.972093, 0.971545, 0.971685, 0.973273, 0.971551, 0.969923, 0.968905, 0.962642, 0.974881, 0.326225, 0.325892, 0.41384, 0.441502, 0.526397, 0.687563, 0.758214, 0.803279, 0.806293, 0.844447, 0.941828, 0.961305, 0.95736, 0.955739, 0.919227, 0.947026, 0.951936, 0.950952, 0.945497, 0.951473, 0.954571, 0.954571]
-                return piecewise(x,[(x>=0)&(x<100), (x>=100)&(x<200), (x>=200)&(x<300), (x>=300)&(x<400), (x>=400)&(x<500), (x>=500)&(x<600), (x>=600)&(x<700), (x>=700)&(x<800), (x>=800)&(x<900), (x>=900)&(x<1000), (x>=1000)&(x<1100), (x>=1100)&(x<1200), (x>=1200)&(x<1300), (x>=1300)&(x<1400), (x>=1400)&(x<1500), (x>=1500)&(x<1600), (x>=1600)&(x<1700), (x>=1700)&(x<1800), (x>=1800)&(x<1900), (x>=1900)&(x<2000), (x>=2000)&(x<2100), (x>=2100)&(x<2200), (x>=2200)&(x<2300), (x>=2300)&(x<2400), (x>=2400)&(x<2500), (x>=2500)&(x<2600), (x>=2600)&(x<2700), (x>=2700)&(x<2800), (x>=2800)&(x<2900), (x>=2900)&(x<3000), (x>=3000)&(x<3100), (x>=3100)&(x<3200), (x>=3200)&(x<3300), (x>=3300)&(x<3400), (x>=3400)&(x<3500), (x>=3500)&(x<3600), (x>=3600)&(x<3700), (x>=3700)&(x<3800), (x>=3800)&(x<3900), (x>=3900)&(x<4000),x>4000],scaling)*x
-               
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            ########################################################
-            elif Qanh == "r2SCAN-3c_1":
-              def anh_corr(x):
-                return 0.950*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "r2SCAN_2":
-              def anh_corr(x):
-                if x < 2000:
-                  return 0.969*x
-                else:
-                  return 0.944*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "r2SCAN_sf":
-              def anh_corr(x):
-                return (1.0211 - 1.59745*10**-5*x - 102.482/(1517.15 + x))*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "r2SCAN_mult":
-              from numpy import piecewise
-              def anh_corr(x):
-                scaling = [0.993869, 0.929885, 0.940778, 0.962749, 0.970478, 0.967294, 0.953732, 0.964591, 0.966077, 0.973015, 0.976342, 0.972922, 0.972205, 0.974236, 0.973522, 0.97198, 0.972194, 0.970429, 0.946279, 0.450775, 0.429606, 0.533808, 0.593157, 0.657998, 0.747984, 0.78632, 0.802993, 0.852336, 0.879202, 0.947577, 0.961449, 0.954227, 0.91328, 0.925493, 0.956013, 0.953386, 0.949111, 0.951456, 0.954239, 0.956302, 0.956302]
-                return piecewise(x,[(x>=0)&(x<100), (x>=100)&(x<200), (x>=200)&(x<300), (x>=300)&(x<400), (x>=400)&(x<500), (x>=500)&(x<600), (x>=600)&(x<700), (x>=700)&(x<800), (x>=800)&(x<900), (x>=900)&(x<1000), (x>=1000)&(x<1100), (x>=1100)&(x<1200), (x>=1200)&(x<1300), (x>=1300)&(x<1400), (x>=1400)&(x<1500), (x>=1500)&(x<1600), (x>=1600)&(x<1700), (x>=1700)&(x<1800), (x>=1800)&(x<1900), (x>=1900)&(x<2000), (x>=2000)&(x<2100), (x>=2100)&(x<2200), (x>=2200)&(x<2300), (x>=2300)&(x<2400), (x>=2400)&(x<2500), (x>=2500)&(x<2600), (x>=2600)&(x<2700), (x>=2700)&(x<2800), (x>=2800)&(x<2900), (x>=2900)&(x<3000), (x>=3000)&(x<3100), (x>=3100)&(x<3200), (x>=3200)&(x<3300), (x>=3300)&(x<3400), (x>=3400)&(x<3500), (x>=3500)&(x<3600), (x>=3600)&(x<3700), (x>=3700)&(x<3800), (x>=3800)&(x<3900), (x>=3900)&(x<4000),x>4000],scaling)*x
-
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            ########################################################
-            elif Qanh == "wB97X-3c_1":
-              def anh_corr(x):
-                return 0.954*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "wB97X-3c_2":
-              def anh_corr(x):
-                if x < 2000:
-                  return 0.971*x
-                else:
-                  return 0.949*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "wB97X-3c_sf":
-              def anh_corr(x):
-                return (1.07555 - 2.42816*10**-5*x - 188.46/(1179.03 + x))*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "wB97X-3c_mult":
-              from numpy import piecewise
-              def anh_corr(x):
-                scaling = [0.938768, 0.905829, 0.921018, 0.942186, 0.959706, 0.964414, 0.950646, 0.955143, 0.964944, 0.968226, 0.979111, 0.976256, 0.974098, 0.97433, 0.975238, 0.973679, 0.970807, 0.968801, 0.974567, 0.978848, 0.30976, 0.342098, 0.420479, 0.553954, 0.693097, 0.733632, 0.76931, 0.804974, 0.83931, 0.876033, 0.950491, 0.962892, 0.958473, 0.915792, 0.946232, 0.956013, 0.955388, 0.9524, 0.952433, 0.955203, 0.955203]
-                return piecewise(x,[(x>=0)&(x<100), (x>=100)&(x<200), (x>=200)&(x<300), (x>=300)&(x<400), (x>=400)&(x<500), (x>=500)&(x<600), (x>=600)&(x<700), (x>=700)&(x<800), (x>=800)&(x<900), (x>=900)&(x<1000), (x>=1000)&(x<1100), (x>=1100)&(x<1200), (x>=1200)&(x<1300), (x>=1300)&(x<1400), (x>=1400)&(x<1500), (x>=1500)&(x<1600), (x>=1600)&(x<1700), (x>=1700)&(x<1800), (x>=1800)&(x<1900), (x>=1900)&(x<2000), (x>=2000)&(x<2100), (x>=2100)&(x<2200), (x>=2200)&(x<2300), (x>=2300)&(x<2400), (x>=2400)&(x<2500), (x>=2500)&(x<2600), (x>=2600)&(x<2700), (x>=2700)&(x<2800), (x>=2800)&(x<2900), (x>=2900)&(x<3000), (x>=3000)&(x<3100), (x>=3100)&(x<3200), (x>=3200)&(x<3300), (x>=3300)&(x<3400), (x>=3400)&(x<3500), (x>=3500)&(x<3600), (x>=3600)&(x<3700), (x>=3700)&(x<3800), (x>=3800)&(x<3900), (x>=3900)&(x<4000),x>4000],scaling)*x
-
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            ########################################################
-            elif Qanh == "wB97X-D_1":
-              def anh_corr(x):
-                return 0.950*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "wB97X-D_2":
-              def anh_corr(x):
-                if x < 2000:
-                  return 0.967*x
-                else:
-                  return 0.945*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "wB97X-D_sf":
-              def anh_corr(x):
-                return (0.961752 - 3.89697*10**-6*x + 2.814/(5.5432 + x))*x
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            elif Qanh == "wB97X-D_mult":
-              from numpy import piecewise
-              def anh_corr(x):
-                scaling = [1.00058, 0.999846, 0.935579, 0.967753, 0.964498, 0.964641, 0.948904, 0.96143, 0.962068, 0.965688, 0.972093, 0.971545, 0.971685, 0.973273, 0.971551, 0.969923, 0.968905, 0.962642, 0.974881, 0.326225, 0.325892, 0.41384, 0.441502, 0.526397, 0.687563, 0.758214, 0.803279, 0.806293, 0.844447, 0.941828, 0.961305, 0.95736, 0.955739, 0.919227, 0.947026, 0.951936, 0.950952, 0.945497, 0.951473, 0.954571, 0.954571]
-                return piecewise(x,[(x>=0)&(x<100), (x>=100)&(x<200), (x>=200)&(x<300), (x>=300)&(x<400), (x>=400)&(x<500), (x>=500)&(x<600), (x>=600)&(x<700), (x>=700)&(x<800), (x>=800)&(x<900), (x>=900)&(x<1000), (x>=1000)&(x<1100), (x>=1100)&(x<1200), (x>=1200)&(x<1300), (x>=1300)&(x<1400), (x>=1400)&(x<1500), (x>=1500)&(x<1600), (x>=1600)&(x<1700), (x>=1700)&(x<1800), (x>=1800)&(x<1900), (x>=1900)&(x<2000), (x>=2000)&(x<2100), (x>=2100)&(x<2200), (x>=2200)&(x<2300), (x>=2300)&(x<2400), (x>=2400)&(x<2500), (x>=2500)&(x<2600), (x>=2600)&(x<2700), (x>=2700)&(x<2800), (x>=2800)&(x<2900), (x>=2900)&(x<3000), (x>=3000)&(x<3100), (x>=3100)&(x<3200), (x>=3200)&(x<3300), (x>=3300)&(x<3400), (x>=3400)&(x<3500), (x>=3500)&(x<3600), (x>=3600)&(x<3700), (x>=3700)&(x<3800), (x>=3800)&(x<3900), (x>=3900)&(x<4000),x>4000],scaling)*x
-
-              clusters_df.at[i,("log","vibrational_frequencies")] = [anh_corr(float(j)) for j in clusters_df.at[i,("log","vibrational_frequencies")]]
-            ########################################################
-            else:
-              clusters_df.at[i,("log","vibrational_frequencies")] = replace_by_nonnegative(clusters_df.at[i,("extra","anharm")],clusters_df.at[i,("log","vibrational_frequencies")],1)
-          except:
-            clusters_df.at[i,("log","vibrational_frequencies")] = [missing]
-        #
-        try:
-          Sv = sum([R*h*vib*2.99793*10**10/k/QtOLD/(exp(h*vib*2.99793*10**10/k/QtOLD)-1)-R*log(1-exp(-h*vib*2.99793*10**10/k/QtOLD)) for vib in clusters_df.at[i,("log","vibrational_frequencies")]]) #cal/mol/K  
-          Ev = sum([R*h*vib*2.99793*10**10/k/(exp(h*vib*2.99793*10**10/k/QtOLD)-1)+R*h*vib*2.99793*10**10/k*0.5 for vib in clusters_df.at[i,("log","vibrational_frequencies")]])
-        except:
-          Sv = missing
-          Ev = missing
-        ###
-        clusters_df.at[i,("log","zero_point_correction")] = sum([0.5*h*vib*2.99793*10**10 for vib in clusters_df.at[i,("log","vibrational_frequencies")]])*0.00038088*6.022*10**23/1000
-        clusters_df.at[i,("log","zero_point_energy")] = clusters_df.at[i,("log","electronic_energy")] + clusters_df.at[i,("log","zero_point_correction")]  
-        clusters_df.at[i,("log","internal_energy")] += (Ev - Ev_OLD)/1000/627.503    
-        clusters_df.at[i,("log","energy_thermal_correction")] += (Ev - Ev_OLD)/1000/627.503    
-        clusters_df.at[i,("log","enthalpy_energy")] += (Ev - Ev_OLD)/1000/627.503
-        clusters_df.at[i,("log","enthalpy_thermal_correction")] += (Ev - Ev_OLD)/1000/627.503
-        clusters_df.at[i,("log","entropy")] += Sv - Sv_OLD      
-        ###
-  
+          replace = (A > 0) & (A < F) & M & same[:,None]
+          failed = ~same
+      F = F.copy()
+      F[replace] = A[replace]
+    #failed clusters get [missing] frequencies
+    F[failed] = missing
+    M = M.copy()
+    M[failed] = False
+    M[failed,0] = True
+    freqs[rows] = F
+    mask[rows] = M
+    counts[rows] = M.sum(axis = 1)
+    islist[rows] = True
+    data["Qvibs_changed"] = 1
+    #
+    Sv = vibrational_entropy(F, M, QtOLD) #cal/mol/K
+    Ev = vibrational_energy(F, M, QtOLD)
+    ###
+    zpec = where(M, 0.5*h*F*c, 0).sum(axis = 1)*0.00038088*6.022*10**23/1000
+    new["zero_point_correction"][rows] = zpec
+    new["zero_point_energy"][rows] = data["electronic_energy"][rows] + zpec
+    for name in ["internal_energy","energy_thermal_correction","enthalpy_energy","enthalpy_thermal_correction"]:
+      new[name][rows] += (Ev - Ev_OLD)/1000/627.503
+    new["entropy"][rows] += Sv - Sv_OLD
+    ###
+
+  data.update({"freqs": freqs, "mask": mask, "counts": counts, "islist": islist, "new": new})
+  return data
+
+def thermodynamics_at_temperature(data, Qafc, Qfc, Qt):
+  """Temperature dependent part (-afc, new temperature, -fc and Gibbs free energy) for one temperature Qt (NaN = original)
+  returns dictionary of the new columns (only numpy arrays, data are not modified)"""
+  from numpy import log, isnan, full, errstate
+  n = data["n"]
+  freqs, mask, counts, islist = data["freqs"], data["mask"], data["counts"], data["islist"]
+  new = {name: values.copy() for name, values in data["new"].items()}
+  temperature = data["temperature"]
+
+  ########################################################
+  # LOW VIBRATIONAL FREQUNECY ANTITREATMENT (S // G,Gc) ##
+  ########################################################
+  if Qafc > 0:
+    F, M, C, L = data["afc"]
+    lf = first_frequency(F, C, L)
+    rows = ~(lf <= 0)
+    new["entropy"][~rows] = missing
+    Qt, T = resolve_temperature(Qt, temperature, rows)
+    if rows.any():
+      new["entropy"][rows] = new["entropy"][rows]-low_frequency_correction(F[rows], M[rows], T[rows], data["mi"][rows], Qafc)
+    ###
+
   #################################################
   #### NEW TEMPERATURE (T,S,H,Hc,U,Uc // G,Gc) ####
   #################################################
-  if ~isnan(Qt):
-    for i in range(len(clusters_df)):
-      #try:
-      #  if isna(clusters_df.at[i,("log","vibrational_frequencies")]).any():
-      #    lf = 0
-      #  try:
-      #    if isna(clusters_df.at[i,("log","vibrational_frequencies")]):
-      #      lf = 0
-      #  except:
-      #    lf = 0 #
-      #except:
-      #  lf = 0
-      try:
-        QtOLD = clusters_df.at[i,("log","temperature")]
-        clusters_df.at[i,("log","temperature")] = Qt
-      except: 
-        QtOLD = 298.15
-      if Qt != QtOLD:
-        try:
-          lf = float(clusters_df.at[i,("log","vibrational_frequencies")][0])
-        except:
-          lf = 0
-        if lf <= 0:
-          clusters_df.at[i,("log","temperature")] = Qt
-          clusters_df.at[i,("log","entropy")] = missing
-          clusters_df.at[i,("log","enthalpy_energy")] = missing
-          clusters_df.at[i,("log","enthalpy_thermal_correction")] = missing
-          clusters_df.at[i,("log","internal_energy")] = missing
-          clusters_df.at[i,("log","energy_thermal_correction")] = missing
-          continue
-        Sv_OLD = sum([R*h*vib*2.99793*10**10/k/QtOLD/(exp(h*vib*2.99793*10**10/k/QtOLD)-1)-R*log(1-exp(-h*vib*2.99793*10**10/k/QtOLD)) for vib in clusters_df.at[i,("log","vibrational_frequencies")]]) #cal/mol/K
-        Sv = sum([R*h*vib*2.99793*10**10/k/Qt/(exp(h*vib*2.99793*10**10/k/Qt)-1)-R*log(1-exp(-h*vib*2.99793*10**10/k/Qt)) for vib in clusters_df.at[i,("log","vibrational_frequencies")]]) #cal/mol/K
-        Ev_OLD = sum([R*h*vib*2.99793*10**10/k/(exp(h*vib*2.99793*10**10/k/QtOLD)-1)+R*h*vib*2.99793*10**10/k*0.5 for vib in clusters_df.at[i,("log","vibrational_frequencies")]])
-        Ev = sum([R*h*vib*2.99793*10**10/k/(exp(h*vib*2.99793*10**10/k/Qt)-1)+R*h*vib*2.99793*10**10/k*0.5 for vib in clusters_df.at[i,("log","vibrational_frequencies")]])
-        ###
-        clusters_df.at[i,("log","temperature")] = Qt
-        clusters_df.at[i,("log","entropy")] += Sv - Sv_OLD + 4*R*log(Qt/QtOLD)
-        clusters_df.at[i,("log","enthalpy_energy")] += (Ev - Ev_OLD + 4*R*(Qt-QtOLD))/1000/627.503
-        clusters_df.at[i,("log","enthalpy_thermal_correction")] += (Ev - Ev_OLD + 4*R*(Qt-QtOLD))/1000/627.503
-        clusters_df.at[i,("log","internal_energy")] += (Ev - Ev_OLD + 3*R*(Qt-QtOLD))/1000/627.503
-        clusters_df.at[i,("log","energy_thermal_correction")] += (Ev - Ev_OLD + 3*R*(Qt-QtOLD))/1000/627.503
-        ###
-  
+  if not isnan(Qt):
+    QtOLD = temperature if temperature is not None else full(n, 298.15)
+    temperature = full(n, Qt)
+    new["temperature"] = temperature
+    change = Qt != QtOLD
+    lf = first_frequency(freqs, counts, islist)
+    bad = change & (lf <= 0)
+    rows = change & ~(lf <= 0)
+    for name in ["entropy","enthalpy_energy","enthalpy_thermal_correction","internal_energy","energy_thermal_correction"]:
+      new[name][bad] = missing
+    F = freqs[rows]
+    M = mask[rows]
+    Told = QtOLD[rows]
+    Tnew = full(len(F), Qt)
+    Sv_OLD = vibrational_entropy(F, M, Told) #cal/mol/K
+    Sv = vibrational_entropy(F, M, Tnew) #cal/mol/K
+    Ev_OLD = vibrational_energy(F, M, Told)
+    Ev = vibrational_energy(F, M, Tnew)
+    ###
+    with errstate(all = "ignore"):
+      new["entropy"][rows] += Sv - Sv_OLD + 4*R*log(Qt/Told)
+      for name in ["enthalpy_energy","enthalpy_thermal_correction"]:
+        new[name][rows] += (Ev - Ev_OLD + 4*R*(Qt-Told))/1000/627.503
+      for name in ["internal_energy","energy_thermal_correction"]:
+        new[name][rows] += (Ev - Ev_OLD + 3*R*(Qt-Told))/1000/627.503
+    ###
+
   ####################################################
   # LOW VIBRATIONAL FREQUNECY TREATMENT (S // G,Gc) ##
   ####################################################
   if Qfc > 0:
-    for i in range(len(clusters_df)):
-      try:
-        if isna(clusters_df.at[i,("log","vibrational_frequencies")]):
-          continue
-      except:
-        lf = 0
-      try:
-        lf = float(clusters_df.at[i,("log","vibrational_frequencies")][0])
-      except:
-        lf = 0
-      if lf <= 0:
-        clusters_df.at[i,("log","entropy")] = missing
-        continue
-      if isnan(Qt):
-        try:
-          Qt = clusters_df.at[i,("log","temperature")]
-        except:
-          Qt = 298.15
-      vibs = clusters_df.at[i,("log","vibrational_frequencies")]
-      structure = clusters_df.at[i,("xyz","structure")]
-      
-      mu = [float(h/(8*pi**2*2.99793*10**10*vib)) for vib in vibs]
-      try:
-        mi = mean(structure.get_moments_of_inertia())
-        Sr = [R*(0.5+log((8*pi**2.99793*(mu[j]*mi/(mu[j]+mi))*k*Qt/h**2)**0.5)) for j in range(len(mu))]  #cal/mol/K
-        Sv = [R*h*vib*2.99793*10**10/k/Qt/(exp(h*vib*2.99793*10**10/k/Qt)-1)-R*log(1-exp(-h*vib*2.99793*10**10/k/Qt)) for vib in vibs] #cal/mol/K
-        w = [1/(1+(Qfc/vib)**4) for vib in vibs]
-        Sv_corr = sum([w[j]*Sv[j]+(1-w[j])*Sr[j] for j in range(len(w))])
-        Sv_each = sum(Sv)  #cal/mol/K
-        clusters_df.at[i,("log","entropy")] = clusters_df.at[i,("log","entropy")]+(Sv_corr-Sv_each)
-      except:
-        mi = missing
-        clusters_df.at[i,("log","entropy")] = missing
+    #clusters with missing frequencies (or just [missing]) are left untouched
+    untouched = ~islist | ((counts == 1) & isnan(freqs[:,0]))
+    if data["Qvibs"] == 0:
+      untouched[:] = False
+    lf = first_frequency(freqs, counts, islist)
+    bad = ~untouched & (lf <= 0)
+    rows = ~untouched & ~(lf <= 0)
+    new["entropy"][bad] = missing
+    Qt, T = resolve_temperature(Qt, temperature, rows)
+    if rows.any():
+      new["entropy"][rows] = new["entropy"][rows]+low_frequency_correction(freqs[rows], mask[rows], T[rows], data["mi"][rows], Qfc)
     ###
 
   ## CORRECTIONS FOR GIBBS FREE ENERGY
-  for i in range(len(clusters_df)):
-    try:
-      if isnan(Qt):
-        try:
-          Qt = clusters_df.at[i,("log","temperature")]
-        except:
-          Qt = 298.15
-      clusters_df.at[i,("log","gibbs_free_energy")] = clusters_df.at[i,("log","enthalpy_energy")] - clusters_df.at[i,("log","entropy")]/1000/627.503 * Qt
-    except:
-      clusters_df.at[i,("log","gibbs_free_energy")] = missing
-    try:
-      clusters_df.at[i,("log","gibbs_free_energy_thermal_correction")] = clusters_df.at[i,("log","gibbs_free_energy")] - clusters_df.at[i,("log","electronic_energy")]
-    except:
-      clusters_df.at[i,("log","gibbs_free_energy_thermal_correction")] = missing
+  Qt, T = resolve_temperature(Qt, temperature, full(n, True))
+  with errstate(all = "ignore"):
+    new["gibbs_free_energy"] = new["enthalpy_energy"] - new["entropy"]/1000/627.503 * T
+    new["gibbs_free_energy_thermal_correction"] = new["gibbs_free_energy"] - data["electronic_energy"]
+  return new
 
+def write_thermodynamics(clusters_df, data, new):
+  """Write the new columns back to the database"""
+  from numpy import isnan
+  from pandas import Series
+  for name in new:
+    if ("log",name) in clusters_df.columns or not isnan(new[name]).all() or name.startswith("gibbs"):
+      clusters_df[("log",name)] = new[name]
+  if data["Qvibs_changed"]:
+    clusters_df[("log","vibrational_frequencies")] = Series(unpack_frequencies(data["freqs"], data["counts"], data["islist"], data["vibs"]), index = clusters_df.index, dtype = object)
   return clusters_df
+
+def thermodynamics(clusters_df, Qanh, Qafc, Qfc, Qt, Qdropimg):
+  data = prepare_thermodynamics(clusters_df, Qanh, Qafc, Qfc, Qdropimg)
+  new = thermodynamics_at_temperature(data, Qafc, Qfc, Qt)
+  return write_thermodynamics(clusters_df, data, new)
+
+def parse_temperatures(string):
+  """-temp value: single temperature (298.15) or sweep start:stop:step (200:320:5, stop included)"""
+  from numpy import arange
+  if ":" not in string:
+    return [float(string)]
+  values = [float(i) for i in string.split(":")]
+  if len(values) == 2:
+    values.append(1.0)
+  if len(values) != 3 or values[2] <= 0 or values[1] < values[0]:
+    print("Wrong temperature sweep (use start:stop:step, e.g., 200:320:5): "+string+" [EXITING]")
+    exit()
+  return [float(i) for i in arange(values[0], values[1] + values[2]/2, values[2])]
+
+def thermodynamics_sweep(clusters_df, Qanh, Qafc, Qfc, Qtemps, Qdropimg):
+  """Thermodynamics for several temperatures, frequencies and structures are processed only once
+  The database gets the values for the first temperature, the Gibbs free energies for all temperatures
+  are returned as array (clusters x temperatures)."""
+  from numpy import empty
+  data = prepare_thermodynamics(clusters_df, Qanh, Qafc, Qfc, Qdropimg)
+  sweep = empty((data["n"], len(Qtemps)))
+  for j, Qt in enumerate(Qtemps):
+    new = thermodynamics_at_temperature(data, Qafc, Qfc, Qt)
+    sweep[:,j] = new["gibbs_free_energy"]
+    if j == 0:
+      first = new
+  return write_thermodynamics(clusters_df, data, first), sweep
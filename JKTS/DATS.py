@@ -7,7 +7,7 @@ import os
 import re
 import time
 from threading import Thread
-from classes import Molecule, Logger
+from classes import Molecule, Logger, LogCache
 from slurm_submit import submit_array_job, submit_job, update_molecules_status
 import plotting
 
@@ -772,6 +772,9 @@ def check_convergence(molecules, logger, threads, interval, max_attempts, all_co
                 continue
             time.sleep(10)
                 
+        # parsed log files are cached once per check of all molecules
+        LogCache.flush()
+
         if all(m.converged for m in molecules):
             all_converged = True
             break
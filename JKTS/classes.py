@@ -5,6 +5,10 @@ import shutil
 import os
 import pickle
 import random
+import copy
+import uuid
+import hashlib
+import atexit
 from rdkit import Chem
 from rdkit.Chem import AllChem
 ##################################################WORKFLOWS#################################################################
@@ -400,81 +404,80 @@ class Molecule(Vector):
         file_path = log_file_path if log_file_path else self.log_file_path
         program = program if program else self.program
 
-        with open(file_path, 'r') as f:
-            log_content = f.read()
-
-            if program.lower() == 'g16':
-                zero_point_correction = re.findall(r'Zero-point correction=\s+([-.\d]+)', log_content)
-                free_energy = re.findall(r'Sum of electronic and thermal Free Energies=\s+([-.\d]+)', log_content)
-                dipole_moment = re.findall(r"Tot=\s+([-\d.]+)", log_content)
-                partition_function = re.findall(r"Total V=0\s+([-\d.]+D[+-]\d+)", log_content)
-                if zero_point_correction:
+        if program.lower() == 'g16':
+            log_content = LogCache.read(file_path, program)['matches']
+            zero_point_correction = log_content['zero_point_correction']
+            free_energy = log_content['free_energy']
+            dipole_moment = log_content['dipole_moment']
+            partition_function = log_content['partition_function']
+            if zero_point_correction:
+                self.zero_point = float(zero_point_correction[-1])
+                self.free_energy = float(free_energy[-1])
+                self.dipole_moment = float(dipole_moment[-1])
+                self.Q = float(partition_function[-1].replace('D', 'E'))
+            electronic_energy = log_content['electronic_energy']
+            if electronic_energy:
+                self.electronic_energy = float(electronic_energy[-1][-1])
+                freq_matches = log_content['vibrational_frequencies']
+                if freq_matches:
+                    self.vibrational_frequencies = [float(freq) for match in freq_matches for freq in match if freq]
+                    rot_temp = log_content['rot_temps']
+                    self.rot_temps = [float(rot) for rot in rot_temp[-1] if rot != '']
+                    symmetry_num = log_content['symmetry_num']
+                    if symmetry_num:
+                        self.symmetry_num = int(symmetry_num[1])
+                    else: 
+                        if logger:
+                            logger.log(f"No symmetry number found in {self.name}. assuming 1")
+                        self.symmetry_num = 1
+                    mol_mass = log_content['mol_mass']
+                    self.mol_mass = float(mol_mass[1])
+                    mult = log_content['mult']
+                    if mult:    
+                        self.mult = int(mult[1])
+                    else: self.mult = 2
+
+                    # self.partition_function()
+                elif 'TS' in self.name:
+                    if logger:
+                        logger.log(f"No frequencies found in {self.name}")
+
+
+        elif program.lower() == 'orca' or self.current_step == 'DLPNO' or DLPNO:
+            log_content = LogCache.read(file_path, program)['matches']
+            zero_point_correction = log_content['zero_point_correction']
+            free_energy = log_content['free_energy']
+            electronic_energy = log_content['electronic_energy']
+            dipole_moment = log_content['dipole_moment']
+            # find ORCA zero point zorrected
+            if electronic_energy:
+                self.electronic_energy = float(electronic_energy[-1][-1])
+                if zero_point_correction and free_energy:
                     self.zero_point = float(zero_point_correction[-1])
                     self.free_energy = float(free_energy[-1])
                     self.dipole_moment = float(dipole_moment[-1])
-                    self.Q = float(partition_function[-1].replace('D', 'E'))
-                electronic_energy = re.findall(r'(SCF Done:  E\(\S+\) =)\s+([-.\d]+)', log_content)
-                if electronic_energy:
-                    self.electronic_energy = float(electronic_energy[-1][-1])
-                    freq_matches = re.findall(r"Frequencies --\s+(-?\d+\.\d+)\s+(-?\d+\.\d+)?\s+(-?\d+\.\d+)?", log_content)
-                    if freq_matches:
-                        self.vibrational_frequencies = [float(freq) for match in freq_matches for freq in match if freq]
-                        rot_temp = re.findall(r"Rotational temperatures? \(Kelvin\)\s+(-?\d+\.\d+)(?:\s+(-?\d+\.\d+))?(?:\s+(-?\d+\.\d+))?", log_content)
-                        self.rot_temps = [float(rot) for rot in rot_temp[-1] if rot != '']
-                        symmetry_num = re.search(r"Rotational symmetry number\s*(\d+)", log_content)
-                        if symmetry_num:
-                            self.symmetry_num = int(symmetry_num.group(1))
-                        else: 
-                            if logger:
-                                logger.log(f"No symmetry number found in {self.name}. assuming 1")
-                            self.symmetry_num = 1
-                        mol_mass = re.search(r"Molecular mass:\s+(-?\d+\.\d+)", log_content)
-                        self.mol_mass = float(mol_mass.group(1))
-                        mult = re.search(r"Multiplicity =\s*(\d+)", log_content)
-                        if mult:    
-                            self.mult = int(mult.group(1))
-                        else: self.mult = 2
-
-                        # self.partition_function()
-                    elif 'TS' in self.name:
-                        if logger:
-                            logger.log(f"No frequencies found in {self.name}")
-
-
-            elif program.lower() == 'orca' or self.current_step == 'DLPNO' or DLPNO:
-                zero_point_correction = re.findall(r"Zero point energy\s+...\s+([-+]?\d*\.\d+|\d+)", log_content)
-                free_energy = re.findall(r"Final Gibbs free energy\s+...\s+([-+]?\d*\.\d+|\d+)", log_content)
-                electronic_energy = re.findall(r'(FINAL SINGLE POINT ENERGY)\s+([-.\d]+)', log_content)
-                dipole_moment = re.findall(r"Magnitude \(Debye\)\s*:\s*([\d.]+)", log_content)
-                # find ORCA zero point zorrected
-                if electronic_energy:
-                    self.electronic_energy = float(electronic_energy[-1][-1])
-                    if zero_point_correction and free_energy:
-                        self.zero_point = float(zero_point_correction[-1])
-                        self.free_energy = float(free_energy[-1])
-                        self.dipole_moment = float(dipole_moment[-1])
-                    freq_matches = re.findall(r'([-+]?\d*\.\d+)\s*cm\*\*-1', log_content)
-                    if freq_matches:
-                        n = 3*len(self.atoms)-6 # Utilizing the fact that non-linear molecules has 3N-6 degrees of freedom
-                        self.vibrational_frequencies = [float(freq) for freq in freq_matches][-n:]
-                        rot_temp = re.findall(r"Rotational constants in cm-1: \s*[-+]?(\d*\.\d*)  \s*[-+]?(\d*\.\d*) \s*[-+]?(\d*\.\d*)", log_content)
-                        self.rot_temps = [float(rot) for rot in rot_temp[-1]]
-                        symmetry_num = re.search(r'Symmetry Number:\s*(\d*)', log_content)
-                        if symmetry_num:
-                            self.symmetry_num = int(symmetry_num.group(1))
-                        else: 
-                            self.symmetry_num = 1
-
-                        mol_mass = re.search(r'Total Mass\s*...\s*\d*\.\d+', log_content)
-                        if mol_mass:
-                            self.mol_mass = float(mol_mass.group().split()[-1])
-                        multiplicity = re.search(r'Mult\s* ....\s*(\d*)', log_content)
-                        if multiplicity:
-                            self.mult = int(multiplicity.group().split()[-1])
-                        else:
-                            self.mult = 2
-
-                        self.partition_function()
+                freq_matches = log_content['vibrational_frequencies']
+                if freq_matches:
+                    n = 3*len(self.atoms)-6 # Utilizing the fact that non-linear molecules has 3N-6 degrees of freedom
+                    self.vibrational_frequencies = [float(freq) for freq in freq_matches][-n:]
+                    rot_temp = log_content['rot_temps']
+                    self.rot_temps = [float(rot) for rot in rot_temp[-1]]
+                    symmetry_num = log_content['symmetry_num']
+                    if symmetry_num:
+                        self.symmetry_num = int(symmetry_num[1])
+                    else: 
+                        self.symmetry_num = 1
+
+                    mol_mass = log_content['mol_mass']
+                    if mol_mass:
+                        self.mol_mass = float(mol_mass[0].split()[-1])
+                    multiplicity = log_content['mult']
+                    if multiplicity:
+                        self.mult = int(multiplicity[0].split()[-1])
+                    else:
+                        self.mult = 2
+
+                    self.partition_function()
                 
 
 
@@ -971,80 +974,15 @@ class Molecule(Vector):
 
 
     def log2xyz(self, atoms=False):
-        if self.program.lower() == "g16":
-            match_string='Standard orientation'
-            atomic_number_to_symbol = {
-                1: 'H',
-                6: 'C',
-                7: 'N',
-                8: 'O',
-                16: 'S',
-                17: 'Cl'
-            }
-
-            with open(self.log_file_path, 'r') as file:
-                coordinates = []
-                element = []
-                start_reading = False
-                for line in file:
-                    if start_reading:
-                        parts = line.split()
-                        if len(parts) >= 6 and parts[1].isdigit() and all(part.replace('.', '', 1).isdigit() or part.lstrip('-').replace('.', '', 1).isdigit() for part in parts[-3:]):
-                            element_symbol = atomic_number_to_symbol.get(int(parts[1]), 'Unknown')
-                            element.append(element_symbol)
-                            coords = [float(parts[3]), float(parts[4]), float(parts[5])]
-                            coordinates.append(coords)
-                    if match_string in line:
-                        start_reading = True
-                        coordinates = []
-                        element = []
-                    if "Rotational" in line:
-                        start_reading = False
-                if not coordinates:
-                    return False
-                if atoms:
-                    return (element, coordinates)
-                else: return coordinates
-
-        elif self.program.lower() == "orca":
-            match_string='CARTESIAN COORDINATES (ANGSTROEM)'
-            with open(self.log_file_path, 'r') as file:
-                coordinates = []
-                element = []
-                start_reading = False
-
-                for line in file:
-                    if start_reading:
-                        parts = line.split()
-                        if len(parts) == 4 and parts[0].isalpha():  # Check if line starts with element symbol
-                                element_symbol = parts[0]
-                                coords = [float(parts[1]), float(parts[2]), float(parts[3])]
-                                element.append(element_symbol)
-                                coordinates.append(coords)
-                    if match_string in line:
-                        start_reading = True
-                        coordinates = []
-                        element = []
-                        parts = line.split()
-                        if len(parts) == 4 and parts[0].isalpha():  # Check if line starts with element symbol
-                                element_symbol = parts[0]
-                                coords = [float(parts[1]), float(parts[2]), float(parts[3])]
-                                element.append(element_symbol)
-                                coordinates.append(coords)
-                    if match_string in line:
-                        start_reading = True
-                        coordinates = []
-                        element = []
-                    if "------" in line:
-                        continue
-                    if "CARTESIAN COORDINATES (A.U.)" in line:
-                        start_reading = False
-                if not coordinates:
-                    return False
-
-                if atoms:
-                    return (element, coordinates)
-                else: return coordinates
+        if self.program.lower() not in ("g16", "orca"):
+            return None
+        state = LogCache.read(self.log_file_path, self.program)
+        coordinates = list(state['coordinates'])
+        if not coordinates:
+            return False
+        if atoms:
+            return (list(state['element']), coordinates)
+        else: return coordinates
 
 
     def print_items(self, logger=None):
@@ -1084,6 +1022,196 @@ class Molecule(Vector):
         output("-----------------------------------------------------------------------")
 
 
+class LogCache:
+    '''Incremental reader of G16/ORCA log files used by update_energy and log2xyz.
+    For every log file the byte offset up to which it has been parsed is remembered together with the
+    parsed results, so repeated calls only process the newly appended bytes. The parsed states are also
+    kept in a small pickle next to the log files, so a restarted JKTS does not re-parse finished jobs
+    (written by flush() once per check of the log files and at exit, for the directories that changed).
+    All patterns match within a single line (no \s, which would also match line breaks), hence parsing
+    the file in chunks of complete lines gives the same results as parsing the whole file at once.
+    A file rewritten in place (e.g. by a resubmitted job) is recognized by a hash of the beginning and of
+    the end of the parsed part, and parsed again from the start.'''
+    cache_name = '.JKTS_logcache.pkl'
+    # bytes at the beginning and at the end of the parsed part which are hashed
+    check_size = 4096
+    states = {}
+    # (kind, inode) -> file path, to find the state of a moved log file
+    inodes = {}
+    loaded_directories = set()
+    dirty_directories = set()
+    # (name, which matches are kept: 'last' / 'all' / 'first', pattern)
+    patterns = {
+        'g16': [
+            ('zero_point_correction', 'last', re.compile(r'Zero-point correction=[ \t]+([-.\d]+)')),
+            ('free_energy', 'last', re.compile(r'Sum of electronic and thermal Free Energies=[ \t]+([-.\d]+)')),
+            ('dipole_moment', 'last', re.compile(r"Tot=[ \t]+([-\d.]+)")),
+            ('partition_function', 'last', re.compile(r"Total V=0[ \t]+([-\d.]+D[+-]\d+)")),
+            ('electronic_energy', 'last', re.compile(r'(SCF Done:  E\(\S+\) =)[ \t]+([-.\d]+)')),
+            ('vibrational_frequencies', 'all', re.compile(r"Frequencies --[ \t]+(-?\d+\.\d+)(?:[ \t]+(-?\d+\.\d+))?(?:[ \t]+(-?\d+\.\d+))?")),
+            ('rot_temps', 'last', re.compile(r"Rotational temperatures? \(Kelvin\)[ \t]+(-?\d+\.\d+)(?:[ \t]+(-?\d+\.\d+))?(?:[ \t]+(-?\d+\.\d+))?")),
+            ('symmetry_num', 'first', re.compile(r"Rotational symmetry number[ \t]*(\d+)")),
+            ('mol_mass', 'first', re.compile(r"Molecular mass:[ \t]+(-?\d+\.\d+)")),
+            ('mult', 'first', re.compile(r"Multiplicity =[ \t]*(\d+)"))],
+        'orca': [
+            ('zero_point_correction', 'last', re.compile(r"Zero point energy[ \t]+...[ \t]+([-+]?\d*\.\d+|\d+)")),
+            ('free_energy', 'last', re.compile(r"Final Gibbs free energy[ \t]+...[ \t]+([-+]?\d*\.\d+|\d+)")),
+            ('electronic_energy', 'last', re.compile(r'(FINAL SINGLE POINT ENERGY)[ \t]+([-.\d]+)')),
+            ('dipole_moment', 'last', re.compile(r"Magnitude \(Debye\)[ \t]*:[ \t]*([\d.]+)")),
+            ('vibrational_frequencies', 'all', re.compile(r'([-+]?\d*\.\d+)[ \t]*cm\*\*-1')),
+            ('rot_temps', 'last', re.compile(r"Rotational constants in cm-1: [ \t]*[-+]?(\d*\.\d*)  [ \t]*[-+]?(\d*\.\d*) [ \t]*[-+]?(\d*\.\d*)")),
+            ('symmetry_num', 'first', re.compile(r'Symmetry Number:[ \t]*(\d*)')),
+            ('mol_mass', 'first', re.compile(r'Total Mass[ \t]*...[ \t]*\d*\.\d+')),
+            ('mult', 'first', re.compile(r'Mult[ \t]* ....[ \t]*(\d*)'))]
+    }
+    atomic_number_to_symbol = {1: 'H', 6: 'C', 7: 'N', 8: 'O', 16: 'S', 17: 'Cl'}
+
+    @staticmethod
+    def kind(program):
+        return 'g16' if program.lower() == 'g16' else 'orca'
+
+    @classmethod
+    def new_state(cls, kind, inode):
+        return {'inode': inode, 'offset': 0, 'matches': {name: [] for name, _, _ in cls.patterns[kind]},
+                'reading': False, 'element': [], 'coordinates': [], 'check': None, 'mtime': None}
+
+    @classmethod
+    def signature(cls, file, offset):
+        '''Hash of the first and the last check_size bytes of file[:offset]'''
+        file.seek(0)
+        digest = hashlib.sha1(file.read(min(cls.check_size, offset)))
+        file.seek(max(0, offset - cls.check_size))
+        digest.update(file.read(offset - max(0, offset - cls.check_size)))
+        return digest.hexdigest()
+
+    @classmethod
+    def parse(cls, kind, state, text):
+        '''Add the results of text (complete lines) to the state'''
+        for name, keep, pattern in cls.patterns[kind]:
+            found = state['matches'][name]
+            if keep == 'first':
+                # stored as [whole match, group 1, ...]
+                if not found:
+                    match = pattern.search(text)
+                    if match:
+                        found.extend([match.group()] + list(match.groups()))
+            else:
+                new = pattern.findall(text)
+                if keep == 'all':
+                    found.extend(new)
+                elif new:
+                    found[:] = new[-1:]
+
+        # last geometry in the file (same rules as the former line-by-line log2xyz)
+        for line in text.split('\n'):
+            if kind == 'g16':
+                if state['reading']:
+                    parts = line.split()
+                    if len(parts) >= 6 and parts[1].isdigit() and all(part.replace('.', '', 1).isdigit() or part.lstrip('-').replace('.', '', 1).isdigit() for part in parts[-3:]):
+                        state['element'].append(cls.atomic_number_to_symbol.get(int(parts[1]), 'Unknown'))
+                        state['coordinates'].append([float(parts[3]), float(parts[4]), float(parts[5])])
+                if 'Standard orientation' in line:
+                    state['reading'] = True
+                    state['element'] = []
+                    state['coordinates'] = []
+                if "Rotational" in line:
+                    state['reading'] = False
+            else:
+                if state['reading']:
+                    parts = line.split()
+                    if len(parts) == 4 and parts[0].isalpha():  # Check if line starts with element symbol
+                        state['element'].append(parts[0])
+                        state['coordinates'].append([float(parts[1]), float(parts[2]), float(parts[3])])
+                if 'CARTESIAN COORDINATES (ANGSTROEM)' in line:
+                    state['reading'] = True
+                    state['element'] = []
+                    state['coordinates'] = []
+                if "CARTESIAN COORDINATES (A.U.)" in line:
+                    state['reading'] = False
+
+    @classmethod
+    def load(cls, directory):
+        cls.loaded_directories.add(directory)
+        try:
+            with open(os.path.join(directory, cls.cache_name), 'rb') as file:
+                cached = pickle.load(file)
+            for (basename, kind), state in cached.items():
+                file_path = os.path.join(directory, basename)
+                if (file_path, kind) not in cls.states:
+                    cls.states[(file_path, kind)] = state
+                    cls.inodes.setdefault((kind, state['inode']), file_path)
+        except Exception:
+            pass
+
+    @classmethod
+    def save(cls, directory):
+        cached = {(os.path.basename(file_path), kind): state for (file_path, kind), state in cls.states.items() if os.path.dirname(file_path) == directory}
+        cache_file = os.path.join(directory, cls.cache_name)
+        # unique temporary file, several JKTS processes may share the directory
+        temporary_file = f"{cache_file}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temporary_file, 'wb') as file:
+                pickle.dump(cached, file)
+            os.replace(temporary_file, cache_file)
+        except OSError:
+            if os.path.exists(temporary_file):
+                os.remove(temporary_file)
+
+    @classmethod
+    def flush(cls):
+        '''Save the cache of every directory with newly parsed log files'''
+        while cls.dirty_directories:
+            cls.save(cls.dirty_directories.pop())
+
+    @classmethod
+    def read(cls, file_path, program):
+        '''Parsed state of the log file: {'matches': {name: findall-like list}, 'element': [...], 'coordinates': [...], ...}'''
+        kind = cls.kind(program)
+        file_path = os.path.abspath(file_path)
+        directory = os.path.dirname(file_path)
+        if directory not in cls.loaded_directories:
+            cls.load(directory)
+        stat = os.stat(file_path)
+        key = (file_path, kind)
+        state = cls.states.get(key)
+        if state is None or state['inode'] != stat.st_ino or state['offset'] > stat.st_size:
+            # the file may have been moved (e.g. to log_files/) -> reuse its state, otherwise (new/rewritten file) start again
+            moved = cls.inodes.get((kind, stat.st_ino))
+            if moved is not None and moved != file_path and not os.path.exists(moved) and cls.states[(moved, kind)]['offset'] <= stat.st_size:
+                state = copy.deepcopy(cls.states[(moved, kind)])
+            else:
+                state = cls.new_state(kind, stat.st_ino)
+            cls.states[key] = state
+            cls.inodes[(kind, stat.st_ino)] = file_path
+
+        tail = b''
+        if stat.st_mtime_ns != state.get('mtime') or stat.st_size > state['offset']:
+            with open(file_path, 'rb') as file:
+                # rewritten in place -> start again
+                if state['offset'] > 0 and cls.signature(file, state['offset']) != state.get('check'):
+                    state = cls.new_state(kind, stat.st_ino)
+                    cls.states[key] = state
+                    cls.dirty_directories.add(directory)
+                state['mtime'] = stat.st_mtime_ns
+                file.seek(state['offset'])
+                data = file.read()
+                end = data.rfind(b'\n') + 1
+                if end > 0:
+                    cls.parse(kind, state, data[:end].decode('utf-8', errors='replace'))
+                    state['offset'] += end
+                    state['check'] = cls.signature(file, state['offset'])
+                    cls.dirty_directories.add(directory)
+            tail = data[end:]
+        if tail:
+            # unfinished last line is parsed only temporarily, it is read again once completed
+            state = copy.deepcopy(state)
+            cls.parse(kind, state, tail.decode('utf-8', errors='replace'))
+        return state
+
+
+atexit.register(LogCache.flush)
+
+
 class Logger:
     def __init__(self, log_file):
         self.log_file = log_file
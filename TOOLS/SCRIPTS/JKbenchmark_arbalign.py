@@ -0,0 +1,83 @@
+####################################################################################################
+# MICRO-BENCHMARK OF THE ARBALIGN ENGINE
+# Compares the original loop implementation of compare() (Qvectorized = 0) with the vectorized one
+# (Qvectorized = 1) on pairs of structures and checks that both give the same RMSD.
+# usage: python JKbenchmark_arbalign.py [-repeat <int>] [-mw] file1.xyz file2.xyz ...
+#          (all pairs of the given structures with the same composition are compared)
+#        python JKbenchmark_arbalign.py [-repeat <int>] [-mw] [-water <int>] [-pairs <int>]
+#          (random (H2O)n clusters compared with rotated, permuted and slightly distorted copies)
+####################################################################################################
+from sys import argv, path as syspath
+from os import path
+from time import perf_counter
+import numpy as np
+syspath.insert(0, path.dirname(path.abspath(__file__)))
+from modifiedArbAlign import compare
+
+repeat = 3
+mass_weighted = 0
+water = 10
+npairs = 20
+files = []
+last = ""
+for i in argv[1:]:
+  if last == "-repeat":
+    repeat = int(i)
+    last = ""
+    continue
+  if last == "-water":
+    water = int(i)
+    last = ""
+    continue
+  if last == "-pairs":
+    npairs = int(i)
+    last = ""
+    continue
+  if i == "-repeat" or i == "-water" or i == "-pairs":
+    last = i
+    continue
+  if i == "-mw":
+    mass_weighted = 1
+    continue
+  if not path.exists(i):
+    print(f"The file '{i}' does not exist. [EXITING]", flush=True)
+    exit()
+  files.append(i)
+
+if len(files) > 0:
+  from ase.io import read
+  structures = [read(i) for i in files]
+  pairs = [(structures[i], structures[j]) for i in range(len(structures)) for j in range(i+1, len(structures)) if sorted(structures[i].get_chemical_symbols()) == sorted(structures[j].get_chemical_symbols())]
+else:
+  from ase import Atoms
+  from scipy.spatial.transform import Rotation
+  rng = np.random.default_rng(42)
+  monomer = np.array([[0.0, 0.0, 0.0], [0.757, 0.586, 0.0], [-0.757, 0.586, 0.0]])
+  pairs = []
+  for p in range(npairs):
+    centers = rng.uniform(-1, 1, (water, 3))*2.2*water**(1/3)
+    positions = np.concatenate([Rotation.random(random_state = rng.integers(10**9)).apply(monomer) + c for c in centers])
+    a = Atoms("OHH"*water, positions = positions)
+    copy = Rotation.random(random_state = rng.integers(10**9)).apply(positions) + rng.normal(0, 0.05, positions.shape)
+    permutation = rng.permutation(len(a))
+    b = Atoms([a.get_chemical_symbols()[k] for k in permutation], positions = copy[permutation])
+    pairs.append((a, b))
+
+if len(pairs) == 0:
+  print("No pairs of structures with the same composition. [EXITING]", flush=True)
+  exit()
+
+times = []
+results = []
+for Qvectorized in [0, 1]:
+  best = float("inf")
+  for r in range(repeat):
+    start = perf_counter()
+    rmsds = [compare(a, b, mass_weighted = mass_weighted, Qvectorized = Qvectorized) for a, b in pairs]
+    best = min(best, perf_counter() - start)
+  times.append(best)
+  results.append(np.array(rmsds, dtype = float))
+
+difference = np.nanmax(np.abs(results[0] - results[1]))
+print(f"{len(pairs)} pairs of {len(pairs[0][0])} atoms  old {times[0]:.4f} s  vectorized {times[1]:.4f} s  speedup {times[0]/max(times[1],1e-12):.1f}x", flush=True)
+print(f"max |RMSD difference| = {difference:.3e}  " + ("IDENTICAL" if difference < 1e-10 else "DIFFERENT"), flush=True)
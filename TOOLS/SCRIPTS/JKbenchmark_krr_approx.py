@@ -0,0 +1,131 @@
+####################################################################################################
+# BENCHMARK OF THE APPROXIMATE KRR SOLVERS (JKML -krr_approx)
+# Trains the exact (tiled Cholesky) KRR and the Nystrom/random Fourier feature approximations on the
+# same training set and compares training/prediction times and test errors.
+# usage: python JKbenchmark_krr_approx.py database.pkl [-repr fchl19|mbdf] [-sigma <float>]
+#          [-lambda <float>] [-ntrain <int>] [-ntest <int>] [-column <label> <name>] [-cpu <int>]
+#          [-approx <str>] [-approx <str>] ... [-noexact] [-seed <int>]
+#        (default approximations: nystrom:1000:random nystrom:1000:kmeans nystrom:1000:fps rff:1000)
+####################################################################################################
+from sys import argv, path as syspath
+from os import path
+from time import perf_counter
+import numpy as np
+syspath.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "..", "JKML"))
+from src.load_databases import read_database
+from src.blocked_krr import configure_krr, tiled_krr
+from src.approx_krr import parse_krr_approx, approx_training, cross_kernel, rff_predict, chunk_bounds
+
+Qrepresentation = "fchl19"
+sigma = 1.0
+lambd = 1e-4
+ntrain = 5000
+ntest = 1000
+column = ("log","electronic_energy")
+cpu = 1
+approximations = []
+Qexact = 1
+seed = 42
+files = []
+last = ""
+for i in argv[1:]:
+  if last == "-column":
+    column = [i]
+    last = "-column2"
+    continue
+  if last == "-column2":
+    column = (column[0], i)
+    last = ""
+    continue
+  if last in ["-repr","-sigma","-lambda","-ntrain","-ntest","-cpu","-approx","-seed"]:
+    if last == "-repr":
+      Qrepresentation = i
+    elif last == "-sigma":
+      sigma = float(i)
+    elif last == "-lambda":
+      lambd = float(i)
+    elif last == "-ntrain":
+      ntrain = int(i)
+    elif last == "-ntest":
+      ntest = int(i)
+    elif last == "-cpu":
+      cpu = int(i)
+    elif last == "-approx":
+      approximations.append(i)
+    else:
+      seed = int(i)
+    last = ""
+    continue
+  if i in ["-column","-repr","-sigma","-lambda","-ntrain","-ntest","-cpu","-approx","-seed"]:
+    last = i
+    continue
+  if i == "-noexact":
+    Qexact = 0
+    continue
+  if not path.exists(i):
+    print(f"The file '{i}' does not exist. [EXITING]", flush=True)
+    exit()
+  files.append(i)
+
+if len(files) == 0:
+  print("No database given. [EXITING]", flush=True)
+  exit()
+if len(approximations) == 0:
+  approximations = ["nystrom:1000:random","nystrom:1000:kmeans","nystrom:1000:fps","rff:1000"]
+if Qrepresentation == "fchl19":
+  from src.representations import generate_fchl19 as generate_representation
+elif Qrepresentation == "mbdf":
+  from src.representations import generate_mbdf as generate_representation
+else:
+  print("Only the fchl19 and mbdf representations are benchmarked. [EXITING]", flush=True)
+  exit()
+configure_krr(n_jobs = cpu)
+
+#train/test split of the (shuffled) database
+from pandas import concat
+database = concat([read_database(i) for i in files], ignore_index = True)
+database = database[database[column].notna() & database[("xyz","structure")].notna()]
+order = np.random.default_rng(seed).permutation(len(database))
+ntrain = min(ntrain, len(database))
+ntest = min(ntest, len(database) - ntrain)
+strs = list(database[("xyz","structure")].values[order[:ntrain+ntest]])
+Y = database[column].values[order[:ntrain+ntest]].astype(float)
+Q = [s.get_atomic_numbers() for s in strs]
+X = generate_representation(strs)
+X_train, Q_train, Y_train = X[:ntrain], Q[:ntrain], Y[:ntrain]
+X_test, Q_test, Y_test = X[ntrain:], Q[ntrain:], Y[ntrain:]
+print(f"{Qrepresentation}: {ntrain} training and {ntest} test structures, sigma = {sigma}, lambda = {lambd}", flush=True)
+
+def predict(X_model, Q_model, alpha):
+  Y_predicted = []
+  for a, e in chunk_bounds(len(X_test), 2048):
+    Y_predicted.append(cross_kernel((Qrepresentation, "Gaussian", [sigma], X_test[a:e], Q_test[a:e], X_model, Q_model))[0] @ alpha)
+  return np.concatenate(Y_predicted)
+
+results = []
+Y_exact = None
+if Qexact == 1:
+  start = perf_counter()
+  alpha = tiled_krr(X_train, Q_train, Y_train, Qrepresentation, "Gaussian", [sigma], [lambd])
+  train_time = perf_counter() - start
+  start = perf_counter()
+  Y_exact = predict(X_train, Q_train, alpha[0])
+  results.append(["exact", train_time, perf_counter() - start, Y_exact])
+for approximation in approximations:
+  approx = parse_krr_approx(approximation)
+  start = perf_counter()
+  X_model, Q_model, strs_model, alpha, params = approx_training(X_train, Q_train, database[("xyz","structure")].iloc[order[:ntrain]], Y_train, Qrepresentation, "Gaussian", [sigma], [lambd], approx, seed)
+  train_time = perf_counter() - start
+  start = perf_counter()
+  if approx["method"] == "rff":
+    Y_predicted = rff_predict(X_test, Q_test, params, alpha[0])
+  else:
+    Y_predicted = predict(X_model, Q_model, alpha[0])
+  results.append([approximation, train_time, perf_counter() - start, Y_predicted])
+
+print(f"{'method':>22} {'train [s]':>10} {'predict [s]':>12} {'MAE':>12} {'RMSE':>12} {'MAE vs exact':>13}", flush=True)
+for name, train_time, predict_time, Y_predicted in results:
+  mae = np.mean(np.abs(Y_predicted - Y_test))
+  rmse = np.sqrt(np.mean((Y_predicted - Y_test)**2))
+  vs_exact = f"{np.mean(np.abs(Y_predicted - Y_exact)):13.6f}" if Y_exact is not None else f"{'-':>13}"
+  print(f"{name:>22} {train_time:10.3f} {predict_time:12.3f} {mae:12.6f} {rmse:12.6f} {vs_exact}", flush=True)
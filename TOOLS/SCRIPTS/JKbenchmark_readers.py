@@ -0,0 +1,69 @@
+####################################################################################################
+# BENCHMARK OF THE ORCA/G16 READERS
+# Compares the old multi-pass readers (Qscan = 0) with the single-pass scanner (Qscan = 1) on real
+# output files and checks that both give identical results.
+# usage: python JKbenchmark_readers.py [-repeat <int>] file1.out file2.log ...
+#        (.log = Gaussian, .out = ORCA; JKQC/src has to be in PYTHONPATH)
+####################################################################################################
+from sys import argv
+from time import perf_counter
+from mmap import mmap, ACCESS_READ
+from os import path
+from read_orca import read_orca_init, read_orca
+from read_g16 import read_g16_init, read_g16
+
+repeat = 3
+files = []
+last = ""
+for i in argv[1:]:
+  if last == "-repeat":
+    repeat = int(i)
+    last = ""
+    continue
+  if i == "-repeat":
+    last = i
+    continue
+  if not path.exists(i):
+    print(f"The file '{i}' does not exist. [EXITING]", flush=True)
+    exit()
+  files.append(i)
+
+read_orca_init()
+read_g16_init()
+
+def read(file_i, Qscan):
+  with open(file_i, "rb") as f:
+    mm = mmap(f.fileno(), length = 0, access = ACCESS_READ)
+    if file_i.endswith(".log"):
+      return read_g16(mm, Qscan = Qscan)
+    else:
+      return read_orca(mm, "out", Qscan = Qscan)
+
+def same(a, b):
+  if isinstance(a, float) and isinstance(b, float) and a != a and b != b:
+    return True
+  if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+    return len(a) == len(b) and all(same(i, j) for i, j in zip(a, b))
+  try:
+    return bool(a == b)
+  except ValueError:
+    return len(a) == len(b) and all(same(i, j) for i, j in zip(a, b))
+
+total = [0.0, 0.0]
+for file_i in files:
+  times = []
+  results = []
+  for Qscan in [0, 1]:
+    best = float("inf")
+    for r in range(repeat):
+      start = perf_counter()
+      dic = read(file_i, Qscan)
+      best = min(best, perf_counter() - start)
+    times.append(best)
+    results.append(dic)
+    total[Qscan] += best
+  different = [key[1] for key in results[0] if not same(results[0][key], results[1].get(key))]
+  size = path.getsize(file_i)/1024**2
+  print(f"{file_i}: {size:.1f} MB  old {times[0]:.4f} s  scanner {times[1]:.4f} s  speedup {times[0]/max(times[1],1e-12):.1f}x  " + ("IDENTICAL" if len(different) == 0 else "DIFFERENT: "+" ".join(different)), flush=True)
+if len(files) > 1:
+  print(f"TOTAL: old {total[0]:.4f} s  scanner {total[1]:.4f} s  speedup {total[0]/max(total[1],1e-12):.1f}x", flush=True)
@@ -0,0 +1,100 @@
+####################################################################################################
+# CHECK OF JKQC -lowmem
+# Runs the same JKQC command with and without -lowmem, saves both outputs (-out) and checks that the
+# saved databases are identical: same rows in the same order and the same values in all columns,
+# also in the columns which were not planned (not needed by the run) and are completed when saving.
+# usage: python JKcheck_lowmem.py input1.jkqc [input2.jkqc ...] [JKQC arguments, e.g. -cut el < -5]
+#        (the arguments must not contain -out, -lowmem is added by this script)
+#        python JKcheck_lowmem.py input1.jkqc [input2.jkqc ...]
+#        (without JKQC arguments, a set of cases is checked, e.g. a relative cut followed by an
+#         absolute cut removing the lowest energy, or -sort rg -select)
+####################################################################################################
+from sys import argv, executable, path as syspath
+from os import path
+from subprocess import run
+from tempfile import mkdtemp
+from shutil import rmtree
+syspath.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "..", "JKQC", "src"))
+from pandas import read_pickle
+from plan_columns import plan_columns
+from arguments import arguments as parse_arguments
+
+JKQCpickle = path.join(path.dirname(path.abspath(__file__)), "..", "..", "JKQC", "JKQCpickle.py")
+arguments = argv[1:]
+if len(arguments) == 0:
+  print("No input given. [EXITING]", flush=True)
+  exit()
+if "-out" in arguments or "-lowmem" in arguments:
+  print("Do not use -out or -lowmem, the check adds them. [EXITING]", flush=True)
+  exit()
+
+def check(arguments):
+  """Compare the outputs of the run with and without -lowmem, returns 1 if they differ"""
+  folder = mkdtemp(prefix = "JKcheck_lowmem_")
+  outputs = {}
+  for mode, extra in [("normal", []), ("lowmem", ["-lowmem"])]:
+    outputs[mode] = path.join(folder, mode+".pkl")
+    result = run([executable, JKQCpickle] + arguments + extra + ["-out", outputs[mode], "-noex"], capture_output = True, text = True)
+    if result.returncode != 0 or not path.exists(outputs[mode]):
+      print(f"JKQC ({mode}) failed:\n"+result.stdout+result.stderr, flush=True)
+      rmtree(folder, ignore_errors = True)
+      return 1
+  normal = read_pickle(outputs["normal"])
+  lowmem = read_pickle(outputs["lowmem"])
+  rmtree(folder, ignore_errors = True)
+
+  #columns loaded during the run (the rest is completed from the inputs when saving)
+  A = parse_arguments(arguments + ["-out", outputs["normal"]])
+  planned = plan_columns(A["input_pkl"],A["files"],A["input_pkl_sp"],A["Qcomplement"],A["addcolumn"],A["Qmodify"],A["Qqha"],A["Qsort"],A["Quniq"],A["Qcut"],A["Qreacted"],A["Qarbalign"],A["QMWarbalign"],A["Qglob"],A["Qbavg"],A["Qaimnet_prep"],A["Qid"],A["Pout"],A["Qcolumn"])
+
+  print(f"rows: normal = {len(normal)}, lowmem = {len(lowmem)}", flush=True)
+  failed = 0
+  if len(normal) != len(lowmem):
+    failed = 1
+  if list(normal.columns) != list(lowmem.columns):
+    print("The columns differ: "+str([c for c in normal.columns if c not in lowmem.columns])+" / "+str([c for c in lowmem.columns if c not in normal.columns]), flush=True)
+    failed = 1
+  for column in normal.columns:
+    if column not in lowmem.columns or len(normal) != len(lowmem):
+      continue
+    kind = "planned" if planned is None or column in planned else "unplanned"
+    a = normal[column].reset_index(drop = True)
+    b = lowmem[column].reset_index(drop = True)
+    same = [(x is y) or (str(x) == str(y)) for x, y in zip(a.values, b.values)]
+    if not all(same):
+      print(f"{str(column):>50} ({kind}): {len(same)-sum(same)} rows differ", flush=True)
+      failed = 1
+  if failed:
+    print("CHECK FAILED: -lowmem changes the saved database.", flush=True)
+  else:
+    print(f"CHECK PASSED: {len(normal.columns)} columns identical ("+("all columns loaded" if planned is None else f"{len([c for c in normal.columns if c not in planned])} unplanned")+").", flush=True)
+  return failed
+
+inputs = [i for i in arguments if path.exists(i)]
+if len(inputs) < len(arguments):
+  exit(check(arguments))
+
+#DEFAULT CASES (built from the energies of the inputs)
+from load_pickles import load_pickles
+energies = load_pickles(inputs,0,0).loc[:,("log","electronic_energy")].dropna().sort_values().values
+if len(energies) < 2:
+  print("At least 2 structures with an electronic energy are needed. [EXITING]", flush=True)
+  exit()
+lowest = f"{(energies[0]+energies[1])/2:.10f}"
+median = f"{energies[len(energies)//2]:.10f}"
+cases = [
+  ["-cut","el",median],
+  ["-cutr","el","5"],
+  #the absolute cut after the relative one removes the global minimum
+  ["-cutr","el","5","-pass","el",lowest],
+  ["-uniq","rg,el"],
+  ["-sort","el","-select","2"],
+  ["-sort","rg","-select","2"],
+  ["-cut","el",median,"-sort","rg","-select","1"],
+]
+failed = 0
+for case in cases:
+  print("CASE: "+" ".join(case), flush=True)
+  failed = max(failed, check(inputs + case))
+print("ALL CASES PASSED" if failed == 0 else "SOME CASES FAILED", flush=True)
+exit(failed)
@@ -2,7 +2,6 @@ from ase.io import read
 from sys import argv
 from os import path
 from pandas import DataFrame, to_pickle, read_pickle
-from read_files import mergeDictionary
 import numpy as np
 
 def two_point_extrapolation(LOWEST_CARDINALNUMBER,lowPKL,highPKL,alpha,beta):
@@ -1,8 +1,8 @@
 from ase.io import read
 from sys import argv
 from os import path
-from pandas import DataFrame, to_pickle
-from read_files import mergeDictionary
+from pandas import to_pickle
+from row_builder import RowBuilder
 
 file = argv[1]
 if not path.exists(file):
@@ -19,7 +19,7 @@ components = float("nan")
 component_ratio = float("nan")
 all_locals = locals()
 
-clusters_dict = {}
+clusters_rows = RowBuilder()
 for i in range(len(strs)):
   file_basename = file_basename_0+"-"+str(i)
   dic = {("info",column):[all_locals.get(column)] for column in columns}
@@ -31,7 +31,7 @@ for i in range(len(strs)):
   except:
     dic.update({("log","electronic_energy"):[float("nan")]})
  
-  clusters_dict = mergeDictionary(clusters_dict,dic)
+  clusters_rows.append(dic)
 
-clusters_df = DataFrame(clusters_dict,index=range(0,len(strs)))
+clusters_df = clusters_rows.finalize(reverse = True)
 to_pickle(clusters_df,file_basename_0+".pkl")
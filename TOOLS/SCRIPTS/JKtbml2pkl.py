@@ -1,7 +1,7 @@
 #https://wiki.fysik.dtu.dk/ase/_modules/ase/io/turbomole.html
 from ase import Atoms
 from os import path
-from pandas import DataFrame
+from row_builder import RowBuilder
 import os
 import sys
 
@@ -10,20 +10,6 @@ def check_file_exists(file_path):
     print(f"The file '{file_path}' does not exist.")
     exit()
 
-def mergeDictionary(dict_1, dict_2):
-  if len(dict_1) == 0:
-    return dict_2
-  dict_3 = {**dict_1, **dict_2}
-  for key, value in dict_3.items():
-    if key in dict_1 and key in dict_2:
-      dict_3[key] = value + dict_1[key]
-    elif key in dict_1:
-      dict_3[key] = [float("nan")] + value
-    else:
-      ml = max([len(x) for x in dict_1.values()])
-      dict_3[key] = value + ml*[float("nan")]
-  return dict_3
-
 def find_next_occurrence(arr, target):
   result = []
   n = len(arr)
@@ -56,7 +42,7 @@ if __name__ == "__main__":
   folder_path = path.abspath(file_path)[::-1].split("/",1)[1][::-1]+"/"
   file_data_splitted = file_data.split("\n")
   ii = 0
-  clusters_dict = {}
+  clusters_rows = RowBuilder()
   next_end = find_next_occurrence(file_data_splitted,"$end")  
 
   i = 0
@@ -81,10 +67,10 @@ if __name__ == "__main__":
     dic.update({("log","electronic_energy"):[energy]})
     dic.update({("extra","forces"):[forces]})
    
-    clusters_dict = mergeDictionary(clusters_dict,dic)
+    clusters_rows.append(dic)
     i = i_end + 1
     
-  clusters_df = DataFrame(clusters_dict,index=range(ii))
+  clusters_df = clusters_rows.finalize(reverse = True)
   
   try:
     clusters_df.to_pickle("mydatabase.pkl")
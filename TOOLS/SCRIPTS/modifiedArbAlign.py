@@ -401,94 +401,126 @@ def sorted_xyz_from_molecule(molecule, noHydrogens=False):
     NA = len(sortedlabels)
     return sortedlabels, sortedcoords, NA, sortedorder
 
-def compare(in_a,in_b,simpleit=0,noHydrogens=0,mass_weighted=0,Qreturn_geometry=0):
-   try:
-      a_labels = in_a.get_chemical_symbols()
-      b_labels = in_b.get_chemical_symbols()
-      a_coords = in_a.get_positions()
-      b_coords = in_b.get_positions()
-      NA_a = len(a_labels)
-      NA_b = len(b_labels)
-   except:
-      from classes import Molecule
-      a_labels, a_coords, NA_a = read_xyz_from_molecule(in_a, noHydrogens)
-      b_labels, b_coords, NA_b = read_xyz_from_molecule(in_b, noHydrogens)
+SWAPS = [(0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0)]
+REFLECTS = [(1, 1, 1), (-1, 1, 1), (1, -1, 1), (1, 1, -1),
+            (-1, -1, 1), (-1, 1, -1), (1, -1, -1), (-1, -1, -1)]
 
-   b_init_labels = b_labels 
-   b_init_coords = b_coords
-   
-   #Calculate the initial unsorted all-atom RMSD as a baseline
-   A_all = np.array(a_coords)
-   B_all = np.array(b_coords)
-   if mass_weighted == 1:
-     a_nw, a_mw = get_weight(a_labels)
-     a_mw = np.array(a_mw)
-     a_nw = np.array(a_nw)
+def transform_all(coords):
+   """
+   coords - a set of coordinates (N x 3 array)
 
-   #If the two molecules are of the same size, get 
-   if NA_a == NA_b:
-      if mass_weighted == 1:
-        InitRMSD_unsorted = mw_kabsch(A_all,B_all,a_mw)
-      else:
-        InitRMSD_unsorted = kabsch(A_all,B_all)       
-   else:
-      return("Error: unequal number of atoms. " + str(NA_a) + " is not equal to " + str(NA_b))
- 
+   Returns all 48 swapped/reflected coordinate sets (48 x N x 3), in the order of transform_coords()
+   calls in compare (swaps outer, reflections inner)
+   """
+   swap = np.array([i for i in SWAPS for j in REFLECTS])
+   reflect = np.array([j for i in SWAPS for j in REFLECTS], dtype=float)
+   return coords[:, swap].transpose(1, 0, 2) * reflect[:, None, :]
 
+def cost_matrices(A, B):
    """
-   If the initial RMSD is zero (<0.001), then the structured are deemed identical already and 
-   we don't need to do any reordering, swapping, or reflections
+   A - a set of coordinates (n x 3)
+   B - stack of coordinate sets (k x n x 3)
+
+   Returns the LAP cost matrices |A[i] - B[k][j]| for all k at once (k x n x n)
    """
-   if InitRMSD_unsorted < 0.001:
-     if Qreturn_geometry:
-       from ase import Atoms
-       #ref = Atoms(a_labels, positions=a_coords)
-       geom = Atoms(b_labels, positions=b_coords)
-       return geom,float(InitRMSD_unsorted)
-     else:
-       return(float(InitRMSD_unsorted))
-   
+   return np.sqrt(np.sum((A[None, :, None, :] - B[:, None, :, :])**2, axis=-1))
+
+def kabsch_batch(A, B):
    """
-   Read in the original coordinates and labels of xyz1 and xyz2, 
-   and sort them by atom labels so that atoms of the same label/name are grouped together
+   A - set of coordinates (N x 3)
+   B - stack of coordinate sets (k x N x 3)
 
-   Then, count how many types of atoms, and determine their numerical frequency
+   Returns kabsch(A, B[k]) for all k (batched SVD). Sums over atoms are done sequentially
+   (cumsum) as in kabsch() and rmsd().
    """
-   try:
-      a_labels, a_coords, NA_a, order = sorted_xyz(in_a, noHydrogens)
-      b_labels, b_coords, NA_b, junk = sorted_xyz(in_b, noHydrogens)
-   except:
-      a_labels, a_coords, NA_a, order = sorted_xyz_from_molecule(in_a, noHydrogens)
-      b_labels, b_coords, NA_b, junk = sorted_xyz_from_molecule(in_b, noHydrogens)
+   N = len(A)
+   A = A - np.cumsum(A, axis=0)[-1] / N
+   B = B - np.cumsum(B, axis=1)[:, -1:, :] / N
+   C = np.matmul(A.T, B)
+   V, S, W = np.linalg.svd(C)
+   d = (np.linalg.det(V) * np.linalg.det(W)) < 0.0
+   V[d, :, -1] = -V[d, :, -1]
+   U = np.matmul(V, W)
+   A = np.matmul(A, U)
+   return np.sqrt(np.cumsum(np.sum((A - B)**2.0, axis=-1), axis=1)[:, -1] / N)
 
-   Uniq_a = list(set(a_labels))
-   list.sort(Uniq_a)
-   N_uniq_a = len(Uniq_a)
-   Atom_freq_a = dict(Counter(a_labels))
+def mw_kabsch_batch(A, B, w):
+   """
+   A - set of coordinates (N x 3)
+   B - stack of coordinate sets (k x N x 3)
+   w - weight vector (mass weights, should be normalized)
 
-   Uniq_b = list(set(b_labels))
-   list.sort(Uniq_b)
-   N_uniq_b = len(Uniq_b)
-   Atom_freq_b = dict(Counter(b_labels))
+   Returns mw_kabsch(A, B[k], w) for all k (batched SVD)
+   """
+   A = A - np.sum(A.T * w, axis=1)
+   B = B - np.sum(B.transpose(0, 2, 1) * w, axis=2)[:, None, :]
+   C = np.matmul(A.T * w, B)
+   V, S, W = np.linalg.svd(C)
+   d = (np.linalg.det(V) * np.linalg.det(W)) < 0.0
+   V[d, :, -1] = -V[d, :, -1]
+   U = np.matmul(V, W)
+   A = np.matmul(A, U)
+   return np.sqrt(np.sum(w * np.sum((A - B)**2, axis=2), axis=1))
 
+def align_all_trials(a_labels, a_coords, b_labels, b_coords, Uniq, mass_weighted=0):
    """
-   If the number and type of atoms in the two structures are not equal, exit with 
-   an error message
+   a_labels, a_coords - sorted labels and coordinates of the reference (see sorted_xyz)
+   b_labels, b_coords - sorted labels and coordinates of the compared structure
+   Uniq - sorted list of unique atom labels
+
+   Vectorized swap/reflection + Kuhn-Munkres search of compare(): the 48 transformed coordinate sets
+   are stacked, the cost matrices of every atom type are built for all of them by broadcasting and
+   the RMSDs of all candidate assignments are evaluated with one batched Kabsch. Gives the same
+   candidates (in the same order) as align_all_trials_loop().
+
+   Returns the lowest RMSD and the corresponding coordinates of b
    """
-   if (NA_a == NA_b) & (Uniq_a == Uniq_b) & (Atom_freq_a == Atom_freq_b) :
-      num_atoms = NA_a
-      num_uniq = N_uniq_a
-      Uniq = Uniq_a  
-      Atom_freq = Atom_freq_a
-      Sorted_Atom_freq = sorted(Atom_freq.items(), key=operator.itemgetter(1), reverse=True)
-      """
-      Atom = sorted(Uniq, key=operator.itemgetter(0), reverse=True)
-      print Atom
-      print num_uniq
-      """
+   a_labels = np.array(a_labels)
+   b_labels = np.array(b_labels)
+   a_coords = np.array(a_coords, dtype=float)
+   b_coords = np.array(b_coords, dtype=float)
+   a_indices = [np.flatnonzero(a_labels == atom) for atom in Uniq]
+   b_indices = [np.flatnonzero(b_labels == atom) for atom in Uniq]
+   B_t = transform_all(b_coords)
+   trials = np.arange(len(B_t))[:, None]
+
+   # first atom type: assignment of the centered coordinates
+   A = a_coords[a_indices[0]]
+   A = A - np.cumsum(A, axis=0)[-1] / len(A)
+   B = b_coords[b_indices[0]]
+   B = B - np.cumsum(B, axis=0)[-1] / len(B)
+   perm = np.array([lapjv.lapjv(cost)[0] for cost in cost_matrices(A, transform_all(B))])
+
+   # order[k] = atoms of B_t[k] in the current assignment
+   order = np.tile(np.arange(len(b_coords)), (len(B_t), 1))
+   order[:, b_indices[0]] = b_indices[0][perm]
+   if len(Uniq) == 1:
+      candidates = B_t[trials, order]
    else:
-      return("Unequal number or type of atoms. Exiting ... ")
+      # each atom type is then reassigned in the (uncentered) transformed coordinates
+      candidates = np.empty((len(B_t), len(Uniq)) + b_coords.shape)
+      for l in range(len(Uniq)):
+         costs = cost_matrices(a_coords[a_indices[l]], B_t[trials, order[:, b_indices[l]]])
+         perm = np.array([lapjv.lapjv(cost)[0] for cost in costs])
+         order[:, b_indices[l]] = order[trials, b_indices[l][perm]]
+         candidates[:, l] = B_t[trials, order]
+      candidates = candidates.reshape((-1,) + b_coords.shape)
 
+   if mass_weighted == 1:
+      a_nw, a_mw = get_weight(a_labels)
+      rmsds = mw_kabsch_batch(a_coords, candidates, np.array(a_mw))
+   else:
+      rmsds = kabsch_batch(a_coords, candidates)
+   best = np.argmin(rmsds)
+   return float(rmsds[best]), candidates[best]
+
+def align_all_trials_loop(a_labels, a_coords, b_labels, b_coords, Uniq, num_uniq, mass_weighted=0):
+   """
+   Original (loop) implementation of the swap/reflection + Kuhn-Munkres search of compare(),
+   kept as a reference for align_all_trials() (compare(..., Qvectorized=0))
+
+   Returns the lowest RMSD and the corresponding coordinates of b
+   """
    A_all = np.array(a_coords)
    A_all = A_all - sum(A_all) / len(A_all)
    B_all = np.array(b_coords)
@@ -597,7 +629,100 @@ def compare(in_a,in_b,simpleit=0,noHydrogens=0,mass_weighted=0,Qreturn_geometry=
             else:
               rmsds.append([kabsch(a_coords, b_final), B_t[i][1], B_t[i][2], b_final])
             rmsds = sorted(rmsds, key = lambda x: x[0])
-   FinalRMSD = float(rmsds[0][0])
+   return float(rmsds[0][0]), rmsds[0][3]
+
+def compare(in_a,in_b,simpleit=0,noHydrogens=0,mass_weighted=0,Qreturn_geometry=0,Qvectorized=1):
+   try:
+      a_labels = in_a.get_chemical_symbols()
+      b_labels = in_b.get_chemical_symbols()
+      a_coords = in_a.get_positions()
+      b_coords = in_b.get_positions()
+      NA_a = len(a_labels)
+      NA_b = len(b_labels)
+   except:
+      from classes import Molecule
+      a_labels, a_coords, NA_a = read_xyz_from_molecule(in_a, noHydrogens)
+      b_labels, b_coords, NA_b = read_xyz_from_molecule(in_b, noHydrogens)
+
+   b_init_labels = b_labels 
+   b_init_coords = b_coords
+   
+   #Calculate the initial unsorted all-atom RMSD as a baseline
+   A_all = np.array(a_coords)
+   B_all = np.array(b_coords)
+   if mass_weighted == 1:
+     a_nw, a_mw = get_weight(a_labels)
+     a_mw = np.array(a_mw)
+     a_nw = np.array(a_nw)
+
+   #If the two molecules are of the same size, get 
+   if NA_a == NA_b:
+      if mass_weighted == 1:
+        InitRMSD_unsorted = mw_kabsch(A_all,B_all,a_mw)
+      else:
+        InitRMSD_unsorted = kabsch(A_all,B_all)       
+   else:
+      return("Error: unequal number of atoms. " + str(NA_a) + " is not equal to " + str(NA_b))
+ 
+
+   """
+   If the initial RMSD is zero (<0.001), then the structured are deemed identical already and 
+   we don't need to do any reordering, swapping, or reflections
+   """
+   if InitRMSD_unsorted < 0.001:
+     if Qreturn_geometry:
+       from ase import Atoms
+       #ref = Atoms(a_labels, positions=a_coords)
+       geom = Atoms(b_labels, positions=b_coords)
+       return geom,float(InitRMSD_unsorted)
+     else:
+       return(float(InitRMSD_unsorted))
+   
+   """
+   Read in the original coordinates and labels of xyz1 and xyz2, 
+   and sort them by atom labels so that atoms of the same label/name are grouped together
+
+   Then, count how many types of atoms, and determine their numerical frequency
+   """
+   try:
+      a_labels, a_coords, NA_a, order = sorted_xyz(in_a, noHydrogens)
+      b_labels, b_coords, NA_b, junk = sorted_xyz(in_b, noHydrogens)
+   except:
+      a_labels, a_coords, NA_a, order = sorted_xyz_from_molecule(in_a, noHydrogens)
+      b_labels, b_coords, NA_b, junk = sorted_xyz_from_molecule(in_b, noHydrogens)
+
+   Uniq_a = list(set(a_labels))
+   list.sort(Uniq_a)
+   N_uniq_a = len(Uniq_a)
+   Atom_freq_a = dict(Counter(a_labels))
+
+   Uniq_b = list(set(b_labels))
+   list.sort(Uniq_b)
+   N_uniq_b = len(Uniq_b)
+   Atom_freq_b = dict(Counter(b_labels))
+
+   """
+   If the number and type of atoms in the two structures are not equal, exit with 
+   an error message
+   """
+   if (NA_a == NA_b) & (Uniq_a == Uniq_b) & (Atom_freq_a == Atom_freq_b) :
+      num_atoms = NA_a
+      num_uniq = N_uniq_a
+      Uniq = Uniq_a  
+      Atom_freq = Atom_freq_a
+      Sorted_Atom_freq = sorted(Atom_freq.items(), key=operator.itemgetter(1), reverse=True)
+      """
+      Atom = sorted(Uniq, key=operator.itemgetter(0), reverse=True)
+      print Atom
+      print num_uniq
+      """
+   else:
+      return("Unequal number or type of atoms. Exiting ... ")
+
+   if Qvectorized == 1:
+      FinalRMSD, best_coords = align_all_trials(a_labels, a_coords, b_labels, b_coords, Uniq, mass_weighted)
+   else:
+      FinalRMSD, best_coords = align_all_trials_loop(a_labels, a_coords, b_labels, b_coords, Uniq, num_uniq, mass_weighted)
    #print("###############")
    #print(rmsds[0])
 
@@ -606,9 +731,9 @@ def compare(in_a,in_b,simpleit=0,noHydrogens=0,mass_weighted=0,Qreturn_geometry=
      #ref = Atoms(a_labels, positions=a_coords)
      if FinalRMSD < float(InitRMSD_unsorted):
       #print("HERE 1")
-      #print(float(kabsch(a_coords, rmsds[0][3])))
+      #print(float(kabsch(a_coords, best_coords)))
       #print("HERE")
-      geom = Atoms(a_labels, positions=rmsds[0][3])
+      geom = Atoms(a_labels, positions=best_coords)
       return geom, FinalRMSD 
      else:
       geom = Atoms(a_labels, positions=b_coords)
@@ -616,6 +741,6 @@ def compare(in_a,in_b,simpleit=0,noHydrogens=0,mass_weighted=0,Qreturn_geometry=
    else:
      #print("HERE 2")
      if FinalRMSD < float(InitRMSD_unsorted): 
-      return(float(rmsds[0][0]))
+      return(FinalRMSD)
      else:
       return(float(InitRMSD_unsorted))